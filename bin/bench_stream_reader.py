@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Microbenchmark for the stream reader framing
+
+Replays a captured byte stream through the old byte-at-a-time reader loop and
+through meshtastic.framing.FrameParser fed in read sized chunks.
+
+    python bin/bench_stream_reader.py [--capture FILE] [--repeat N] [--chunk BYTES]
+
+Without --capture we replay FromRadio frames captured from a Heltec 2.1 during
+config download, interleaved with device log lines.
+"""
+import argparse
+import time
+
+from meshtastic.framing import (
+    HEADER_LEN,
+    MAX_TO_FROM_RADIO_SIZE,
+    READ_CHUNK_SIZE,
+    START1,
+    START2,
+    FrameParser,
+    frameBytes,
+)
+
+# pylint: disable=C0301
+CAPTURED_FRAMES = [
+    b'\x1a,\x08\xdc\x8c\xd5\xc5\x02\x18\r2\x0e1.2.49.5354c49P\x15]\xe1%\x17Eh\xe0\xa7\x12p\xe8\x9d\x01x\x08\x90\x01\x01',
+    b'"9\x08\xdc\x8c\xd5\xc5\x02\x12(\n\t!28b5465c\x12\x0cUnknown 465c\x1a\x03?5C"\x06$o(\xb5F\\0\n\x1a\x02 1%M<\xc6a',
+    b'"C\x08\xa4\x8c\xd5\xc5\x02\x12(\n\t!28b54624\x12\x0cUnknown 4624\x1a\x03?24"\x06$o(\xb5F$0\n\x1a\x07 5MH<\xc6a%G<\xc6a=\x00\x00\xc0@',
+    b'@\xcf\xe5\xd1\x8c\x0e',
+    b'Z6\r\\F\xb5(\x15\\F\xb5("\x1c\x08\x06\x12\x13*\x11\n\x0f0\x84\x07P\xac\x02\x88\x01\x01\xb0\t#\xb8\t\x015]$\xddk5\xd5\x7f!b=M<\xc6aP\x03`F',
+    b'Z.\r\\F\xb5(\x15\\F\xb5("\x14\x08\x06\x12\x0b:\t\x12\x05\x18\x01"\x01\x01\x18\x015^$\xddk5\xd6\x7f!b=M<\xc6aP\x03`F',
+    b'ZS\r\\F\xb5(\x15\\F\xb5("9\x08\x06\x120:.\x08\x01\x12(" \xb4&\xb3\xc7\x06\xd8\xe39%\xba\xa5\xee\x8eH\x06\xf6\xf4H\xe8\xd5\xc1[ao\xb5Y\\\xb4"\xafmi*\x04gpio\x18\x025_$\xddk5\xd7\x7f!b=M<\xc6aP\x03`F',
+    b'Z)\r\\F\xb5(\x15\\F\xb5("\x0f\x08\x06\x12\x06:\x04\x08\x02\x12\x005`$\xddk5\xd8\x7f!b=M<\xc6aP\x03`F',
+]
+CAPTURED_LOG = b"DEBUG | 12:00:00 42 [Router] Received routing from=0x28b5465c, id=0x1234\r\n"
+
+
+def legacyReader(stream, handle):
+    """The reader loop as it was before FrameParser, one byte per read"""
+    rxBuf = bytes()
+    empty = bytes()
+    for i in range(len(stream)):
+        b = stream[i : i + 1]
+        c = b[0]
+        ptr = len(rxBuf)
+        rxBuf = rxBuf + b
+        if ptr == 0:
+            if c != START1:
+                rxBuf = empty
+        elif ptr == 1:
+            if c != START2:
+                rxBuf = empty
+        elif ptr >= HEADER_LEN - 1:
+            packetlen = (rxBuf[2] << 8) + rxBuf[3]
+            if ptr == HEADER_LEN - 1 and packetlen > MAX_TO_FROM_RADIO_SIZE:
+                rxBuf = empty
+            if len(rxBuf) != 0 and ptr + 1 >= packetlen + HEADER_LEN:
+                handle(rxBuf[HEADER_LEN:])
+                rxBuf = empty
+
+
+def chunkedReader(stream, handle, chunk):
+    """FrameParser fed the way StreamInterface reads, in chunks"""
+    parser = FrameParser(onDebugBytes=lambda b: None)
+    for i in range(0, len(stream), chunk):
+        for frame in parser.feed(stream[i : i + chunk]):
+            handle(frame)
+
+
+def bench(name, reader, stream):
+    """Time one reader and report throughput"""
+    frames = [0]
+
+    def handle(_frame):
+        frames[0] += 1
+
+    start = time.perf_counter()
+    reader(stream, handle)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>10}: {frames[0]} frames in {elapsed * 1000:.1f} ms, "
+        f"{len(stream) / elapsed / 1e6:.2f} MB/s, {elapsed / max(frames[0], 1) * 1e6:.2f} us/frame"
+    )
+    return frames[0]
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--capture", help="a file containing a raw byte stream captured from a device")
+    parser.add_argument("--repeat", type=int, default=2000, help="how many times to replay the capture")
+    parser.add_argument("--chunk", type=int, default=READ_CHUNK_SIZE, help="read size for the chunked reader")
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            capture = f.read()
+    else:
+        capture = b"".join(CAPTURED_LOG + frameBytes(f) for f in CAPTURED_FRAMES)
+    stream = capture * args.repeat
+    print(f"Replaying {len(capture)} byte capture {args.repeat} times ({len(stream)} bytes)")
+
+    legacy = bench("legacy", legacyReader, stream)
+    chunked = bench("chunked", lambda s, h: chunkedReader(s, h, args.chunk), stream)
+    assert legacy == chunked, "readers disagree on the number of frames"
+
+
+if __name__ == "__main__":
+    main()
@@ -26,7 +26,16 @@ type of packet, you should subscribe to the full topic name.  If you want to see
 - meshtastic.receive.position(packet)
 - meshtastic.receive.user(packet)
 - meshtastic.receive.data.portnum(packet) (where portnum is an integer or well known PortNum enum)
+- meshtastic.receive.duplicate(packet) - packets an interface's DuplicateFilter suppressed, if it is asked to publish them
 - meshtastic.node.updated(node = NodeInfo) - published when a node in the DB changes (appears, location changed, username changed, etc...)
+- meshtastic.node.progress(received, expected) - for interfaces in progressive mode, how many nodes of the node DB
+download we have, and how many we expect (a guess, from the nodeStore or the finished download, or None)
+- meshtastic.node.bulk_loaded(nodes) - published once the initial node DB download is complete (just before
+meshtastic.connection.established), nodes is the list of all NodeInfos we received
+- meshtastic.config.updated(section, config, module) - published when the device sends us a config section, section is its
+name (i.e. "lora"), config the updated protobuf in localNode.localConfig (or localNode.moduleConfig if module is True)
+- meshtastic.channels.updated(channels) - published when an interface that started with channels from its ConfigCache
+downloaded different ones, channels is localNode.channels
 
 We receive position, user, or data packets from the mesh.  You probably only care about meshtastic.receive.data.  The first argument for
 that publish will be the packet.  Text or binary data packets (from sendData or sendText) will both arrive this way.  If you print packet
@@ -34,6 +43,25 @@ you'll see the fields in the dictionary.  decoded.data.payload will contain the
 sendText, decoded.data.text will **also** be populated with the decoded string.  For ASCII these two strings will be the same, but for
 unicode scripts they can be different.
 
+Interfaces created with rawPackets=True skip building the packet dictionary.  On the same topics they publish a
+RawPacket instead: the received mesh_pb2.MeshPacket along with fromId, toId, portnum and the decoded payload protobuf
+(for well known protocols, otherwise None).  This is for clients that work with protobufs anyway.
+
+Clients that rebuild their state for every node.updated can set interface.nodeUpdatesDuringConfig = False and use
+meshtastic.node.bulk_loaded for the initial node DB instead.  Setting interface.nodeUpdateDebounce to a number of
+seconds makes later node.updated messages for the same node be published at most that often, with the latest info.
+
+Instead of subscribing, clients can also pull packets from an iterator: interface.packets(topics, filter, maxsize)
+(or interface.asyncPackets() in a coroutine), see meshtastic.packet_iterator.  Iterators get the same packets
+subscribers would, straight from the reader thread.
+
+Clients that only want the packets of some nodes, ports or channels can interface.subscribe(callback, fromNum=...,
+toNum=..., portnum=..., channel=..., wantAck=...), see meshtastic.dispatcher.  Subscriptions are found by index
+lookups, so many per-node subscriptions cost no more per packet than one.
+
+Packets are only decoded and published if someone is subscribed to their topic (or a parent topic), otherwise we
+just update the node DB from them.
+
 # Example Usage
 ```
 import meshtastic
@@ -92,6 +120,7 @@ from meshtastic import (
     telemetry_pb2,
     util,
 )
+from meshtastic.message_dict import LazyMessageDict, decodedAsDict
 from meshtastic.node import Node
 from meshtastic.util import DeferredExecution, Timeout, catchAndIgnore, fixme, stripnl
 
@@ -121,7 +150,9 @@ class ResponseHandler(NamedTuple):
 
     # requestId: int - used only as a key
     callback: Callable
-    # FIXME, add timestamp and age out old requests
+    created: float = 0.0  # time.monotonic() when the request was sent
+    expires: Optional[float] = None  # time.monotonic() when we give up on the response, None for never
+    onExpire: Optional[Callable] = None  # called with the requestId when we gave up, None to drop it silently
 
 
 class KnownProtocol(NamedTuple):
@@ -133,6 +164,116 @@ class KnownProtocol(NamedTuple):
     protobufFactory: Optional[Callable] = None
     # If set, invoked as onReceive(interface, packet)
     onReceive: Optional[Callable] = None
+    # If set, invoked as onReceiveRaw(interface, packet: RawPacket) by interfaces in rawPackets mode
+    onReceiveRaw: Optional[Callable] = None
+    # If set, called as decoder(payload: bytes) to parse the payload, instead of protobufFactory
+    decoder: Optional[Callable] = None
+    # If True, only parse the payload if someone is subscribed to our topic (or a parent of it)
+    decodeOnlyIfSubscribed: bool = False
+    # If True, packet dictionaries parse the payload the first time packet["decoded"][name] is read
+    lazyDecode: bool = False
+    # The topic we publish on, filled in by ProtocolRegistry
+    topic: str = ""
+
+    def decode(self, payload: bytes) -> Any:
+        """Parse a payload for this protocol, None if we don't know how to"""
+        if self.decoder is not None:
+            return self.decoder(payload)
+        if self.protobufFactory is not None:
+            pb = self.protobufFactory()
+            pb.ParseFromString(payload)
+            return pb
+        return None
+
+
+class ProtocolRegistry(Dict[int, KnownProtocol]):
+    """The known protocols, a dict from portnum to KnownProtocol
+
+    Applications can add decoders for their own ports (or replace ours) at
+    runtime, i.e. for the ATAK plugin:
+
+        meshtastic.protocols.register(portnums_pb2.PortNum.ATAK_PLUGIN, "atak", atak_pb2.TAKPacket)
+
+    after which those packets are published on meshtastic.receive.atak with
+    the decoded payload in packet["decoded"]["atak"].
+    """
+
+    _dataTopics: Dict[int, str] = {}
+
+    def __init__(self, known: Optional[Dict[int, KnownProtocol]]=None):
+        super().__init__()
+        if known:
+            self.update(known)
+
+    def __setitem__(self, portnum: int, protocol: KnownProtocol) -> None:
+        super().__setitem__(portnum, protocol._replace(topic=f"meshtastic.receive.{protocol.name}"))
+
+    def update(self, *args, **kwargs) -> None:  # pylint: disable=W0221
+        for portnum, protocol in dict(*args, **kwargs).items():
+            self[portnum] = protocol
+
+    def setdefault(self, portnum: int, protocol: KnownProtocol) -> KnownProtocol:  # type: ignore[override]
+        if portnum not in self:
+            self[portnum] = protocol
+        return self[portnum]
+
+    def register(self, portnum: int, name: str, protobufFactory: Optional[Callable]=None, **kwargs) -> KnownProtocol:
+        """Decode packets for portnum and publish them as meshtastic.receive.<name>
+
+        Keyword arguments are the other KnownProtocol fields (onReceive, decoder,
+        decodeOnlyIfSubscribed, lazyDecode, ...).  Replaces any existing protocol
+        for portnum, returns the registered protocol.
+        """
+        self[portnum] = KnownProtocol(name, protobufFactory, **kwargs)
+        return self[portnum]
+
+    def unregister(self, portnum: int) -> Optional[KnownProtocol]:
+        """Stop decoding packets for portnum, they are published as meshtastic.receive.data.<portnum> again"""
+        return self.pop(portnum, None)
+
+    @classmethod
+    def dataTopic(cls, portnum: int) -> str:
+        """The topic for packets with a portnum we have no protocol for"""
+        topic = cls._dataTopics.get(portnum)
+        if topic is None:
+            try:
+                topic = f"meshtastic.receive.data.{portnums_pb2.PortNum.Name(portnums_pb2.PortNum.ValueType(portnum))}"
+            except ValueError:
+                topic = f"meshtastic.receive.data.{portnum}"
+            cls._dataTopics[portnum] = topic
+        return topic
+
+
+class RawPacket(NamedTuple):
+    """What interfaces created with rawPackets=True publish instead of a packet dictionary"""
+
+    packet: mesh_pb2.MeshPacket
+    """The MeshPacket as received from the radio"""
+    fromId: Optional[str]
+    """The node ID of the sender, or None if we don't know it"""
+    toId: Optional[str]
+    """The node ID of the destination, or None if we don't know it"""
+    portnum: int
+    """packet.decoded.portnum, 0 (UNKNOWN_APP) for packets we couldn't decrypt"""
+    decoded: Optional[Any] = None
+    """The parsed payload protobuf for well known protocols (i.e. a mesh_pb2.Position), otherwise None"""
+
+    def toDict(self) -> Dict[str, Any]:
+        """The packet dictionary an interface without rawPackets would have published"""
+        packetDict = LazyMessageDict(self.packet)
+        packetDict["raw"] = self.packet
+        packetDict.setdefault("from", 0)
+        packetDict.setdefault("to", 0)
+        packetDict["fromId"] = self.fromId
+        packetDict["toId"] = self.toId
+        if "decoded" in packetDict:
+            decoded = packetDict["decoded"]
+            decoded["payload"] = self.packet.decoded.payload
+            decoded.setdefault("portnum", portnums_pb2.PortNum.Name(portnums_pb2.PortNum.UNKNOWN_APP))
+            handler = protocols.get(self.portnum)
+            if handler is not None and self.decoded is not None:
+                decoded[handler.name] = decodedAsDict(self.decoded)
+        return packetDict
 
 
 def _onTextReceive(iface, asDict):
@@ -143,7 +284,8 @@ def _onTextReceive(iface, asDict):
     #
     # Usually btw this problem is caused by apps sending binary data but setting the payload type to
     # text.
-    logging.debug(f"in _onTextReceive() asDict:{asDict}")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"in _onTextReceive() asDict:{asDict}")
     try:
         asBytes = asDict["decoded"]["payload"]
         asDict["decoded"]["text"] = asBytes.decode("utf-8")
@@ -154,57 +296,99 @@ def _onTextReceive(iface, asDict):
 
 def _onPositionReceive(iface, asDict):
     """Special auto parsing for received messages"""
-    logging.debug(f"in _onPositionReceive() asDict:{asDict}")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"in _onPositionReceive() asDict:{asDict}")
     if "decoded" in asDict:
         if "position" in asDict["decoded"] and "from" in asDict:
             p = asDict["decoded"]["position"]
-            logging.debug(f"p:{p}")
             p = iface._fixupPosition(p)
-            logging.debug(f"after fixup p:{p}")
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(f"after fixup p:{p}")
             # update node DB as needed
-            iface._getOrCreateByNum(asDict["from"])["position"] = p
+            n = iface._getOrCreateByNum(asDict["from"])
+            n.record.setPosition(p)
+            iface._nodeChanged(n.record)
 
 
 def _onNodeInfoReceive(iface, asDict):
     """Special auto parsing for received messages"""
-    logging.debug(f"in _onNodeInfoReceive() asDict:{asDict}")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"in _onNodeInfoReceive() asDict:{asDict}")
     if "decoded" in asDict:
         if "user" in asDict["decoded"] and "from" in asDict:
             p = asDict["decoded"]["user"]
             # decode user protobufs and update nodedb, provide decoded version as "position" in the published msg
             # update node DB as needed
             n = iface._getOrCreateByNum(asDict["from"])
-            n["user"] = p
+            n.record.setUser(p)
             # We now have a node ID, make sure it is up-to-date in that table
             iface.nodes[p["id"]] = n
+            iface._nodeChanged(n.record)
             _receiveInfoUpdate(iface, asDict)
 
 
 def _receiveInfoUpdate(iface, asDict):
     if "from" in asDict:
-        iface._getOrCreateByNum(asDict["from"])["lastReceived"] = asDict
-        iface._getOrCreateByNum(asDict["from"])["lastHeard"] = asDict.get("rxTime")
-        iface._getOrCreateByNum(asDict["from"])["snr"] = asDict.get("rxSnr")
-        iface._getOrCreateByNum(asDict["from"])["hopLimit"] = asDict.get("hopLimit")
+        n = iface._getOrCreateByNum(asDict["from"])
+        # The node DB only keeps the packet's protobuf, see MeshInterface.lastReceived()
+        n.record.heard(asDict.get("raw"), asDict.get("rxTime"), asDict.get("rxSnr"), asDict.get("hopLimit"))
+        iface._nodeChanged(n.record)
+
+
+def _onTextReceiveRaw(iface, packet: RawPacket):
+    """_onTextReceive for rawPackets mode, the text is left in packet.decoded.payload"""
+    _receiveInfoUpdateRaw(iface, packet)
+
+
+def _onPositionReceiveRaw(iface, packet: RawPacket):
+    """_onPositionReceive for rawPackets mode"""
+    fromNum = getattr(packet.packet, "from")
+    if packet.decoded is not None and fromNum:
+        n = iface._getOrCreateByNum(fromNum)
+        n.record.setPosition(packet.decoded)
+        iface._nodeChanged(n.record)
+
+
+def _onNodeInfoReceiveRaw(iface, packet: RawPacket):
+    """_onNodeInfoReceive for rawPackets mode"""
+    fromNum = getattr(packet.packet, "from")
+    if packet.decoded is not None and fromNum:
+        n = iface._getOrCreateByNum(fromNum)
+        n.record.setUser(packet.decoded)
+        # We now have a node ID, make sure it is up-to-date in that table
+        iface.nodes[packet.decoded.id] = n
+        iface._nodeChanged(n.record)
+        _receiveInfoUpdateRaw(iface, packet)
+
+
+def _receiveInfoUpdateRaw(iface, packet: RawPacket):
+    """_receiveInfoUpdate from protobuf fields"""
+    meshPacket = packet.packet
+    fromNum = getattr(meshPacket, "from")
+    if fromNum:
+        n = iface._getOrCreateByNum(fromNum)
+        # like MessageToDict we use None for fields that are not set
+        n.record.heard(meshPacket, meshPacket.rx_time or None, meshPacket.rx_snr or None, meshPacket.hop_limit or None)
+        iface._nodeChanged(n.record)
 
 
 """Well known message payloads can register decoders for automatic protobuf parsing"""
-protocols = {
+protocols = ProtocolRegistry({
     portnums_pb2.PortNum.TEXT_MESSAGE_APP: KnownProtocol(
-        "text", onReceive=_onTextReceive
+        "text", onReceive=_onTextReceive, onReceiveRaw=_onTextReceiveRaw
     ),
     portnums_pb2.PortNum.RANGE_TEST_APP: KnownProtocol(
-        "rangetest", onReceive=_onTextReceive
+        "rangetest", onReceive=_onTextReceive, onReceiveRaw=_onTextReceiveRaw
     ),
     portnums_pb2.PortNum.DETECTION_SENSOR_APP: KnownProtocol(
-        "detectionsensor", onReceive=_onTextReceive
+        "detectionsensor", onReceive=_onTextReceive, onReceiveRaw=_onTextReceiveRaw
     ),
 
     portnums_pb2.PortNum.POSITION_APP: KnownProtocol(
-        "position", mesh_pb2.Position, _onPositionReceive
+        "position", mesh_pb2.Position, _onPositionReceive, _onPositionReceiveRaw
     ),
     portnums_pb2.PortNum.NODEINFO_APP: KnownProtocol(
-        "user", mesh_pb2.User, _onNodeInfoReceive
+        "user", mesh_pb2.User, _onNodeInfoReceive, _onNodeInfoReceiveRaw
     ),
     portnums_pb2.PortNum.ADMIN_APP: KnownProtocol("admin", admin_pb2.AdminMessage),
     portnums_pb2.PortNum.ROUTING_APP: KnownProtocol("routing", mesh_pb2.Routing),
@@ -223,4 +407,4 @@ protocols = {
     portnums_pb2.PortNum.STORE_FORWARD_APP: KnownProtocol("storeforward", storeforward_pb2.StoreAndForward),
     portnums_pb2.PortNum.NEIGHBORINFO_APP: KnownProtocol("neighborinfo", mesh_pb2.NeighborInfo),
     portnums_pb2.PortNum.MAP_REPORT_APP: KnownProtocol("mapreport", mqtt_pb2.MapReport),
-}
+})
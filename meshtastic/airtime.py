@@ -0,0 +1,140 @@
+"""How long packets occupy the channel
+
+Estimates the time on air of LoRa frames with the formula from Semtech's
+AN1200.13 ("LoRa Modem Designer's Guide"), for the modem settings of a
+node's LoRaConfig: its modem preset, or the custom bandwidth, spreading
+factor and coding rate if use_preset is off.
+
+    lora = iface.localNode.localConfig.lora
+    airtime(len(data), lora)              # seconds a sendData() of data takes
+    airtimes(range(0, 234, 16), lora)     # the same for many sizes at once
+
+airtime() counts the bytes the firmware adds to a payload: the radio
+header of every packet and the Data protobuf wrapping the payload.
+frameAirtime() is the bare formula, for a LoRa frame of a given size.
+"""
+import math
+from typing import Dict, Iterable, List, NamedTuple, Tuple, Union
+
+from meshtastic import config_pb2, mesh_pb2
+
+LoRaConfig = config_pb2.Config.LoRaConfig
+ModemPreset = LoRaConfig.ModemPreset
+
+HEADER_SIZE = 16
+"""Bytes of the radio header the firmware puts in front of every packet (to, from, id, flags, channel...)"""
+
+PREAMBLE_LENGTH = 16
+"""Preamble symbols the firmware sends"""
+
+# preset -> (bandwidth in kHz, spreading factor, coding rate denominator), as the firmware sets them up
+PRESETS: Dict[int, Tuple[float, int, int]] = {
+    ModemPreset.SHORT_FAST: (250.0, 7, 5),
+    ModemPreset.SHORT_SLOW: (250.0, 8, 5),
+    ModemPreset.MEDIUM_FAST: (250.0, 9, 5),
+    ModemPreset.MEDIUM_SLOW: (250.0, 10, 5),
+    ModemPreset.LONG_FAST: (250.0, 11, 5),
+    ModemPreset.LONG_MODERATE: (125.0, 11, 8),
+    ModemPreset.LONG_SLOW: (125.0, 12, 8),
+    ModemPreset.VERY_LONG_SLOW: (62.5, 12, 8),
+}
+
+# the 2.4 GHz radios use wider channels for the same presets
+_WIDE_BANDWIDTHS = {250.0: 812.5, 125.0: 406.25, 62.5: 203.125}
+
+# custom bandwidths are given in whole kHz, these are what the radio uses for them
+_BANDWIDTHS = {31: 31.25, 62: 62.5, 200: 203.125, 400: 406.25, 800: 812.5, 1600: 1625.0}
+
+
+class LoRaParams(NamedTuple):
+    """The modem settings that decide the time on air"""
+
+    bandwidth: float  # kHz
+    spreadFactor: int
+    codingRate: int  # the denominator of 4/5 ... 4/8
+    preambleLength: int = PREAMBLE_LENGTH
+
+    @classmethod
+    def fromConfig(cls, lora: LoRaConfig) -> "LoRaParams":
+        """The settings a node with this LoRaConfig transmits with
+
+        Raises a ValueError for custom settings (use_preset off) that are
+        unset or out of range, a radio can't transmit with those."""
+        if lora.use_preset:
+            bandwidth, spreadFactor, codingRate = PRESETS[lora.modem_preset]
+            if lora.region == LoRaConfig.RegionCode.LORA_24:
+                bandwidth = _WIDE_BANDWIDTHS[bandwidth]
+            return cls(bandwidth, spreadFactor, codingRate)
+        bandwidth = _BANDWIDTHS.get(lora.bandwidth, float(lora.bandwidth))
+        if bandwidth <= 0:
+            raise ValueError(f"Invalid LoRa bandwidth {lora.bandwidth} kHz, custom modem settings need one")
+        if not 7 <= lora.spread_factor <= 12:
+            raise ValueError(f"Invalid LoRa spreading factor {lora.spread_factor}, it must be 7 to 12")
+        if not 5 <= lora.coding_rate <= 8:
+            raise ValueError(f"Invalid LoRa coding rate 4/{lora.coding_rate}, the denominator must be 5 to 8")
+        return cls(bandwidth, lora.spread_factor, lora.coding_rate)
+
+    @property
+    def symbolTime(self) -> float:
+        """Seconds per symbol"""
+        return (1 << self.spreadFactor) / (self.bandwidth * 1000.0)
+
+    @property
+    def lowDataRateOptimize(self) -> bool:
+        """The radio turns this on for symbols longer than 16 ms"""
+        return self.symbolTime > 0.016
+
+
+def _params(lora: Union[LoRaConfig, LoRaParams]) -> LoRaParams:
+    return lora if isinstance(lora, LoRaParams) else LoRaParams.fromConfig(lora)
+
+
+def _varintSize(value: int) -> int:
+    size = 1
+    while value > 0x7F:
+        value >>= 7
+        size += 1
+    return size
+
+
+def packetSize(payloadSize: int) -> int:
+    """The size of the LoRa frame the firmware sends for a sendData() of payloadSize bytes
+
+    This is the radio header, and the payload wrapped in a Data protobuf with
+    a port number below 128 (the usual ones).  Flags like want_response add
+    a few bytes more, use packetAirtime() for an exact figure."""
+    return HEADER_SIZE + 2 + 1 + _varintSize(payloadSize) + payloadSize
+
+
+def frameAirtime(frameSize: int, lora: Union[LoRaConfig, LoRaParams]) -> float:
+    """Seconds on air of a LoRa frame of frameSize bytes (explicit header, with CRC)"""
+    return airtimes([frameSize], lora, overhead=False)[0]
+
+
+def airtime(payloadSize: int, lora: Union[LoRaConfig, LoRaParams]) -> float:
+    """Seconds on air of a packet with payloadSize bytes of data, see packetSize()"""
+    return airtimes([payloadSize], lora)[0]
+
+
+def packetAirtime(meshPacket: mesh_pb2.MeshPacket, lora: Union[LoRaConfig, LoRaParams]) -> float:
+    """Seconds on air of a MeshPacket we send"""
+    return frameAirtime(HEADER_SIZE + meshPacket.decoded.ByteSize(), lora)
+
+
+def airtimes(sizes: Iterable[int], lora: Union[LoRaConfig, LoRaParams], overhead: bool=True) -> List[float]:
+    """airtime() of many payload sizes, frameAirtime() of many frame sizes if not overhead
+
+    Everything that depends on the modem settings is worked out once."""
+    params = _params(lora)
+    symbolTime = params.symbolTime
+    preambleTime = (params.preambleLength + 4.25) * symbolTime
+    sf = params.spreadFactor
+    bitsPerSymbolBlock = 4 * (sf - (2 if params.lowDataRateOptimize else 0))
+    codingSymbols = params.codingRate  # a block of 4 symbols takes 4 / (4 / codingRate) symbols
+    fixedBits = 28 + 16 - 4 * sf  # + CRC, explicit header
+    result = []
+    for size in sizes:
+        frameSize = packetSize(size) if overhead else size
+        blocks = max(math.ceil((8 * frameSize + fixedBits) / bitsPerSymbolBlock), 0)
+        result.append(preambleTime + (8 + blocks * codingSymbols) * symbolTime)
+    return result
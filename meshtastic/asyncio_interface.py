@@ -0,0 +1,512 @@
+"""asyncio interfaces for meshtastic devices
+
+These share the protocol handling (node DB, config download, packet decoding)
+with MeshInterface, but run entirely on the event loop: no reader thread, no
+heartbeat timer thread and no pypubsub/publishing thread hop.  Received
+packets are delivered straight to packets() iterators.
+
+    async with AsyncTCPInterface("meshtastic.local") as iface:
+        await iface.sendTextAsync("hello mesh")
+        async for packet in iface.packets():
+            print(packet["decoded"].get("text"))
+
+The methods inherited from MeshInterface (sendText(), localNode.reboot()...)
+can be called from the event loop once the config download is done: they
+write right away, without waiting for room in the device's TX queue or for
+the write to drain.  Before that, where they would block until we are
+connected they raise MeshInterfaceError instead, as blocking would stall
+the very event loop the download runs on.  Their ...Async() counterparts
+wait for all of that.
+"""
+import asyncio
+import logging
+import platform
+import time
+import traceback
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import serial # type: ignore[import-untyped]
+
+import meshtastic.util
+from meshtastic import BROADCAST_ADDR, mesh_pb2, portnums_pb2
+from meshtastic.config_cache import ConfigCache
+from meshtastic.dedup import DuplicateFilter
+from meshtastic.framing import READ_CHUNK_SIZE, START2, FrameParser, frameBytes
+from meshtastic.mesh_interface import MeshInterface
+from meshtastic.nodedb import NodeStore
+from meshtastic.packet_iterator import AsyncPacketIterator
+from meshtastic.util import stripnl
+
+if platform.system() != "Windows":
+    import termios
+
+
+class _PendingTimer:
+    """A timer started before connect(), it goes on the event loop once we have one"""
+
+    def __init__(self, interval: float, callback: Callable) -> None:
+        self.deadline = time.monotonic() + interval
+        self.callback = callback
+        self.handle: Optional[asyncio.TimerHandle] = None
+        self.cancelled = False
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Put the timer on loop, called by connect()"""
+        if not self.cancelled:
+            self.handle = loop.call_later(max(0.0, self.deadline - time.monotonic()), self.callback)
+
+    def cancel(self) -> None:
+        """Stop the timer, whether it is on the loop yet or not"""
+        self.cancelled = True
+        if self.handle is not None:
+            self.handle.cancel()
+
+
+class AsyncStreamInterface(MeshInterface):
+    """Base class for asyncio interfaces over a stream link (serial, TCP, etc)
+
+    Subclasses provide _openConnection(), returning an asyncio.StreamReader
+    and a writer with write(), drain() and close().
+    """
+
+    def __init__(self, debugOut=None, noProto: bool=False, writeDelay: float=0.0, rawPackets: bool=False,
+                 duplicateFilter: Optional[DuplicateFilter]=None, nodeStore: Optional[NodeStore]=None,
+                 configCache: Optional[ConfigCache]=None, progressive: bool=False):
+        """Constructor, call (or await) connect() to actually talk to the device
+
+        Keyword Arguments:
+            debugOut {stream} -- If a stream is provided, any debug serial output from the
+                                 device will be emitted to that stream. (default: {None})
+            writeDelay -- How long our async send methods wait for the device to answer a
+                          write with a QueueStatus before sending the next one. (default: {0.0})
+            rawPackets -- Publish packets as RawPacket protobufs, see MeshInterface. (default: {False})
+            duplicateFilter -- Don't publish packets it has seen recently. (default: {None})
+            nodeStore -- Load/save what we learn about nodes there, see MeshInterface. (default: {None})
+            configCache -- Start with the device config cached there, see MeshInterface. (default: {None})
+            progressive -- Be connected before the node DB is complete, see MeshInterface. (default: {False})
+        """
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Any = None
+        self._readerTask: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._configured: Optional[asyncio.Event] = None
+        self._txReady: Optional[asyncio.Event] = None
+        self._pendingTimers: List[_PendingTimer] = []  # see _startTimer()
+        self._framer = FrameParser(onDebugBytes=self._handleDebugBytes)
+        self.writeDelay = writeDelay
+        MeshInterface.__init__(
+            self, debugOut=debugOut, noProto=noProto, rawPackets=rawPackets, duplicateFilter=duplicateFilter,
+            nodeStore=nodeStore, configCache=configCache, progressive=progressive,
+        )
+
+    async def __aenter__(self):
+        await self.connect()
+        if not self.noProto:
+            await self.waitForConfigAsync()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        if exc_type is not None and exc_value is not None:
+            logging.error(
+                f"An exception of type {exc_type} with value {exc_value} has occurred"
+            )
+        await self.closeAsync()
+
+    async def _openConnection(self) -> Tuple[asyncio.StreamReader, Any]:
+        """Open our link to the device"""
+        raise NotImplementedError("AsyncStreamInterface is abstract, use AsyncTCPInterface or AsyncSerialInterface")
+
+    async def connect(self) -> None:
+        """Open the link, start reading and request the device config"""
+        self._loop = asyncio.get_running_loop()
+        for timer in self._pendingTimers:
+            timer.start(self._loop)
+        self._pendingTimers = []
+        self._configured = asyncio.Event()
+        self._txReady = asyncio.Event()
+        self._txReady.set()
+        self._reader, self._writer = await self._openConnection()
+
+        # Wake a sleeping device and resync its framing, see StreamInterface.connect()
+        self._writer.write(bytes([START2] * 32))
+        await self._writer.drain()
+        await asyncio.sleep(0.1)
+
+        self._readerTask = self._loop.create_task(self._readLoop())
+        self._startConfig()
+
+    async def waitForConfigAsync(self, timeout: float=30.0) -> None:
+        """Wait until the device config and node DB have been downloaded"""
+        if self._configured is None:
+            raise MeshInterface.MeshInterfaceError("Not connected, call connect() first")
+        try:
+            await asyncio.wait_for(self._configured.wait(), timeout)
+        except asyncio.TimeoutError as ex:
+            raise MeshInterface.MeshInterfaceError("Timed out waiting for interface config") from ex
+        if self.failure:
+            raise self.failure
+
+    async def sendDataAsync(
+        self,
+        data,
+        destinationId: Union[int, str]=BROADCAST_ADDR,
+        portNum: portnums_pb2.PortNum.ValueType=portnums_pb2.PortNum.PRIVATE_APP,
+        wantAck: bool=False,
+        wantResponse: bool=False,
+        onResponse=None,
+        channelIndex: int=0,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+        onResponseTimeout=None,
+    ) -> mesh_pb2.MeshPacket:
+        """Send a data packet to some other node, see MeshInterface.sendData()
+
+        Unlike sendData() this waits for the config download, for room in the
+        device's TX queue and for the write to drain."""
+        if not self.noProto and not self.isConnected.is_set():
+            await self.waitForConfigAsync()
+        await self._waitForTxSpace()
+        p = self.sendData(
+            data,
+            destinationId,
+            portNum=portNum,
+            wantAck=wantAck,
+            wantResponse=wantResponse,
+            onResponse=onResponse,
+            channelIndex=channelIndex,
+            priority=priority,
+            onResponseTimeout=onResponseTimeout,
+        )
+        if self._writer is not None:
+            await self._writer.drain()
+        return p
+
+    async def sendTextAsync(
+        self,
+        text: str,
+        destinationId: Union[int, str]=BROADCAST_ADDR,
+        wantAck: bool=False,
+        wantResponse: bool=False,
+        onResponse=None,
+        channelIndex: int=0,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+        onResponseTimeout=None,
+    ) -> mesh_pb2.MeshPacket:
+        """Send a utf8 string to some other node, see sendDataAsync()"""
+        return await self.sendDataAsync(
+            text.encode("utf-8"),
+            destinationId,
+            portNum=portnums_pb2.PortNum.TEXT_MESSAGE_APP,
+            wantAck=wantAck,
+            wantResponse=wantResponse,
+            onResponse=onResponse,
+            channelIndex=channelIndex,
+            priority=priority,
+            onResponseTimeout=onResponseTimeout,
+        )
+
+    async def sendRequestAsync(
+        self,
+        data,
+        destinationId: Union[int, str],
+        portNum: portnums_pb2.PortNum.ValueType=portnums_pb2.PortNum.PRIVATE_APP,
+        wantAck: bool=False,
+        wantResponse: bool=True,
+        channelIndex: int=0,
+        timeout: Optional[float]=None,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+    ):
+        """Send a request and return its answer, see MeshInterface.sendRequest()
+
+        Cancelling the awaiting task forgets the request.  The ResponseFutures
+        of requestPosition(), requestTelemetry() and requestTraceRoute() can be
+        awaited too."""
+        if not self.noProto and not self.isConnected.is_set():
+            await self.waitForConfigAsync()
+        await self._waitForTxSpace()
+        future = self.sendRequest(
+            data,
+            destinationId,
+            portNum=portNum,
+            wantAck=wantAck,
+            wantResponse=wantResponse,
+            channelIndex=channelIndex,
+            timeout=timeout,
+            priority=priority,
+        )
+        try:
+            if self._writer is not None:
+                await self._writer.drain()
+            return await future
+        finally:
+            future.cancel()  # nothing to cancel once it is answered
+
+    def packets(  # type: ignore[override]
+        self,
+        topics: Optional[List[str]]=None,
+        filter: Optional[Callable[[Any], bool]]=None,  # pylint: disable=W0622
+        maxsize: int=1000,
+    ) -> AsyncPacketIterator:
+        """Return an async iterator over received packets, see MeshInterface.asyncPackets()
+
+        Packets are buffered from the moment this is called, the iterator ends
+        when the connection is lost.  When a slow consumer falls maxsize packets
+        behind, the oldest packets are dropped."""
+        return self.asyncPackets(topics, filter, maxsize)
+
+    def close(self, flushTimeout: float=10.0) -> None:
+        """Shutdown this interface, without waiting for our last writes to drain (see closeAsync())"""
+        MeshInterface.close(self, flushTimeout)
+        if self._readerTask is not None and self._readerTask is not self._currentTask():
+            self._readerTask.cancel()
+        self._closeWriter()
+
+    async def closeAsync(self) -> None:
+        """Shutdown this interface, and wait for the link to be closed"""
+        MeshInterface.close(self)
+        if self._writer is not None:
+            try:
+                await self._writer.drain()
+            except (ConnectionError, OSError):
+                pass
+        writer = self._writer
+        if self._readerTask is not None and self._readerTask is not asyncio.current_task():
+            self._readerTask.cancel()
+            try:
+                await self._readerTask
+            except asyncio.CancelledError:
+                pass
+        self._closeWriter()
+        if writer is not None and hasattr(writer, "wait_closed"):
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    def _onDeliveringThread(self) -> bool:
+        """Are we on our event loop (on any event loop before connect())"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # called from outside the event loop
+            return False
+        return self._loop is None or loop is self._loop
+
+    def _currentTask(self) -> Optional[asyncio.Task]:
+        try:
+            return asyncio.current_task()
+        except RuntimeError:  # called from outside the event loop
+            return None
+
+    def _closeWriter(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _waitForTxSpace(self) -> None:
+        """Wait for the device to have room in its TX queue, and for it to answer our last write"""
+        txReady = self._txReady
+        if txReady is None:
+            return
+        if self.writeDelay > 0:
+            try:
+                await asyncio.wait_for(txReady.wait(), self.writeDelay)
+            except asyncio.TimeoutError:
+                pass
+        while not self._queueHasFreeSpace():
+            logging.debug("Waiting for free space in TX Queue")
+            txReady.clear()
+            await txReady.wait()
+
+    async def _readLoop(self) -> None:
+        """Read from the device and handle each frame, this replaces the reader thread"""
+        logging.debug("in _readLoop()")
+        reader = self._reader
+        if reader is None:
+            return
+        try:
+            while True:
+                b = await reader.read(READ_CHUNK_SIZE)
+                if not b:
+                    break
+                for frame in self._framer.feed(b):
+                    try:
+                        self._handleFromRadio(frame)
+                    except Exception as ex:
+                        logging.error(f"Error while handling message from radio {ex}")
+                        traceback.print_exc()
+        except (ConnectionError, OSError, serial.SerialException) as ex:
+            logging.warning(f"Meshtastic connection lost, disconnecting... {ex}")
+        finally:
+            logging.debug("reader is exiting")
+            self._disconnected()
+            self._closeWriter()
+
+    def _handleDebugBytes(self, b: bytes) -> None:
+        if self.debugOut is not None:
+            self.debugOut.write(b.decode("utf-8", errors="replace"))
+
+    def _sendToRadio(self, toRadio: mesh_pb2.ToRadio) -> None:
+        """Send a ToRadio protobuf to the device
+
+        Never blocks, our async send methods wait for TX queue space before getting here."""
+        if self.noProto:
+            logging.warning("Not sending packet because protocol use is disabled by noProto")
+            return
+        if toRadio.HasField("packet"):
+            self._queueClaim()
+        self._sendToRadioImpl(toRadio)
+
+    def _sendToRadioImpl(self, toRadio: mesh_pb2.ToRadio) -> None:
+        logging.debug(f"Sending: {stripnl(toRadio)}")
+        if self._writer is None:
+            logging.warning("Not sending, we are not connected")
+            return
+        self._writer.write(frameBytes(toRadio.SerializeToString()))
+        if self._txReady is not None and self.writeDelay > 0:
+            self._txReady.clear()
+
+    def _handleQueueStatusFromRadio(self, queueStatus) -> None:
+        MeshInterface._handleQueueStatusFromRadio(self, queueStatus)
+        if self._txReady is not None:
+            self._txReady.set()
+
+    def _startTimer(self, interval: float, callback, daemon: bool=False):  # pylint: disable=W0613
+        """Our timers run on the event loop, those started before connect() wait for it"""
+        if self._loop is None:
+            timer = _PendingTimer(interval, callback)
+            self._pendingTimers.append(timer)
+            return timer
+        return self._loop.call_later(interval, callback)
+
+    def _waitConnected(self, timeout=30.0):
+        """On the event loop we can't block until we're connected, the connection is made there"""
+        if not self.noProto and not self.isConnected.is_set() and self._onDeliveringThread():
+            raise MeshInterface.MeshInterfaceError(
+                "Not connected yet, use the ...Async() methods (i.e. sendTextAsync()) to wait for the connection"
+            )
+        MeshInterface._waitConnected(self, timeout)
+
+    def _hasListeners(self, topic: str) -> bool:  # pylint: disable=W0613
+        """We don't publish through pypubsub, packets() iterators are our only listeners"""
+        return False
+
+    def _publish(self, topic: str, nodeNum: Optional[int]=None, **kwargs) -> None:  # pylint: disable=W0613
+        """Track our connection state, without going through pypubsub"""
+        if self._configured is None:
+            return
+        if topic == "meshtastic.connection.established":
+            self._configured.set()
+        elif topic == "meshtastic.connection.lost":
+            self._configured.clear()
+
+    def _waitForNodeDb(self, timeout: float=30.0) -> bool:  # pylint: disable=W0613
+        """We can't block the event loop waiting for the rest of the node DB"""
+        return False
+
+    def _queuePublish(self, topic: str, nodeNum: Optional[int], runnable: Callable) -> None:  # pylint: disable=W0613
+        """Subscriptions are called right away, we are already on the event loop"""
+        runnable()
+
+
+class AsyncTCPInterface(AsyncStreamInterface):
+    """asyncio interface for meshtastic devices over a TCP link"""
+
+    def __init__(self, hostname: str, debugOut=None, noProto: bool=False, portNumber: int=4403,
+                 rawPackets: bool=False, duplicateFilter: Optional[DuplicateFilter]=None,
+                 nodeStore: Optional[NodeStore]=None, configCache: Optional[ConfigCache]=None,
+                 progressive: bool=False):
+        """Constructor
+
+        Keyword Arguments:
+            hostname {string} -- Hostname/IP address of the device to connect to
+        """
+        self.hostname = hostname
+        self.portNumber = portNumber
+        AsyncStreamInterface.__init__(
+            self, debugOut=debugOut, noProto=noProto, rawPackets=rawPackets, duplicateFilter=duplicateFilter,
+            nodeStore=nodeStore, configCache=configCache, progressive=progressive,
+        )
+
+    async def _openConnection(self):
+        logging.debug(f"Connecting to {self.hostname}")
+        return await asyncio.open_connection(self.hostname, self.portNumber)
+
+
+class _SerialWriter:
+    """The subset of asyncio.StreamWriter we need, for a non blocking serial port"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, stream):
+        self.loop = loop
+        self.stream = stream
+
+    def write(self, b: bytes) -> None:
+        """Write to the port, serial writes are small so we don't bother buffering"""
+        self.stream.write(b)
+
+    async def drain(self) -> None:
+        """Nothing to drain, writes go straight to the port"""
+
+    def close(self) -> None:
+        """Stop reading and close the port"""
+        if self.stream is not None:
+            self.loop.remove_reader(self.stream.fileno())
+            self.stream.close()
+            self.stream = None
+
+
+class AsyncSerialInterface(AsyncStreamInterface):
+    """asyncio interface for meshtastic devices over a serial link (POSIX only)"""
+
+    def __init__(self, devPath: Optional[str]=None, debugOut=None, noProto: bool=False, writeDelay: float=0.1,
+                 rawPackets: bool=False, duplicateFilter: Optional[DuplicateFilter]=None,
+                 nodeStore: Optional[NodeStore]=None, configCache: Optional[ConfigCache]=None,
+                 progressive: bool=False):
+        """Constructor
+
+        Keyword Arguments:
+            devPath {string} -- A filepath to a device, i.e. /dev/ttyUSB0, if not
+                                specified we probe for a single meshtastic device (default: {None})
+            writeDelay -- How long to wait for a QueueStatus after each write, see
+                          AsyncStreamInterface (default: {0.1})
+        """
+        if platform.system() == "Windows":
+            raise MeshInterface.MeshInterfaceError("AsyncSerialInterface needs a POSIX system")
+        self.devPath = devPath
+        AsyncStreamInterface.__init__(
+            self, debugOut=debugOut, noProto=noProto, writeDelay=writeDelay, rawPackets=rawPackets,
+            duplicateFilter=duplicateFilter, nodeStore=nodeStore, configCache=configCache, progressive=progressive,
+        )
+
+    async def _openConnection(self):
+        if self.devPath is None:
+            ports = meshtastic.util.findPorts(True)
+            if len(ports) != 1:
+                raise MeshInterface.MeshInterfaceError(
+                    f"Expected exactly one serial meshtastic device, found: {ports}"
+                )
+            self.devPath = ports[0]
+        logging.debug(f"Connecting to {self.devPath}")
+
+        # clear HUPCL so the device will not reboot based on RTS and/or DTR, see SerialInterface
+        if platform.system() != "Windows":
+            with open(self.devPath, encoding="utf8") as f:
+                attrs = termios.tcgetattr(f)
+                attrs[2] = attrs[2] & ~termios.HUPCL
+                termios.tcsetattr(f, termios.TCSAFLUSH, attrs)
+            await asyncio.sleep(0.1)
+
+        stream = serial.Serial(self.devPath, 115200, exclusive=True, timeout=0)
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+
+        def onReadable():
+            try:
+                b = stream.read(stream.in_waiting or 1)
+            except (serial.SerialException, OSError) as ex:
+                loop.remove_reader(stream.fileno())
+                reader.set_exception(ex)
+                return
+            if b:
+                reader.feed_data(b)
+
+        loop.add_reader(stream.fileno(), onReadable)
+        return reader, _SerialWriter(loop, stream)
@@ -4,13 +4,16 @@ import logging
 import time
 import struct
 import asyncio
-from threading import Thread, Event
+from threading import Thread, Event, current_thread
 from typing import Optional
 
 from bleak import BleakScanner, BleakClient
 
+from meshtastic.config_cache import ConfigCache
+from meshtastic.dedup import DuplicateFilter
+from meshtastic.nodedb import NodeStore
 from meshtastic.mesh_interface import MeshInterface
-from meshtastic.util import our_exit
+from meshtastic.util import DeferredExecution, our_exit
 
 SERVICE_UUID = "6ba1b218-15a8-461f-9fa8-5dcae273eafd"
 TORADIO_UUID = "f75c76d2-129e-4dad-a1dd-7866124401e7"
@@ -32,7 +35,10 @@ class BLEInterface(MeshInterface):
         MESH = False
 
 
-    def __init__(self, address: Optional[str], noProto: bool = False, debugOut = None):
+    def __init__(self, address: Optional[str], noProto: bool = False, debugOut = None, rawPackets: bool = False,
+                 duplicateFilter: Optional[DuplicateFilter] = None, publisher: Optional[DeferredExecution] = None,
+                 nodeStore: Optional[NodeStore] = None, configCache: Optional[ConfigCache] = None,
+                 progressive: bool = False):
         self.state = BLEInterface.BLEState()
 
         if not address:
@@ -60,7 +66,10 @@ class BLEInterface(MeshInterface):
             return
 
         logging.debug("Mesh init starting")
-        MeshInterface.__init__(self, debugOut = debugOut, noProto = noProto)
+        MeshInterface.__init__(
+            self, debugOut = debugOut, noProto = noProto, rawPackets = rawPackets, duplicateFilter = duplicateFilter,
+            publisher = publisher, nodeStore = nodeStore, configCache = configCache, progressive = progressive,
+        )
         self._startConfig()
         if not self.noProto:
             self._waitConnected(timeout = 60.0)
@@ -158,9 +167,12 @@ class BLEInterface(MeshInterface):
             self.should_read = True
 
 
-    def close(self):
+    def _onDeliveringThread(self) -> bool:
+        return current_thread() is getattr(self, "_receiveThread", None)
+
+    def close(self, flushTimeout: float=10.0):
         if self.state.MESH:
-            MeshInterface.close(self)
+            MeshInterface.close(self, flushTimeout)
 
         if self.state.THREADS:
             self._receiveThread_started.clear()
@@ -0,0 +1,119 @@
+"""A cache of device config, so reconnecting interfaces are usable right away
+
+Every connection downloads the device's whole config and node DB before
+waitConnected() returns, which takes a while over serial.  Give an interface
+a ConfigCache and once the device told us who it is (myInfo and metadata) it
+takes the config, module config and channels from the last download for
+that device and firmware version, and is connected right away.  The live
+download carries on in the background: config sections that turn out to be
+different are published as usual on meshtastic.config.updated, different
+channels on meshtastic.channels.updated, and the cache is refreshed when the
+download is complete.
+
+    cache = ConfigCache("~/.meshtastic/config.db")
+    iface = SerialInterface(configCache=cache)
+"""
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+from meshtastic import channel_pb2, localonly_pb2, mesh_pb2
+
+
+def _serializeChannels(channels: List[channel_pb2.Channel]) -> bytes:
+    """Channels as one blob, each one prefixed with its length"""
+    blobs = [channel.SerializeToString() for channel in channels]
+    return b"".join(struct.pack(">I", len(blob)) + blob for blob in blobs)
+
+
+def _parseChannels(blob: bytes) -> List[channel_pb2.Channel]:
+    channels = []
+    offset = 0
+    while offset < len(blob):
+        (length,) = struct.unpack_from(">I", blob, offset)
+        offset += 4
+        channels.append(channel_pb2.Channel.FromString(blob[offset:offset + length]))
+        offset += length
+    return channels
+
+
+class CachedConfig(NamedTuple):
+    """What a ConfigCache keeps about a device"""
+
+    localConfig: localonly_pb2.LocalConfig
+    moduleConfig: localonly_pb2.LocalModuleConfig
+    channels: List[channel_pb2.Channel]
+    metadata: mesh_pb2.DeviceMetadata
+
+
+class ConfigCache:
+    """Device configs in an SQLite file, by node number and firmware version"""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS configs ("
+                "nodeNum INTEGER NOT NULL, firmwareVersion TEXT NOT NULL, updated REAL NOT NULL, "
+                "localConfig BLOB NOT NULL, moduleConfig BLOB NOT NULL, channels BLOB NOT NULL, metadata BLOB NOT NULL, "
+                "PRIMARY KEY (nodeNum, firmwareVersion))"
+            )
+
+    def load(self, nodeNum: int, firmwareVersion: str) -> Optional[CachedConfig]:
+        """The config we last saw for this device and firmware, if any"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT localConfig, moduleConfig, channels, metadata FROM configs "
+                "WHERE nodeNum = ? AND firmwareVersion = ?",
+                (nodeNum, firmwareVersion),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            cached = CachedConfig(
+                localonly_pb2.LocalConfig.FromString(row[0]),
+                localonly_pb2.LocalModuleConfig.FromString(row[1]),
+                _parseChannels(row[2]),
+                mesh_pb2.DeviceMetadata.FromString(row[3]),
+            )
+        except Exception as ex:
+            logging.warning(f"Ignoring cached config of {nodeNum:08x} we can't read: {ex}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached
+
+    def save(self, nodeNum: int, firmwareVersion: str, config: CachedConfig) -> None:
+        """Remember a device's config, replacing what we had for it"""
+        row = (
+            nodeNum,
+            firmwareVersion,
+            time.time(),
+            config.localConfig.SerializeToString(),
+            config.moduleConfig.SerializeToString(),
+            _serializeChannels(config.channels),
+            config.metadata.SerializeToString(),
+        )
+        with self._lock:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO configs VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def forget(self, nodeNum: int) -> None:
+        """Remove the configs cached for a device"""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM configs WHERE nodeNum = ?", (nodeNum,))
+
+    def close(self) -> None:
+        """Close the file"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,88 @@
+"""Storing the config the device sends us
+
+During the config download the device sends each section of its config and
+module config in a FromRadio of its own.  storeConfigSection() puts it in the
+matching field of a Node's localConfig/moduleConfig, found by name in a table
+built from the protobuf descriptors, so sections added to the protobufs need
+no code here.  A section we have no place for is logged and skipped.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from meshtastic import config_pb2, localonly_pb2, module_config_pb2
+
+
+def _buildConfigSections() -> Dict[str, Dict[str, str]]:
+    """Build the dispatch table for config sections from the protobuf descriptors
+
+    Maps each FromRadio config field to {section name: Node attribute keeping
+    that section}, the sections being the oneof members of Config/ModuleConfig
+    that LocalConfig/LocalModuleConfig have a place for.
+    """
+    table: Dict[str, Dict[str, str]] = {}
+    for fromRadioField, nodeAttribute, configType, localType in (
+        ("config", "localConfig", config_pb2.Config.DESCRIPTOR, localonly_pb2.LocalConfig),
+        ("moduleConfig", "moduleConfig", module_config_pb2.ModuleConfig.DESCRIPTOR, localonly_pb2.LocalModuleConfig),
+    ):
+        table[fromRadioField] = {
+            field.name: nodeAttribute
+            for field in configType.oneofs_by_name["payload_variant"].fields
+            if field.name in localType.DESCRIPTOR.fields_by_name
+        }
+    return table
+
+
+CONFIG_SECTIONS = _buildConfigSections()
+"""FromRadio field -> {config section -> Node attribute}, see storeConfigSection()"""
+
+ALL_CONFIG_SECTIONS = frozenset((kind, section) for kind, sections in CONFIG_SECTIONS.items() for section in sections)
+"""The (FromRadio field, section) of every config section we know"""
+
+
+class ConfigDownload:
+    """What we got so far while the device sends us its config and node DB, see MeshInterface._startConfig()"""
+
+    def __init__(self, nodes: Optional[List[Dict]]=None) -> None:
+        """Constructor
+
+        Keyword Arguments:
+            nodes -- The nodes we got so far, [] while we download the node DB (default: {None})
+        """
+        self.nodes: Optional[List[Dict]] = nodes
+        self.expectedNodes: Optional[int] = None  # our best guess of how many nodes are coming
+        self.sections: Set[Tuple[str, str]] = set()  # the (FromRadio field, section) config sections we got
+        self.fromCache: bool = False  # are we using cached config until the download completes
+        self.cachedChannels: Optional[List] = None  # the channels we took from the cache
+
+    def haveConfig(self, nodeInfo: bool=False) -> bool:
+        """Is the device config in, the node DB is all that can still be missing
+
+        That is once we got every config section we know, or some of them and
+        then a node info (the device moved on to the node DB)."""
+        return bool(self.sections) and (nodeInfo or self.sections >= ALL_CONFIG_SECTIONS)
+
+
+def storeConfigSection(node, fromRadio, onlyChanged: bool=False) -> Optional[Tuple[str, Any]]:
+    """Store the config or moduleConfig section of a FromRadio in a Node
+
+    Arguments:
+        node {meshtastic.node.Node} -- the node keeping the config, usually localNode
+        fromRadio {FromRadio} -- a FromRadio whose payload is one of CONFIG_SECTIONS
+
+    Keyword Arguments:
+        onlyChanged -- leave a section alone if the node has it with the same content already (default: {False})
+
+    Returns (section name, the section protobuf of the node) if we stored it, None if not
+    """
+    kind = fromRadio.WhichOneof("payload_variant")
+    config = getattr(fromRadio, kind)
+    section = config.WhichOneof("payload_variant")
+    nodeAttribute = CONFIG_SECTIONS[kind].get(section)
+    if nodeAttribute is None:
+        logging.warning(f"Ignoring {kind} section we don't know how to store: {section}")
+        return None
+    target = getattr(getattr(node, nodeAttribute), section)
+    if onlyChanged and target == getattr(config, section):
+        return None
+    target.CopyFrom(getattr(config, section))
+    return section, target
@@ -0,0 +1,71 @@
+"""Duplicate packet suppression
+
+A gateway hears the same packet several times, from rebroadcasting nodes or
+through several of its own radios.  Give interfaces a DuplicateFilter (share
+one between the interfaces of a gateway) and they only publish the first copy:
+
+    dedup = DuplicateFilter()
+    radios = [SerialInterface(port, duplicateFilter=dedup) for port in ports]
+
+Duplicates are not dropped altogether: each interface still updates its node
+DB and answers its own requests from them.
+"""
+import collections
+import threading
+import time
+from typing import Tuple
+
+
+class DuplicateFilter:
+    """Remembers recently seen packets by (from, id), in bounded memory
+
+    A packet is a duplicate if we saw the same (from, id) less than window
+    seconds ago.  We keep at most maxEntries packets, forgetting the oldest.
+    If publishDuplicates is True interfaces publish duplicates on
+    meshtastic.receive.duplicate (note that subscribers of meshtastic.receive
+    will then see them too), otherwise they are only counted.
+    """
+
+    def __init__(self, maxEntries: int=4096, window: float=300.0, publishDuplicates: bool=False):
+        self.maxEntries = maxEntries
+        self.window = window
+        self.publishDuplicates = publishDuplicates
+        self.received = 0
+        """How many packets we were asked about"""
+        self.duplicates = 0
+        """How many of those were duplicates"""
+        self._seen: "collections.OrderedDict[Tuple[int, int], float]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def isDuplicate(self, fromNum: int, packetId: int) -> bool:
+        """Record a received packet, returns True if we've seen it recently"""
+        now = time.monotonic()
+        key = (fromNum, packetId)
+        with self._lock:
+            self.received += 1
+            if packetId == 0:
+                return False  # not a packet id, nothing we can tell
+            seenAt = self._seen.get(key)
+            if seenAt is not None and now - seenAt < self.window:
+                self.duplicates += 1
+                return True
+            # entries are in the order we saw them, so the expired ones are at the front
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            expired = now - self.window
+            while self._seen:
+                oldestKey, oldest = next(iter(self._seen.items()))
+                if oldest > expired and len(self._seen) <= self.maxEntries:
+                    break
+                del self._seen[oldestKey]
+            return False
+
+    def clear(self) -> None:
+        """Forget all packets and reset the counters"""
+        with self._lock:
+            self._seen.clear()
+            self.received = 0
+            self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
@@ -0,0 +1,146 @@
+"""Route received packets to subscribers by what is in them
+
+pypubsub topics only tell packets apart by their kind.  Subscribers that only
+care about some nodes, a channel or a port can instead declare that when they
+subscribe, and the interface hands them just those packets:
+
+    def onReceive(packet, interface):
+        ...
+
+    for nodeNum in fleet:
+        iface.subscribe(onReceive, fromNum=nodeNum)
+
+Subscriptions are indexed by the most selective field they filter on, so
+finding the subscribers of a packet costs a few dictionary lookups, however
+many per-node subscriptions there are.
+"""
+import logging
+import threading
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# The fields subscriptions can filter on, most selective first.  A subscription
+# is indexed by the first of them it uses.
+FIELDS: Tuple[str, ...] = ("fromNum", "toNum", "portnum", "channel", "wantAck")
+
+
+def packetFields(meshPacket) -> Tuple[Any, ...]:
+    """The values of FIELDS in a MeshPacket"""
+    return (
+        getattr(meshPacket, "from"),
+        meshPacket.to,
+        meshPacket.decoded.portnum if meshPacket.HasField("decoded") else None,
+        meshPacket.channel,
+        meshPacket.want_ack,
+    )
+
+
+class Subscription:
+    """A callback and the packets it wants, returned by PacketDispatcher.subscribe()"""
+
+    __slots__ = ("callback", "criteria", "dispatcher")
+
+    def __init__(self, callback: Callable, criteria: Tuple[Tuple[int, Any], ...], dispatcher: "PacketDispatcher"):
+        self.callback = callback
+        self.criteria = criteria
+        """(index into FIELDS, wanted value) for every field filtered on"""
+        self.dispatcher = dispatcher
+
+    def matches(self, values: Tuple[Any, ...]) -> bool:
+        """Does a packet with these packetFields() pass all our criteria"""
+        return all(values[i] == value for i, value in self.criteria)
+
+    def cancel(self) -> None:
+        """Stop delivering packets to our callback"""
+        self.dispatcher.unsubscribe(self)
+
+    def __repr__(self) -> str:
+        criteria = ", ".join(f"{FIELDS[i]}={value!r}" for i, value in self.criteria)
+        return f"Subscription({self.callback!r}, {criteria})"
+
+
+class PacketDispatcher:
+    """Subscriptions of one interface, indexed by the fields they filter on"""
+
+    def __init__(self):
+        # Index is replaced (never changed) under the lock, so match() can run without it
+        self._index: Tuple[Dict[Any, List[Subscription]], ...] = tuple({} for _ in FIELDS)
+        self._unfiltered: List[Subscription] = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self,
+        callback: Callable,
+        fromNum: Optional[int]=None,
+        toNum: Optional[int]=None,
+        portnum: Optional[int]=None,
+        channel: Optional[int]=None,
+        wantAck: Optional[bool]=None,
+    ) -> Subscription:
+        """Call callback(packet, interface) for received packets matching all the given fields
+
+        Fields left at None match anything, portnum is a PortNum value."""
+        wanted = (fromNum, toNum, portnum, channel, wantAck)
+        criteria = tuple((i, value) for i, value in enumerate(wanted) if value is not None)
+        subscription = Subscription(callback, criteria, self)
+        with self._lock:
+            if criteria:
+                i, value = criteria[0]
+                index = list(self._index)
+                index[i] = dict(index[i])
+                index[i][value] = index[i].get(value, []) + [subscription]
+                self._index = tuple(index)
+            else:
+                self._unfiltered = self._unfiltered + [subscription]
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> bool:
+        """Remove a subscription, returns False if it wasn't ours (any more)"""
+        with self._lock:
+            if subscription.criteria:
+                i, value = subscription.criteria[0]
+                subscriptions = self._index[i].get(value, [])
+                if subscription not in subscriptions:
+                    return False
+                index = list(self._index)
+                index[i] = dict(index[i])
+                remaining = [s for s in subscriptions if s is not subscription]
+                if remaining:
+                    index[i][value] = remaining
+                else:
+                    del index[i][value]
+                self._index = tuple(index)
+            else:
+                if subscription not in self._unfiltered:
+                    return False
+                self._unfiltered = [s for s in self._unfiltered if s is not subscription]
+            self._count -= 1
+            return True
+
+    def match(self, meshPacket) -> List[Subscription]:
+        """The subscriptions that want a received MeshPacket"""
+        if not self._count:
+            return []
+        values = packetFields(meshPacket)
+        result = list(self._unfiltered)
+        for i, index in enumerate(self._index):
+            if index:
+                for subscription in index.get(values[i], ()):
+                    if subscription.matches(values):
+                        result.append(subscription)
+        return result
+
+    @staticmethod
+    def deliver(subscriptions: List[Subscription], packet, interface) -> None:
+        """Call the subscriptions' callbacks, a failing one doesn't stop the others"""
+        for subscription in subscriptions:
+            try:
+                subscription.callback(packet, interface)
+            except Exception as ex:
+                logging.error(f"Unexpected error in packet subscriber {subscription}: {ex}")
+                traceback.print_exc()
+
+    def __len__(self) -> int:
+        return self._count
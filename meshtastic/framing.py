@@ -0,0 +1,98 @@
+"""Framing for the meshtastic stream protocol
+
+Every protobuf sent over a stream link (serial, TCP) is prefixed with a four
+byte header: START1, START2 and the big endian length of the payload.  Any
+bytes seen outside of a frame are debug output from the device.
+"""
+from typing import Callable, Iterator, Optional
+
+START1 = 0x94
+START2 = 0xC3
+HEADER_LEN = 4
+MAX_TO_FROM_RADIO_SIZE = 512
+
+READ_CHUNK_SIZE = 4096
+"""How many bytes we ask for when reading from a stream"""
+
+
+def frameBytes(payload: bytes) -> bytes:
+    """Return payload prefixed with the stream header"""
+    bufLen = len(payload)
+    return bytes([START1, START2, (bufLen >> 8) & 0xFF, bufLen & 0xFF]) + payload
+
+
+class FrameParser:
+    """Incrementally split a byte stream into frames
+
+    Bytes are appended to a growable buffer and scanned in bulk for the start
+    sequence.  Complete frames are handed out as memoryview slices of that
+    buffer, so they are only valid until the consumer asks for the next one.
+    """
+
+    def __init__(self, onDebugBytes: Optional[Callable[[bytes], None]]=None):
+        """Constructor
+
+        Keyword Arguments:
+            onDebugBytes -- If set, called with any bytes received outside of a frame
+        """
+        self._buf = bytearray()
+        self.onDebugBytes = onDebugBytes
+
+    def __len__(self) -> int:
+        """The number of bytes buffered waiting for the rest of a frame"""
+        return len(self._buf)
+
+    def reset(self) -> None:
+        """Drop any partially received frame"""
+        del self._buf[:]
+
+    def feed(self, data) -> Iterator[memoryview]:
+        """Add data to our buffer and yield the payload of each completed frame
+
+        The yielded memoryview is released as soon as the consumer resumes
+        iteration, copy it if it has to outlive that.
+        """
+        self._buf += data
+        return self._frames()
+
+    def _frames(self) -> Iterator[memoryview]:
+        buf = self._buf
+        pos = 0
+        try:
+            while True:
+                start = buf.find(START1, pos)
+                if start < 0:
+                    self._emitDebug(buf, pos, len(buf))
+                    pos = len(buf)
+                    break
+                self._emitDebug(buf, pos, start)
+                pos = start
+                available = len(buf) - pos
+
+                if available < 2:
+                    break  # wait for START2
+                if buf[pos + 1] != START2:
+                    pos += 1  # failed to find start2, resync on the next byte
+                    continue
+                if available < HEADER_LEN:
+                    break  # wait for the rest of the header
+
+                # big endian length follows header
+                packetlen = (buf[pos + 2] << 8) + buf[pos + 3]
+                if packetlen > MAX_TO_FROM_RADIO_SIZE:
+                    pos += 1  # length was out of bounds, resync
+                    continue
+
+                end = pos + HEADER_LEN + packetlen
+                if end > len(buf):
+                    break  # wait for the rest of the payload
+
+                with memoryview(buf) as view, view[pos + HEADER_LEN:end] as frame:
+                    yield frame
+                pos = end
+        finally:
+            del buf[:pos]
+
+    def _emitDebug(self, buf: bytearray, start: int, end: int) -> None:
+        if end > start and self.onDebugBytes is not None:
+            self.onDebugBytes(bytes(buf[start:end]))
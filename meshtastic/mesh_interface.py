@@ -1,7 +1,8 @@
 """Mesh Interface class
 """
 
-import collections
+import asyncio
+import concurrent.futures
 import json
 import logging
 import random
@@ -10,7 +11,7 @@ import threading
 import time
 from datetime import datetime
 
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 import google.protobuf.json_format
 import timeago # type: ignore[import-untyped]
@@ -18,6 +19,16 @@ from pubsub import pub # type: ignore[import-untyped]
 from tabulate import tabulate
 
 import meshtastic.node
+from meshtastic.config_cache import CachedConfig, ConfigCache
+from meshtastic.config_dispatch import CONFIG_SECTIONS, ConfigDownload, storeConfigSection
+from meshtastic.dedup import DuplicateFilter
+from meshtastic.dispatcher import PacketDispatcher, Subscription
+from meshtastic.message_dict import LazyMessageDict, decodedAsDict
+from meshtastic.nodedb import NodeDict, NodeRecord, NodeStore, NodeView
+from meshtastic.packet_iterator import AsyncPacketIterator, PacketIterator, PacketIterators
+from meshtastic.response_future import ResponseFuture
+from meshtastic.response_tracking import ResponseTracker
+from meshtastic.tx_queue import TxQueue
 from meshtastic import (
     mesh_pb2,
     portnums_pb2,
@@ -25,22 +36,30 @@ from meshtastic import (
     BROADCAST_ADDR,
     BROADCAST_NUM,
     LOCAL_ADDR,
+    KnownProtocol,
+    RawPacket,
     ResponseHandler,
     protocols,
     publishingThread,
 )
 from meshtastic.util import (
     Acknowledgment,
+    Debouncer,
     Timeout,
     convert_mac_addr,
     our_exit,
     remove_keys_from_dict,
+    DeferredExecution,
     stripnl,
     message_to_json,
+    topicListeners,
 )
 
 
-class MeshInterface:
+_UNKNOWN_APP_NAME = portnums_pb2.PortNum.Name(portnums_pb2.PortNum.UNKNOWN_APP)
+
+
+class MeshInterface:  # pylint: disable=R0902
     """Interface class for meshtastic devices
 
     Properties:
@@ -56,44 +75,125 @@ class MeshInterface:
             self.message = message
             super().__init__(self.message)
 
-    def __init__(self, debugOut=None, noProto: bool=False) -> None:
+    publishPriorities: Dict[str, int] = {
+        "meshtastic.connection": 3,
+        "meshtastic.node.bulk_loaded": 3,
+        "meshtastic.receive.text": 2,
+        "meshtastic.receive.routing": 2,
+        "meshtastic.node.updated": 1,
+        "meshtastic.config.updated": 1,
+    }
+    """Topic (or parent topic) -> priority, used if our publisher drops low priority messages when full"""
+
+    def __init__(
+        self,
+        debugOut=None,
+        noProto: bool=False,
+        rawPackets: bool=False,
+        duplicateFilter: Optional[DuplicateFilter]=None,
+        publisher: Optional[DeferredExecution]=None,
+        nodeStore: Optional[NodeStore]=None,
+        configCache: Optional[ConfigCache]=None,
+        progressive: bool=False,
+    ) -> None:
         """Constructor
 
         Keyword Arguments:
             noProto -- If True, don't try to run our protocol on the
                        link - just be a dumb serial client.
+            rawPackets -- If True, publish received packets as a meshtastic.RawPacket
+                          (the MeshPacket protobuf and a few decoded fields) instead of
+                          converting them to a dictionary.
+            duplicateFilter -- If set, packets it has seen recently (maybe through another
+                               interface sharing it) are not published again.
+            publisher -- The DeferredExecution our pubsub messages are sent from,
+                         meshtastic.publishingThread if not set.  Messages of one
+                         interface are delivered in order (per node if
+                         publishPerNode is set), a publisher with several workers
+                         delivers messages of different interfaces in parallel.
+            nodeStore -- If set, once we know which device we're talking to we start
+                         with the node DB stored for it there, and store what we learn
+                         about nodes as we go.
+            configCache -- If set and it has the config of our device (and firmware
+                           version), we take it from there and are connected as soon
+                           as we know which device we're talking to.  The rest of the
+                           config download refreshes it in the background.
+            progressive -- If True we're connected once the device config has been
+                           downloaded, while the node DB is still coming in.  nodes
+                           fill in as it arrives, see meshtastic.node.progress and
+                           nodeDbComplete.
         """
         self.debugOut = debugOut
-        self.nodes: Optional[Dict[str,Dict]] = None  # FIXME
+        self.rawPackets: bool = rawPackets
+        self.duplicateFilter: Optional[DuplicateFilter] = duplicateFilter
+        self.publisher: DeferredExecution = publisher if publisher is not None else publishingThread
+        self.nodeStore: Optional[NodeStore] = nodeStore
+        self.configCache: Optional[ConfigCache] = configCache
+        self.progressive: bool = progressive
+        self.progressEvery: int = 32  # in progressive mode, publish meshtastic.node.progress every this many nodes
+        self.nodeDbComplete: threading.Event = threading.Event()  # set once the whole node DB has been downloaded
+        self.publishPerNode: bool = False  # only keep messages about the same node in order
+        self.nodeUpdatesDuringConfig: bool = True  # publish node.updated for every node of the initial node DB download
+        self.nodeUpdateDebounce: float = 0.0  # if > 0, publish node.updated for a node at most once per this many seconds
+        self._download: ConfigDownload = ConfigDownload()  # replaced by _startConfig()
+        self._nodeUpdates: Debouncer = Debouncer(
+            self._startTimer, lambda nodeNum, node: self._publish("meshtastic.node.updated", nodeNum=nodeNum, node=node)
+        )  # see nodeUpdateDebounce
+        self._packetIterators: PacketIterators = PacketIterators()  # see packets()
+        self.dispatcher: PacketDispatcher = PacketDispatcher()  # see subscribe()
+        self.nodes: Optional[Dict[str,NodeView]] = None  # FIXME
         self.isConnected: threading.Event = threading.Event()
         self.noProto: bool = noProto
         self.localNode: meshtastic.node.Node = meshtastic.node.Node(self, -1)  # We fixup nodenum later
         self.myInfo: Optional[mesh_pb2.MyNodeInfo] = None  # We don't have device info yet
         self.metadata: Optional[mesh_pb2.DeviceMetadata] = None  # We don't have device metadata yet
-        self.responseHandlers: Dict[int,ResponseHandler] = {}  # A map from request ID to the handler
+        self.responses: ResponseTracker = ResponseTracker(
+            self._startTimer, self._callResponseHandler, lambda: self.localNode.nodeNum
+        )  # see sendData() and sendRequest()
+        self.responseHandlers: Dict[int,ResponseHandler] = self.responses.handlers  # A map from request ID to the handler
         self.failure = (
             None  # If we've encountered a fatal exception it will be kept here
         )
         self._timeout: Timeout = Timeout()
         self._acknowledgment: Acknowledgment = Acknowledgment()
-        self.heartbeatTimer: Optional[threading.Timer] = None
+        self.heartbeatTimer: Optional[Any] = None  # a threading.Timer, or anything returned by _startTimer()
         random.seed()  # FIXME, we should not clobber the random seedval here, instead tell user they must call it
         self.currentPacketId: int = random.randint(0, 0xFFFFFFFF)
-        self.nodesByNum: Optional[Dict[int, Dict]] = None
+        self.nodesByNum: Optional[Dict[int, NodeView]] = None
         self.configId: Optional[int] = None
         self.gotResponse: bool = False  # used in gpio read
         self.mask: Optional[int] = None  # used in gpio read and gpio watch
         self.queueStatus: Optional[mesh_pb2.QueueStatus] = None
-        self.queue: collections.OrderedDict = collections.OrderedDict()
-        self._localChannels = None
+        self.txQueue: TxQueue = TxQueue(self._sendToRadioImpl, schedule=self._txScheduler())  # MeshPackets on their way to the device
+        self._localChannels: Optional[List] = None
+
+    def close(self, flushTimeout: float=10.0):
+        """Shutdown this interface
 
-    def close(self):
-        """Shutdown this interface"""
+        Keyword Arguments:
+            flushTimeout -- seconds to wait for queued packets to be sent, we don't
+                            wait when called from the thread delivering our packets (default: {10.0})
+        """
         if self.heartbeatTimer:
             self.heartbeatTimer.cancel()
-
+        self._nodeUpdates.cancel()
+        self._packetIterators.close()
+        self.responses.close(MeshInterface.MeshInterfaceError("Interface closed"))
+        if self.nodeStore is not None:
+            self.nodeStore.flush()
+
+        if self._onDeliveringThread():
+            # the answers we'd wait for (i.e. QueueStatus) come in on this thread
+            logging.debug("Closing from the thread delivering our packets, not waiting for the TX queue")
+        elif not self.txQueue.flush(timeout=flushTimeout):
+            logging.warning(f"Closing with {self.txQueue.stats()['pending']} packets still waiting to be sent")
+        self.txQueue.close()
         self._sendDisconnect()
 
+    def _onDeliveringThread(self) -> bool:
+        """Are we called from the thread that reads from the device (i.e. by a packet handler)"""
+        return False
+
     def __enter__(self):
         return self
 
@@ -122,7 +222,7 @@ class MeshInterface:
                 # when the TBeam is first booted, it sometimes shows the raw data
                 # so, we will just remove any raw keys
                 keys_to_remove = ("raw", "decoded", "payload")
-                n2 = remove_keys_from_dict(keys_to_remove, n)
+                n2 = remove_keys_from_dict(keys_to_remove, n.toDict() if isinstance(n, NodeView) else n)
 
                 # if we have 'macaddr', re-format it
                 if "macaddr" in n2["user"]:
@@ -250,6 +350,8 @@ class MeshInterface:
         wantResponse: bool=False,
         onResponse: Optional[Callable[[mesh_pb2.MeshPacket], Any]]=None,
         channelIndex: int=0,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+        onResponseTimeout: Optional[Callable[[int], Any]]=None,
     ):
         """Send a utf8 string to some other node, if the node has a display it
            will also be shown on the device.
@@ -266,6 +368,9 @@ class MeshInterface:
                        (with retries and ack/nak provided for delivery)
             wantResponse -- True if you want the service on the other side to
                             send an application layer response
+            priority -- the MeshPacket.Priority to send with, see sendData()
+            onResponseTimeout -- called with the packet id if onResponse gave
+                                 up waiting, see sendData()
 
         Returns the sent packet. The id field will be populated in this packet
         and can be used to track future message acks/naks.
@@ -279,6 +384,8 @@ class MeshInterface:
             wantResponse=wantResponse,
             onResponse=onResponse,
             channelIndex=channelIndex,
+            priority=priority,
+            onResponseTimeout=onResponseTimeout,
         )
 
     def sendData(
@@ -290,6 +397,8 @@ class MeshInterface:
         wantResponse: bool=False,
         onResponse: Optional[Callable[[mesh_pb2.MeshPacket], Any]]=None,
         channelIndex: int=0,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+        onResponseTimeout: Optional[Callable[[int], Any]]=None,
     ):
         """Send a data packet to some other node
 
@@ -309,11 +418,34 @@ class MeshInterface:
                     called when a response packet arrives (or the transaction
                     is NAKed due to non receipt)
             channelIndex - channel number to use
+            priority -- the MeshPacket.Priority to send with, our TX queue and the
+                        device's send higher priorities first (default: RELIABLE
+                        if wantAck, otherwise DEFAULT; our TX queue puts admin
+                        messages ahead of RELIABLE)
+            onResponseTimeout -- A closure of the form funct(requestId), called
+                    if no response arrived within responses.timeout seconds
+                    (if set, by default handlers wait forever).  onResponse
+                    is then never called (default: {None})
 
         Returns the sent packet. The id field will be populated in this packet
         and can be used to track future message acks/naks.
         """
+        meshPacket = self._dataPacket(data, portNum, wantResponse, channelIndex, priority)
+        if onResponse is not None:
+            logging.debug(f"Setting a response handler for requestId {meshPacket.id}")
+            self.responses.addHandler(meshPacket.id, onResponse, onResponseTimeout)
+        p = self._sendPacket(meshPacket, destinationId, wantAck=wantAck)
+        return p
 
+    def _dataPacket(
+        self,
+        data,
+        portNum: portnums_pb2.PortNum.ValueType,
+        wantResponse: bool,
+        channelIndex: int,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+    ) -> mesh_pb2.MeshPacket:
+        """A MeshPacket with a new ID carrying data (bytes or a protobuf), see sendData()"""
         if getattr(data, "SerializeToString", None):
             logging.debug(f"Serializing protobuf as data: {stripnl(data)}")
             data = data.SerializeToString()
@@ -335,13 +467,86 @@ class MeshInterface:
         meshPacket.decoded.payload = data
         meshPacket.decoded.portnum = portNum
         meshPacket.decoded.want_response = wantResponse
+        meshPacket.priority = priority
         meshPacket.id = self._generatePacketId()
+        return meshPacket
 
-        if onResponse is not None:
-            logging.debug(f"Setting a response handler for requestId {meshPacket.id}")
-            self._addResponseHandler(meshPacket.id, onResponse)
-        p = self._sendPacket(meshPacket, destinationId, wantAck=wantAck)
-        return p
+    def sendRequest(
+        self,
+        data,
+        destinationId: Union[int, str],
+        portNum: portnums_pb2.PortNum.ValueType=portnums_pb2.PortNum.PRIVATE_APP,
+        wantAck: bool=False,
+        wantResponse: bool=True,
+        channelIndex: int=0,
+        timeout: Optional[float]=None,
+        priority: mesh_pb2.MeshPacket.Priority.ValueType=mesh_pb2.MeshPacket.Priority.UNSET,
+    ) -> ResponseFuture:
+        """Send a data packet and return a ResponseFuture for its answer
+
+        Like sendData(), but instead of calling a handler the answer resolves
+        the returned future: the response if wantResponse, otherwise the ACK.
+        A NAK fails it with a ResponseError.  Any number of requests can be
+        outstanding, to the same or different nodes.
+
+        Keyword Arguments:
+            timeout -- Fail the future with concurrent.futures.TimeoutError if no
+                       answer arrived after this many seconds. (default: {responses.timeout}, None waits forever)
+
+        The packet we sent is future.packet.
+        """
+        if not (wantAck or wantResponse):
+            raise MeshInterface.MeshInterfaceError("A request needs wantAck or wantResponse, or nothing will answer it")
+        meshPacket = self._dataPacket(data, portNum, wantResponse, channelIndex, priority)
+        future = ResponseFuture(meshPacket, wantAck=wantAck, wantResponse=wantResponse)
+        # registered before sending, the answer can arrive before _sendPacket() returns
+        self.responses.addFuture(future, timeout)
+        try:
+            self._sendPacket(meshPacket, destinationId, wantAck=wantAck)
+        except BaseException as ex:
+            future.fail(ex)
+            raise
+        return future
+
+    def requestPosition(
+        self, destinationId: Union[int, str], channelIndex: int=0, timeout: Optional[float]=None
+    ) -> ResponseFuture:
+        """Ask a node for its position, returns a ResponseFuture for the response (see sendRequest())
+
+        Like sendPosition(), this sends our own position along with the request."""
+        return self.sendRequest(
+            self._positionMessage(),
+            destinationId,
+            portNum=portnums_pb2.PortNum.POSITION_APP,
+            channelIndex=channelIndex,
+            timeout=timeout,
+        )
+
+    def requestTelemetry(
+        self, destinationId: Union[int, str], channelIndex: int=0, timeout: Optional[float]=None
+    ) -> ResponseFuture:
+        """Ask a node for its device metrics, returns a ResponseFuture for the response (see sendRequest())"""
+        return self.sendRequest(
+            self._telemetryMessage(),
+            destinationId,
+            portNum=portnums_pb2.PortNum.TELEMETRY_APP,
+            channelIndex=channelIndex,
+            timeout=timeout,
+        )
+
+    def requestTraceRoute(
+        self, destinationId: Union[int, str], channelIndex: int=0, timeout: Optional[float]=None
+    ) -> ResponseFuture:
+        """Trace the route to a node, returns a ResponseFuture for the response (see sendRequest())
+
+        The route is in packet["decoded"]["traceroute"] of the response."""
+        return self.sendRequest(
+            mesh_pb2.RouteDiscovery(),
+            destinationId,
+            portNum=portnums_pb2.PortNum.TRACEROUTE_APP,
+            channelIndex=channelIndex,
+            timeout=timeout,
+        )
 
     def sendPosition(
         self,
@@ -365,23 +570,7 @@ class MeshInterface:
         Returns the sent packet. The id field will be populated in this packet and
         can be used to track future message acks/naks.
         """
-        p = mesh_pb2.Position()
-        if latitude != 0.0:
-            p.latitude_i = int(latitude / 1e-7)
-            logging.debug(f"p.latitude_i:{p.latitude_i}")
-
-        if longitude != 0.0:
-            p.longitude_i = int(longitude / 1e-7)
-            logging.debug(f"p.longitude_i:{p.longitude_i}")
-
-        if altitude != 0:
-            p.altitude = int(altitude)
-            logging.debug(f"p.altitude:{p.altitude}")
-
-        if timeSec == 0:
-            timeSec = int(time.time())  # returns unix timestamp in seconds
-        p.time = timeSec
-        logging.debug(f"p.time:{p.time}")
+        p = self._positionMessage(latitude, longitude, altitude, timeSec)
 
         if wantResponse:
             onResponse = self.onResponsePosition
@@ -401,6 +590,28 @@ class MeshInterface:
             self.waitForPosition()
         return d
 
+    @staticmethod
+    def _positionMessage(latitude: float=0.0, longitude: float=0.0, altitude: int=0, timeSec: int=0) -> mesh_pb2.Position:
+        """The Position protobuf sendPosition() sends"""
+        p = mesh_pb2.Position()
+        if latitude != 0.0:
+            p.latitude_i = int(latitude / 1e-7)
+            logging.debug(f"p.latitude_i:{p.latitude_i}")
+
+        if longitude != 0.0:
+            p.longitude_i = int(longitude / 1e-7)
+            logging.debug(f"p.longitude_i:{p.longitude_i}")
+
+        if altitude != 0:
+            p.altitude = int(altitude)
+            logging.debug(f"p.altitude:{p.altitude}")
+
+        if timeSec == 0:
+            timeSec = int(time.time())  # returns unix timestamp in seconds
+        p.time = timeSec
+        logging.debug(f"p.time:{p.time}")
+        return p
+
     def onResponsePosition(self, p):
         """on response for position"""
         if p["decoded"]["portnum"] == 'POSITION_APP':
@@ -462,6 +673,26 @@ class MeshInterface:
 
     def sendTelemetry(self, destinationId: Union[int,str]=BROADCAST_ADDR, wantResponse: bool=False, channelIndex: int=0):
         """Send telemetry and optionally ask for a response"""
+        r = self._telemetryMessage()
+
+        if wantResponse:
+            onResponse = self.onResponseTelemetry
+        else:
+            onResponse = None
+
+        self.sendData(
+            r,
+            destinationId=destinationId,
+            portNum=portnums_pb2.PortNum.TELEMETRY_APP,
+            wantResponse=wantResponse,
+            onResponse=onResponse,
+            channelIndex=channelIndex,
+        )
+        if wantResponse:
+            self.waitForTelemetry()
+
+    def _telemetryMessage(self) -> telemetry_pb2.Telemetry:
+        """The Telemetry protobuf sendTelemetry() sends, with the device metrics of our node"""
         r = telemetry_pb2.Telemetry()
 
         if self.nodes is not None:
@@ -481,22 +712,7 @@ class MeshInterface:
                     air_util_tx = metrics.get("airUtilTx")
                     if air_util_tx is not None:
                         r.device_metrics.air_util_tx = air_util_tx
-
-        if wantResponse:
-            onResponse = self.onResponseTelemetry
-        else:
-            onResponse = None
-
-        self.sendData(
-            r,
-            destinationId=destinationId,
-            portNum=portnums_pb2.PortNum.TELEMETRY_APP,
-            wantResponse=wantResponse,
-            onResponse=onResponse,
-            channelIndex=channelIndex,
-        )
-        if wantResponse:
-            self.waitForTelemetry()
+        return r
 
     def onResponseTelemetry(self, p):
         """on response for telemetry"""
@@ -521,8 +737,9 @@ class MeshInterface:
             if p["decoded"]["routing"]["errorReason"] == 'NO_RESPONSE':
                 our_exit("No response from node. At least firmware 2.1.22 is required on the destination node.")
 
-    def _addResponseHandler(self, requestId: int, callback: Callable):
-        self.responseHandlers[requestId] = ResponseHandler(callback)
+    def _callResponseHandler(self, callback: Callable, packet) -> None:
+        """Call a response handler with the packet that answered its request"""
+        callback(packet)
 
     def _sendPacket(self, meshPacket: mesh_pb2.MeshPacket, destinationId: Union[int,str]=BROADCAST_ADDR, wantAck: bool=False):
         """Send a MeshPacket to the specified node (or if unspecified, broadcast).
@@ -530,6 +747,10 @@ class MeshInterface:
 
         Returns the sent packet. The id field will be populated in this packet and
         can be used to track future message acks/naks.
+
+        This doesn't wait for the packet to go out: it is queued on our txQueue.
+        If the device never accepts it that is logged, and the request waiting
+        for its answer (see sendRequest()) fails right away.
         """
 
         # We allow users to talk to the local node before we've completed the full connection flow...
@@ -556,6 +777,8 @@ class MeshInterface:
         else:
             if self.nodes:
                 node = self.nodes.get(destinationId)
+                if node is None and self._waitForNodeDb():
+                    node = self.nodes.get(destinationId)  # maybe it was still to come
                 if node is None:
                     our_exit(f"Warning: NodeId {destinationId} not found in DB")
                 else:
@@ -581,7 +804,10 @@ class MeshInterface:
             )
         else:
             logging.debug(f"Sending packet: {stripnl(meshPacket)}")
-            self._sendToRadio(toRadio)
+            txFuture = self._sendToRadio(toRadio)
+            if txFuture is not None:
+                packetId = meshPacket.id
+                txFuture.add_done_callback(lambda f: self.responses.packetDone(packetId, f))
         return meshPacket
 
     def waitForConfig(self):
@@ -617,13 +843,31 @@ class MeshInterface:
         if not success:
             raise MeshInterface.MeshInterfaceError("Timed out waiting for position")
 
-    def getMyNodeInfo(self) -> Optional[Dict]:
+    def getMyNodeInfo(self) -> Optional[Mapping[str, Any]]:
         """Get info about my node."""
         if self.myInfo is None or self.nodesByNum is None:
             return None
         logging.debug(f"self.nodesByNum:{self.nodesByNum}")
         return self.nodesByNum.get(self.myInfo.my_node_num)
 
+    def lastReceived(self, nodeNum: int) -> Optional[Dict[str, Any]]:
+        """The last packet we received from a node, as a packet dictionary (None if we have none)
+
+        This is node["lastReceived"] of the node DB, which only keeps the
+        MeshPacket and builds its dictionary when asked."""
+        node = (self.nodesByNum or {}).get(nodeNum)
+        meshPacket = node.record.lastPacket if isinstance(node, NodeView) else None
+        if meshPacket is None:
+            return None
+        handler = protocols.get(meshPacket.decoded.portnum) if meshPacket.HasField("decoded") else None
+        decoded = None
+        if handler is not None and self._shouldDecode(handler, True):
+            decoded = handler.decode(meshPacket.decoded.payload)
+        packet = RawPacket(
+            meshPacket, self._nodeNumToId(nodeNum), self._nodeNumToId(meshPacket.to), meshPacket.decoded.portnum, decoded
+        )
+        return packet.toDict()
+
     def getMyUser(self):
         """Get user"""
         nodeInfo = self.getMyNodeInfo()
@@ -656,6 +900,13 @@ class MeshInterface:
         if self.failure:
             raise self.failure
 
+    def _waitForNodeDb(self, timeout: float=30.0) -> bool:
+        """If we're connected while still downloading the node DB, wait for it, returns True if we waited"""
+        if self.nodeDbComplete.is_set() or not self.isConnected.is_set():
+            return False
+        self.nodeDbComplete.wait(timeout)
+        return True
+
     def _generatePacketId(self) -> int:
         """Get a new unique packet ID"""
         if self.currentPacketId is None:
@@ -667,10 +918,61 @@ class MeshInterface:
     def _disconnected(self):
         """Called by subclasses to tell clients this interface has disconnected"""
         self.isConnected.clear()
-        publishingThread.queueWork(
-            lambda: pub.sendMessage("meshtastic.connection.lost", interface=self)
+        self._packetIterators.close()
+        self._publish("meshtastic.connection.lost")
+
+    def _publish(self, topic: str, nodeNum: Optional[int]=None, **kwargs) -> None:
+        """Publish a pubsub message (with us as the interface) from our publisher thread
+
+        nodeNum is the node the message is about, if any"""
+        self._queuePublish(topic, nodeNum, lambda: pub.sendMessage(topic, interface=self, **kwargs))
+
+    def _queuePublish(self, topic: str, nodeNum: Optional[int], runnable: Callable) -> None:
+        """Run runnable on our publisher, in order with the other messages about the same interface/node"""
+        key: Any = id(self)
+        if nodeNum is not None and self.publishPerNode:
+            key = (key, nodeNum)
+        priority = 0
+        if self.publisher.overflow == DeferredExecution.DROP_LOW_PRIORITY:
+            priority = self._publishPriority(topic)
+        coalesceKey = None
+        if topic == "meshtastic.node.updated" and nodeNum is not None:
+            coalesceKey = (topic, id(self), nodeNum)  # only the latest update of a node matters
+        self.publisher.queueWork(runnable, key, priority, coalesceKey)
+
+    def _publishPriority(self, topic: str) -> int:
+        """The priority of the most specific entry of publishPriorities that matches topic"""
+        while topic:
+            priority = self.publishPriorities.get(topic)
+            if priority is not None:
+                return priority
+            topic = topic.rpartition(".")[0]
+        return 0
+
+    def _publishProgress(self) -> None:
+        """Tell clients how far along the node DB download is"""
+        self._publish(
+            "meshtastic.node.progress",
+            received=len(self._download.nodes) if self._download.nodes is not None else len(self.nodesByNum or {}),
+            expected=self._download.expectedNodes,
         )
 
+    def _nodeUpdated(self, node: Dict) -> None:
+        """Tell clients about a new or changed node, batching/debouncing as asked"""
+        nodeNum = node["num"]
+        if self._download.nodes is not None:
+            # Still downloading the node DB, everyone gets the lot in meshtastic.node.bulk_loaded
+            self._download.nodes.append(node)
+            if self.progressive and len(self._download.nodes) % self.progressEvery == 0:
+                self._publishProgress()
+            if self.nodeUpdatesDuringConfig and self._hasListeners("meshtastic.node.updated"):
+                self._publish("meshtastic.node.updated", nodeNum=nodeNum, node=node)
+            return
+        if self.nodeUpdateDebounce <= 0:
+            self._publish("meshtastic.node.updated", nodeNum=nodeNum, node=node)
+            return
+        self._nodeUpdates.update(nodeNum, node, self.nodeUpdateDebounce)
+
     def _startHeartbeat(self):
         """We need to send a heartbeat message to the device every X seconds"""
 
@@ -680,14 +982,22 @@ class MeshInterface:
             i = prefs.power.ls_secs / 2
             logging.debug(f"Sending heartbeat, interval {i}")
             if i != 0:
-                self.heartbeatTimer = threading.Timer(i, callback)
-                self.heartbeatTimer.start()
+                self.heartbeatTimer = self._startTimer(i, callback)
                 p = mesh_pb2.ToRadio()
                 p.heartbeat.CopyFrom(mesh_pb2.Heartbeat())
                 self._sendToRadio(p)
 
         callback()  # run our periodic callback now, it will make another timer if necessary
 
+    def _startTimer(self, interval: float, callback: Callable, daemon: bool=False):
+        """Run callback once after interval seconds, returns something with a cancel() method
+
+        A daemon timer doesn't keep the program running."""
+        timer = threading.Timer(interval, callback)
+        timer.daemon = daemon
+        timer.start()
+        return timer
+
     def _connected(self):
         """Called by this class to tell clients we are now fully connected to a node"""
         # (because I'm lazy) _connected might be called when remote Node
@@ -696,18 +1006,16 @@ class MeshInterface:
         if not self.isConnected.is_set():
             self.isConnected.set()
             self._startHeartbeat()
-            publishingThread.queueWork(
-                lambda: pub.sendMessage(
-                    "meshtastic.connection.established", interface=self
-                )
-            )
+            self._publish("meshtastic.connection.established")
 
     def _startConfig(self):
         """Start device packets flowing"""
         self.myInfo = None
-        self.nodes = {}  # nodes keyed by ID
-        self.nodesByNum = {}  # nodes keyed by nodenum
+        self.nodes = NodeDict()  # nodes keyed by ID
+        self.nodesByNum = NodeDict()  # nodes keyed by nodenum
         self._localChannels = [] # empty until we start getting channels pushed from the device (during config)
+        self._download = ConfigDownload(nodes=[])
+        self.nodeDbComplete.clear()
 
         startConfig = mesh_pb2.ToRadio()
         self.configId = random.randint(0, 0xFFFFFFFF)
@@ -731,59 +1039,33 @@ class MeshInterface:
             return
         self.queueStatus.free -= 1
 
-    def _sendToRadio(self, toRadio: mesh_pb2.ToRadio) -> None:
-        """Send a ToRadio protobuf to the device"""
+    def _sendToRadio(self, toRadio: mesh_pb2.ToRadio) -> Optional[concurrent.futures.Future]:
+        """Send a ToRadio protobuf to the device
+
+        MeshPackets go through our txQueue: this doesn't wait for room in the
+        device's TX queue, it returns a future that is resolved once the
+        device accepted the packet.  Anything else is sent right away."""
         if self.noProto:
             logging.warning(
                 f"Not sending packet because protocol use is disabled by noProto"
             )
-        else:
-            # logging.debug(f"Sending toRadio: {stripnl(toRadio)}")
-
-            if not toRadio.HasField("packet"):
-                # not a meshpacket -- send immediately, give queue a chance,
-                # this makes heartbeat trigger queue
-                self._sendToRadioImpl(toRadio)
-            else:
-                # meshpacket -- queue
-                self.queue[toRadio.packet.id] = toRadio
-
-            resentQueue = collections.OrderedDict()
-
-            while self.queue:
-                # logging.warn("queue: " + " ".join(f'{k:08x}' for k in self.queue))
-                while not self._queueHasFreeSpace():
-                    logging.debug("Waiting for free space in TX Queue")
-                    time.sleep(0.5)
-                try:
-                    toResend = self.queue.popitem(last=False)
-                except KeyError:
-                    break
-                packetId, packet = toResend
-                # logging.warn(f"packet: {packetId:08x} {packet}")
-                resentQueue[packetId] = packet
-                if packet is False:
-                    continue
-                self._queueClaim()
-                if packet != toRadio:
-                    logging.debug(f"Resending packet ID {packetId:08x} {packet}")
-                self._sendToRadioImpl(packet)
-
-            # logging.warn("resentQueue: " + " ".join(f'{k:08x}' for k in resentQueue))
-            for packetId, packet in resentQueue.items():
-                if (
-                    self.queue.pop(packetId, False) is False
-                ):  # Packet got acked under us
-                    logging.debug(f"packet {packetId:08x} got acked under us")
-                    continue
-                if packet:
-                    self.queue[packetId] = packet
-            # logging.warn("queue + resentQueue: " + " ".join(f'{k:08x}' for k in self.queue))
+            return None
+        if not toRadio.HasField("packet"):
+            # not a meshpacket -- send immediately, and give the device another
+            # go at the packets it didn't confirm, this makes heartbeat trigger queue
+            self._sendToRadioImpl(toRadio)
+            self.txQueue.resendUnconfirmed()
+            return None
+        return self.txQueue.enqueue(toRadio)
 
     def _sendToRadioImpl(self, toRadio: mesh_pb2.ToRadio) -> None:
         """Send a ToRadio protobuf to the device"""
         logging.error(f"Subclass must provide toradio: {toRadio}")
 
+    def _txScheduler(self) -> Optional[Callable[[Callable[[], None]], Any]]:
+        """What our txQueue sends on, None for a thread of its own (see TxQueue)"""
+        return None
+
     def _handleConfigComplete(self) -> None:
         """
         Done with initial config messages, now send regular MeshPackets
@@ -792,28 +1074,62 @@ class MeshInterface:
         # This is no longer necessary because the current protocol statemachine has already proactively sent us the locally visible channels
         # self.localNode.requestChannels()
         self.localNode.setChannels(self._localChannels)
+        if self._download.fromCache:
+            if self._download.cachedChannels != self._localChannels:
+                self._publish("meshtastic.channels.updated", channels=self.localNode.channels)
+            self._download.fromCache = False
+        if self.configCache is not None and self.myInfo is not None and self.metadata is not None:
+            self.configCache.save(
+                self.myInfo.my_node_num,
+                self.metadata.firmware_version,
+                CachedConfig(self.localNode.localConfig, self.localNode.moduleConfig, self._localChannels or [], self.metadata),
+            )
+
+        if self.progressive and self._download.nodes is not None:
+            self._download.expectedNodes = len(self._download.nodes)
+            self._publishProgress()
+        if self._download.nodes is not None:
+            nodes, self._download.nodes = self._download.nodes, None
+            self._publish("meshtastic.node.bulk_loaded", nodes=nodes)
+        self.nodeDbComplete.set()
 
         # the following should only be called after we have settings and channels
         self._connected()  # Tell everyone else we are ready to go
 
+    def _checkConfigReady(self, nodeInfo: bool=False) -> None:
+        """In progressive mode, connect once we have myInfo and the device config, whatever order they came in"""
+        if self.progressive and self.myInfo is not None and not self.isConnected.is_set() and self._download.haveConfig(nodeInfo):
+            self._handleConfigReady()
+
+    def _handleConfigReady(self) -> None:
+        """In progressive mode: the device config is in, only node infos are still to come"""
+        logging.debug("Config received, connected while the node DB is still downloading")
+        self.localNode.setChannels(self._localChannels)
+        self._connected()
+        self._publishProgress()
+
+    def _useCachedConfig(self) -> None:
+        """Take our config from configCache if it has it, and tell everyone we're ready"""
+        if self.configCache is None or self.myInfo is None or self.metadata is None:
+            return
+        cached = self.configCache.load(self.myInfo.my_node_num, self.metadata.firmware_version)
+        if cached is None:
+            return
+        logging.debug("Using cached config until the download completes")
+        self.localNode.localConfig.CopyFrom(cached.localConfig)
+        self.localNode.moduleConfig.CopyFrom(cached.moduleConfig)
+        self.localNode.setChannels(list(cached.channels))
+        self._download.cachedChannels = cached.channels
+        self._download.fromCache = True
+        self._connected()
+
     def _handleQueueStatusFromRadio(self, queueStatus) -> None:
         self.queueStatus = queueStatus
         logging.debug(
             f"TX QUEUE free {queueStatus.free} of {queueStatus.maxlen}, res = {queueStatus.res}, id = {queueStatus.mesh_packet_id:08x} "
         )
 
-        if queueStatus.res:
-            return
-
-        # logging.warn("queue: " + " ".join(f'{k:08x}' for k in self.queue))
-        justQueued = self.queue.pop(queueStatus.mesh_packet_id, None)
-
-        if justQueued is None and queueStatus.mesh_packet_id != 0:
-            self.queue[queueStatus.mesh_packet_id] = False
-            logging.debug(
-                f"Reply for unexpected packet ID {queueStatus.mesh_packet_id:08x}"
-            )
-        # logging.warn("queue: " + " ".join(f'{k:08x}' for k in self.queue))
+        self.txQueue.onQueueStatus(queueStatus)
 
     def _handleFromRadio(self, fromRadioBytes):
         """
@@ -822,15 +1138,19 @@ class MeshInterface:
         Called by subclasses."""
         fromRadio = mesh_pb2.FromRadio()
         fromRadio.ParseFromString(fromRadioBytes)
-        logging.debug(
-            f"in mesh_interface.py _handleFromRadio() fromRadioBytes: {fromRadioBytes}"
-        )
-        asDict = google.protobuf.json_format.MessageToDict(fromRadio)
-        logging.debug(f"Received from radio: {fromRadio}")
+        # Formatting whole protobufs is expensive, only do it if someone will see it
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(
+                f"in mesh_interface.py _handleFromRadio() fromRadioBytes: {bytes(fromRadioBytes)}"
+            )
+            logging.debug(f"Received from radio: {fromRadio}")
         if fromRadio.HasField("my_info"):
             self.myInfo = fromRadio.my_info
             self.localNode.nodeNum = self.myInfo.my_node_num
             logging.debug(f"Received myinfo: {stripnl(fromRadio.my_info)}")
+            if self.nodeStore is not None:
+                self._loadStoredNodes()
+            self._checkConfigReady()
 
             failmsg = None
 
@@ -842,26 +1162,22 @@ class MeshInterface:
         elif fromRadio.HasField("metadata"):
             self.metadata = fromRadio.metadata
             logging.debug(f"Received device metadata: {stripnl(fromRadio.metadata)}")
+            if self.configCache is not None and self.myInfo is not None and not self.isConnected.is_set():
+                self._useCachedConfig()
 
         elif fromRadio.HasField("node_info"):
-            node = asDict["nodeInfo"]
-            try:
-                newpos = self._fixupPosition(node["position"])
-                node["position"] = newpos
-            except:
-                logging.debug("Node without position")
-
-            logging.debug(f"Received nodeinfo: {node}")
-
-            self.nodesByNum[node["num"]] = node
-            if "user" in node:  # Some nodes might not have user/ids assigned yet
-                if "id" in node["user"]:
-                    self.nodes[node["user"]["id"]] = node
-            publishingThread.queueWork(
-                lambda: pub.sendMessage(
-                    "meshtastic.node.updated", node=node, interface=self
-                )
-            )
+            self._checkConfigReady(nodeInfo=True)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(f"Received nodeinfo: {stripnl(fromRadio.node_info)}")
+
+            # Update what we know (i.e. from the node store) with what the device tells us
+            node = self._getOrCreateByNum(fromRadio.node_info.num)
+            node.record.setNodeInfo(fromRadio.node_info)
+            self._nodeChanged(node.record)
+
+            if node.record.id:  # Some nodes might not have user/ids assigned yet
+                self.nodes[node.record.id] = node
+            self._nodeUpdated(node)
         elif fromRadio.config_complete_id == self.configId:
             # we ignore the config_complete_id, it is unneeded for our
             # stream API fromRadio.config_complete_id
@@ -876,18 +1192,10 @@ class MeshInterface:
             self._handleQueueStatusFromRadio(fromRadio.queueStatus)
 
         elif fromRadio.HasField("mqttClientProxyMessage"):
-            publishingThread.queueWork(
-                lambda: pub.sendMessage(
-                    "meshtastic.mqttclientproxymessage", proxymessage=fromRadio.mqttClientProxyMessage, interface=self
-                )
-            )
+            self._publish("meshtastic.mqttclientproxymessage", proxymessage=fromRadio.mqttClientProxyMessage)
 
         elif fromRadio.HasField("xmodemPacket"):
-            publishingThread.queueWork(
-                lambda: pub.sendMessage(
-                    "meshtastic.xmodempacket", packet=fromRadio.xmodemPacket, interface=self
-                )
-            )
+            self._publish("meshtastic.xmodempacket", packet=fromRadio.xmodemPacket)
 
         elif fromRadio.HasField("rebooted") and fromRadio.rebooted:
             # Tell clients the device went away.  Careful not to call the overridden
@@ -896,76 +1204,25 @@ class MeshInterface:
 
             self._startConfig()  # redownload the node db etc...
 
-        elif fromRadio.HasField("config") or fromRadio.HasField("moduleConfig"):
-            if fromRadio.config.HasField("device"):
-                self.localNode.localConfig.device.CopyFrom(fromRadio.config.device)
-            elif fromRadio.config.HasField("position"):
-                self.localNode.localConfig.position.CopyFrom(fromRadio.config.position)
-            elif fromRadio.config.HasField("power"):
-                self.localNode.localConfig.power.CopyFrom(fromRadio.config.power)
-            elif fromRadio.config.HasField("network"):
-                self.localNode.localConfig.network.CopyFrom(fromRadio.config.network)
-            elif fromRadio.config.HasField("display"):
-                self.localNode.localConfig.display.CopyFrom(fromRadio.config.display)
-            elif fromRadio.config.HasField("lora"):
-                self.localNode.localConfig.lora.CopyFrom(fromRadio.config.lora)
-            elif fromRadio.config.HasField("bluetooth"):
-                self.localNode.localConfig.bluetooth.CopyFrom(
-                    fromRadio.config.bluetooth
-                )
-
-            elif fromRadio.moduleConfig.HasField("mqtt"):
-                self.localNode.moduleConfig.mqtt.CopyFrom(fromRadio.moduleConfig.mqtt)
-            elif fromRadio.moduleConfig.HasField("serial"):
-                self.localNode.moduleConfig.serial.CopyFrom(
-                    fromRadio.moduleConfig.serial
-                )
-            elif fromRadio.moduleConfig.HasField("external_notification"):
-                self.localNode.moduleConfig.external_notification.CopyFrom(
-                    fromRadio.moduleConfig.external_notification
-                )
-            elif fromRadio.moduleConfig.HasField("store_forward"):
-                self.localNode.moduleConfig.store_forward.CopyFrom(
-                    fromRadio.moduleConfig.store_forward
-                )
-            elif fromRadio.moduleConfig.HasField("range_test"):
-                self.localNode.moduleConfig.range_test.CopyFrom(
-                    fromRadio.moduleConfig.range_test
-                )
-            elif fromRadio.moduleConfig.HasField("telemetry"):
-                self.localNode.moduleConfig.telemetry.CopyFrom(
-                    fromRadio.moduleConfig.telemetry
-                )
-            elif fromRadio.moduleConfig.HasField("canned_message"):
-                self.localNode.moduleConfig.canned_message.CopyFrom(
-                    fromRadio.moduleConfig.canned_message
-                )
-            elif fromRadio.moduleConfig.HasField("audio"):
-                self.localNode.moduleConfig.audio.CopyFrom(fromRadio.moduleConfig.audio)
-            elif fromRadio.moduleConfig.HasField("remote_hardware"):
-                self.localNode.moduleConfig.remote_hardware.CopyFrom(
-                    fromRadio.moduleConfig.remote_hardware
-                )
-            elif fromRadio.moduleConfig.HasField("neighbor_info"):
-                self.localNode.moduleConfig.neighbor_info.CopyFrom(
-                    fromRadio.moduleConfig.neighbor_info
-                )
-            elif fromRadio.moduleConfig.HasField("detection_sensor"):
-                self.localNode.moduleConfig.detection_sensor.CopyFrom(
-                    fromRadio.moduleConfig.detection_sensor
-                )
-            elif fromRadio.moduleConfig.HasField("ambient_lighting"):
-                self.localNode.moduleConfig.ambient_lighting.CopyFrom(
-                    fromRadio.moduleConfig.ambient_lighting
-                )
-            elif fromRadio.moduleConfig.HasField("paxcounter"):
-                self.localNode.moduleConfig.paxcounter.CopyFrom(
-                    fromRadio.moduleConfig.paxcounter
-                )
+        elif fromRadio.WhichOneof("payload_variant") in CONFIG_SECTIONS:
+            self._handleConfigFromRadio(fromRadio)
 
         else:
             logging.debug("Unexpected FromRadio payload")
 
+    def _handleConfigFromRadio(self, fromRadio) -> None:
+        """Store a config or moduleConfig section the device sent us in localNode
+
+        Publishes meshtastic.config.updated(section, config, module), where config
+        is the updated section protobuf of localNode."""
+        kind = fromRadio.WhichOneof("payload_variant")
+        self._download.sections.add((kind, getattr(fromRadio, kind).WhichOneof("payload_variant")))
+        stored = storeConfigSection(self.localNode, fromRadio, onlyChanged=self._download.fromCache)
+        if stored is not None:  # not if the cached section was right already
+            section, config = stored
+            self._publish("meshtastic.config.updated", section=section, config=config, module=kind == "moduleConfig")
+        self._checkConfigReady()
+
     def _fixupPosition(self, position: Dict) -> Dict:
         """Convert integer lat/lon into floats
 
@@ -1002,12 +1259,39 @@ class MeshInterface:
         if nodeNum == BROADCAST_NUM:
             raise MeshInterface.MeshInterfaceError("Can not create/find nodenum by the broadcast num")
 
-        if nodeNum in self.nodesByNum:
-            return self.nodesByNum[nodeNum]
-        else:
-            n = {"num": nodeNum}  # Create a minimal node db entry
-            self.nodesByNum[nodeNum] = n
-            return n
+        n = self.nodesByNum.get(nodeNum)
+        if n is None:
+            # Create a minimal node db entry, setdefault() so racing threads agree on the one we keep
+            n = self.nodesByNum.setdefault(nodeNum, self._nodeView(NodeRecord(nodeNum)))
+        elif not isinstance(n, NodeView):  # a node dict someone put in the DB
+            n = self.nodesByNum[nodeNum] = self._nodeView(NodeRecord.fromDict({"num": nodeNum, **n}))
+            if n.record.id and self.nodes is not None:
+                self.nodes[n.record.id] = n
+        return n
+
+    def _nodeView(self, record: NodeRecord) -> NodeView:
+        """The view of a node record that goes in our node DB"""
+        return NodeView(record, self.lastReceived)
+
+    def _nodeChanged(self, node: NodeRecord) -> None:
+        """Have our nodeStore save a node, call this after changing it
+
+        The store writes nodes by a background thread, a node marked before
+        the change might be written (and forgotten) before it."""
+        if self.nodeStore is not None and self.myInfo is not None:
+            self.nodeStore.markDirty(self.myInfo.my_node_num, node)
+
+    def _loadStoredNodes(self) -> None:
+        """Start the node DB with what our nodeStore knows about our device's mesh"""
+        if self.nodeStore is None or self.myInfo is None or self.nodesByNum is None or self.nodes is None:
+            return
+        stored = self.nodeStore.load(self.myInfo.my_node_num)
+        self._download.expectedNodes = len(stored) or None
+        for num, record in stored.items():
+            node = self.nodesByNum[num] = self._nodeView(record)
+            if record.id:
+                self.nodes[record.id] = node
+        logging.debug(f"Loaded {len(stored)} nodes from the node store")
 
     def _handleChannel(self, channel):
         """During initial config the local node will proactively send all N (8) channels it knows"""
@@ -1028,8 +1312,15 @@ class MeshInterface:
         - meshtastic.receive.position(packet = MeshPacket dictionary)
         - meshtastic.receive.user(packet = MeshPacket dictionary)
         - meshtastic.receive.data(packet = MeshPacket dictionary)
+
+        In rawPackets mode the packet is a RawPacket instead, see _handleRawPacketFromRadio()
         """
-        asDict = google.protobuf.json_format.MessageToDict(meshPacket)
+        if self.rawPackets:
+            self._handleRawPacketFromRadio(meshPacket, hack)
+            return
+
+        # Fields are only converted to their MessageToDict form when someone looks at them
+        asDict = LazyMessageDict(meshPacket)
 
         # We normally decompose the payload into a dictionary so that the client
         # doesn't need to understand protobufs.  But advanced clients might
@@ -1049,6 +1340,9 @@ class MeshInterface:
         if "to" not in asDict:
             asDict["to"] = 0
 
+        # duplicates still update our node DB and answer our requests, they are only not published
+        duplicate = self._isDuplicate(meshPacket)
+
         # /add fromId and toId fields based on the node ID
         try:
             asDict["fromId"] = self._nodeNumToId(asDict["from"])
@@ -1059,12 +1353,15 @@ class MeshInterface:
         except Exception as ex:
             logging.warning(f"Not populating toId {ex}")
 
+        topic, handler = self._packetTopic(meshPacket)
+        wanted = self._isWanted(topic, meshPacket, publish=not duplicate)
+        if not wanted and (handler is None or handler.onReceive is None):
+            return  # nobody listens and the packet doesn't change the node DB
+
         # We could provide our objects as DotMaps - which work with . notation or as dictionaries
         # asObj = DotMap(asDict)
-        topic = "meshtastic.receive"  # Generic unknown packet type
-
         decoded = None
-        portnum = portnums_pb2.PortNum.Name(portnums_pb2.PortNum.UNKNOWN_APP)
+        portnum = _UNKNOWN_APP_NAME
         if "decoded" in asDict:
             decoded = asDict["decoded"]
             # The default MessageToDict converts byte arrays into base64 strings.
@@ -1078,29 +1375,17 @@ class MeshInterface:
             if "portnum" not in decoded:
                 decoded["portnum"] = portnum
                 logging.warning(f"portnum was not in decoded. Setting to:{portnum}")
-            else:
-                portnum = decoded["portnum"]
-
-            topic = f"meshtastic.receive.data.{portnum}"
 
             # decode position protobufs and update nodedb, provide decoded version
-            # as "position" in the published msg move the following into a 'decoders'
-            # API that clients could register?
-            portNumInt = meshPacket.decoded.portnum  # we want portnum as an int
-            handler = protocols.get(portNumInt)
-            # The decoded protobuf as a dictionary (if we understand this message)
-            p = None
+            # as "position" in the published msg (see meshtastic.protocols)
             if handler is not None:
-                topic = f"meshtastic.receive.{handler.name}"
-
-                # Convert to protobuf if possible
-                if handler.protobufFactory is not None:
-                    pb = handler.protobufFactory()
-                    pb.ParseFromString(meshPacket.decoded.payload)
-                    p = google.protobuf.json_format.MessageToDict(pb)
-                    asDict["decoded"][handler.name] = p
-                    # Also provide the protobuf raw
-                    asDict["decoded"][handler.name]["raw"] = pb
+                # Convert to protobuf (or whatever the protocol decoder gives us) if possible
+                if self._shouldDecode(handler, wanted):
+                    payload = meshPacket.decoded.payload
+                    if handler.lazyDecode:
+                        decoded.setLazy(handler.name, lambda: decodedAsDict(handler.decode(payload)))
+                    else:
+                        decoded[handler.name] = decodedAsDict(handler.decode(payload))
 
                 # Call specialized onReceive if necessary
                 if handler.onReceive is not None:
@@ -1112,16 +1397,203 @@ class MeshInterface:
                 logging.debug(f"Got a response for requestId {requestId}")
                 # We ignore ACK packets, but send NAKs and data responses to the handlers
                 routing = decoded.get("routing")
-                isAck = routing is not None and ("errorReason" not in routing or routing["errorReason"] == "NONE")
+                errorReason = routing.get("errorReason", "NONE") if routing is not None else None
+                isAck = errorReason == "NONE"
                 if not isAck:
                     # we keep the responseHandler in dict until we get a non ack
-                    handler = self.responseHandlers.pop(requestId, None)
-                    if handler is not None:
-                        if not isAck or (isAck and handler.__name__ == "onAckNak"):
+                    responseHandler = self.responses.popHandler(requestId)
+                    if responseHandler is not None:
+                        if not isAck or (isAck and responseHandler.__name__ == "onAckNak"):
                             logging.debug(f"Calling response handler for requestId {requestId}")
-                            handler.callback(asDict)
+                            self._callResponseHandler(responseHandler.callback, asDict)
+                self.responses.resolveFuture(requestId, asDict["from"], errorReason, asDict)
+
+        if wanted and not duplicate:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(f"Publishing {topic}: packet={stripnl(asDict)} ")
+            self._deliverPacket(topic, getattr(meshPacket, "from"), asDict)
+            self._dispatchPacket(topic, meshPacket, asDict)
+
+    def _handleRawPacketFromRadio(self, meshPacket, hack=False):
+        """Handle a MeshPacket in rawPackets mode
+
+        Works from the protobuf fields alone and publishes a RawPacket on the
+        same topics _handlePacketFromRadio() would use.  Response handlers are
+        still called with a packet dictionary, but it is only built for them.
+        """
+        fromNum = getattr(meshPacket, "from")
+        # from might be missing if the nodenum was zero.
+        if not hack and not fromNum:
+            logging.error(f"Device returned a packet we sent, ignoring: {stripnl(meshPacket)}")
+            print(f"Error: Device returned a packet we sent, ignoring: {stripnl(meshPacket)}")
+            return
+
+        duplicate = self._isDuplicate(meshPacket)
+
+        # _nodeNumToId() gives None for nodes we don't know
+        fromId = self._nodeNumToId(fromNum)
+        toId = self._nodeNumToId(meshPacket.to)
+
+        topic, handler = self._packetTopic(meshPacket)
+        wanted = self._isWanted(topic, meshPacket, publish=not duplicate)
+        if not wanted and (handler is None or handler.onReceiveRaw is None):
+            return  # nobody listens and the packet doesn't change the node DB
+
+        portnum = meshPacket.decoded.portnum
+        pb = None
+        if handler is not None and self._shouldDecode(handler, wanted):
+            pb = handler.decode(meshPacket.decoded.payload)
+
+        packet = RawPacket(meshPacket, fromId, toId, portnum, pb)
+        if handler is not None and handler.onReceiveRaw is not None:
+            handler.onReceiveRaw(self, packet)
+
+        # Is this message in response to a request, if so, look for a handler
+        requestId = meshPacket.decoded.request_id
+        if requestId:
+            logging.debug(f"Got a response for requestId {requestId}")
+            # We ignore ACK packets, but send NAKs and data responses to the handlers
+            errorReason = None
+            if portnum == portnums_pb2.PortNum.ROUTING_APP and pb is not None:
+                errorReason = mesh_pb2.Routing.Error.Name(pb.error_reason)
+            isAck = errorReason == "NONE"
+            if not isAck:
+                responseHandler = self.responses.popHandler(requestId)
+                if responseHandler is not None:
+                    logging.debug(f"Calling response handler for requestId {requestId}")
+                    self._callResponseHandler(responseHandler.callback, packet.toDict())
+            self.responses.resolveFuture(requestId, fromNum, errorReason, packet)
+
+        if wanted and not duplicate:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(f"Publishing {topic}: packet={stripnl(meshPacket)} ")
+            self._deliverPacket(topic, getattr(meshPacket, "from"), packet)
+            self._dispatchPacket(topic, meshPacket, packet)
+
+    def _isDuplicate(self, meshPacket) -> bool:
+        """Check a packet against our duplicateFilter, publishing duplicates if it wants us to
+
+        The filter may be shared with other interfaces, so this only decides
+        whether we publish the packet: every interface still updates its node
+        DB and resolves its requests from it."""
+        dedup = self.duplicateFilter
+        if dedup is None or not dedup.isDuplicate(getattr(meshPacket, "from"), meshPacket.id):
+            return False
+        logging.debug(f"Ignoring duplicate packet {meshPacket.id:08x}")
+        topic = "meshtastic.receive.duplicate"
+        if dedup.publishDuplicates and (self._hasListeners(topic) or self._packetIterators.wants(topic)):
+            if self.rawPackets:
+                packet: Any = RawPacket(meshPacket, None, None, meshPacket.decoded.portnum)
+            else:
+                packet = LazyMessageDict(meshPacket)
+                packet["raw"] = meshPacket
+            self._deliverPacket(topic, getattr(meshPacket, "from"), packet)
+        return True
+
+    @staticmethod
+    def _packetTopic(meshPacket) -> Tuple[str, Optional[KnownProtocol]]:
+        """The topic a received packet is published on, and the protocol that handles it (if any)"""
+        if not meshPacket.HasField("decoded"):
+            return "meshtastic.receive", None  # Generic unknown packet type
+        portnum = meshPacket.decoded.portnum
+        handler = protocols.get(portnum)
+        if handler is not None:
+            return handler.topic, handler
+        return protocols.dataTopic(portnum), None
+
+    def _isWanted(self, topic: str, meshPacket, publish: bool=True) -> bool:
+        """Does anyone want to see this packet, a listener or a response handler
+
+        Only response handlers count if we won't publish the packet (a duplicate)"""
+        if publish and (self._hasListeners(topic) or self._packetIterators.wants(topic)):
+            return True
+        if publish and self.dispatcher and self.dispatcher.match(meshPacket):
+            return True
+        requestId = meshPacket.decoded.request_id
+        return requestId != 0 and self.responses.waitsFor(requestId)
+
+    @staticmethod
+    def _shouldDecode(handler: KnownProtocol, wanted: bool) -> bool:
+        """Should we parse the payload of a packet for this protocol
+
+        If nobody wants the packet we only get here to update the node DB"""
+        if handler.protobufFactory is None and handler.decoder is None:
+            return False
+        return wanted or not handler.decodeOnlyIfSubscribed
+
+    def _hasListeners(self, topic: str) -> bool:
+        """Is anyone subscribed to topic, or one of its parent topics"""
+        return topicListeners.hasListeners(topic)
+
+    def _deliverPacket(self, topic: str, nodeNum: int, packet) -> None:
+        """Hand a received packet to our packet iterators and pubsub subscribers"""
+        self._packetIterators.offer(topic, packet)
+        if self._hasListeners(topic):
+            self._publish(topic, nodeNum=nodeNum, packet=packet)
+
+    def _dispatchPacket(self, topic: str, meshPacket, packet) -> None:
+        """Hand a received packet to the subscriptions of our dispatcher that want it"""
+        if not self.dispatcher:
+            return
+        subscriptions = self.dispatcher.match(meshPacket)
+        if subscriptions:
+            self._queuePublish(
+                topic, getattr(meshPacket, "from"), lambda: PacketDispatcher.deliver(subscriptions, packet, self)
+            )
+
+    def subscribe(
+        self,
+        callback: Callable,
+        fromNum: Optional[int]=None,
+        toNum: Optional[int]=None,
+        portnum: Optional[int]=None,
+        channel: Optional[int]=None,
+        wantAck: Optional[bool]=None,
+    ) -> Subscription:
+        """Call callback(packet, interface) for the received packets that match all the given fields
+
+        Keyword Arguments:
+            fromNum -- Only packets from this node number. (default: {None})
+            toNum -- Only packets to this node number. (default: {None})
+            portnum -- Only packets for this PortNum. (default: {None})
+            channel -- Only packets on this channel index. (default: {None})
+            wantAck -- Only packets that do (or don't) want an ack. (default: {None})
+
+        Callbacks get the packets pubsub subscribers would, on our publisher
+        thread.  Unlike with pubsub, packets for other nodes/ports/channels
+        cost these subscriptions next to nothing, see meshtastic.dispatcher.
+        Call cancel() on the returned Subscription to stop.
+        """
+        return self.dispatcher.subscribe(callback, fromNum, toNum, portnum, channel, wantAck)
 
-        logging.debug(f"Publishing {topic}: packet={stripnl(asDict)} ")
-        publishingThread.queueWork(
-            lambda: pub.sendMessage(topic, packet=asDict, interface=self)
+    def packets(
+        self,
+        topics: Optional[List[str]]=None,
+        filter: Optional[Callable[[Any], bool]]=None,  # pylint: disable=W0622
+        maxsize: int=1000,
+    ) -> PacketIterator:
+        """Return a thread safe iterator over the packets we receive from now on
+
+        Keyword Arguments:
+            topics -- Only packets published on these topics (or their subtopics).
+                      (default: {["meshtastic.receive"]})
+            filter -- Only packets for which filter(packet) is True, it runs on our
+                      reader thread. (default: {None})
+            maxsize -- How many packets to buffer for a slow consumer before dropping
+                       the oldest ones. (default: {1000})
+
+        Packets are the same dictionaries (or RawPackets) pubsub subscribers get.
+        The iterator ends when it is closed or this interface disconnects.
+        """
+        return self._packetIterators.add(PacketIterator(topics, filter, maxsize, onClose=self._packetIterators.remove))
+
+    def asyncPackets(
+        self,
+        topics: Optional[List[str]]=None,
+        filter: Optional[Callable[[Any], bool]]=None,  # pylint: disable=W0622
+        maxsize: int=1000,
+    ) -> AsyncPacketIterator:
+        """Like packets(), but returns an async iterator, call this from the event loop it is used on"""
+        return self._packetIterators.add(
+            AsyncPacketIterator(asyncio.get_running_loop(), topics, filter, maxsize, onClose=self._packetIterators.remove)
         )
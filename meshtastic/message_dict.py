@@ -0,0 +1,267 @@
+"""Lazy dictionary views of protobuf messages
+
+google.protobuf.json_format.MessageToDict walks and converts every field of a
+message up front.  On the receive path most of those fields are never looked
+at, so LazyMessageDict only records which fields are set and converts each one
+(in exactly the MessageToDict format) the first time it is accessed.
+
+Packet dictionaries are handed to subscribers on other threads, so values are
+converted before they are published into the dict: a reader never sees a
+placeholder, even while another thread converts the same key.
+"""
+import base64
+import math
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import google.protobuf.message
+from google.protobuf.descriptor import FieldDescriptor
+
+try:
+    from google.protobuf.internal.type_checkers import ToShortestFloat
+except ImportError:  # pragma: no cover - only very old protobuf releases lack this
+    ToShortestFloat = float  # type: ignore[assignment]
+
+
+_SCALAR_CONVERSIONS: Dict[int, Callable[[Any], Any]] = {
+    FieldDescriptor.CPPTYPE_BOOL: bool,
+    FieldDescriptor.CPPTYPE_INT64: str,  # MessageToDict gives 64 bit integers as strings
+    FieldDescriptor.CPPTYPE_UINT64: str,
+}
+_FLOAT_TYPES = (FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE)
+
+
+def _isRepeated(field: FieldDescriptor) -> bool:
+    isRepeated = getattr(field, "is_repeated", None)  # protobuf >= 5.29 dropped .label
+    if isRepeated is not None:
+        return isRepeated
+    return field.label == FieldDescriptor.LABEL_REPEATED  # type: ignore[attr-defined]
+
+
+def _mapValueField(field: FieldDescriptor) -> Optional[FieldDescriptor]:
+    """The value field of a map field's entries, None if field is not a map"""
+    messageType = field.message_type
+    if field.type != FieldDescriptor.TYPE_MESSAGE or messageType is None or not messageType.GetOptions().map_entry:
+        return None
+    return messageType.fields_by_name["value"]
+
+
+def _convertValue(field: FieldDescriptor, value):
+    """Convert a single (non repeated) field value like MessageToDict does"""
+    cppType = field.cpp_type
+    if cppType == FieldDescriptor.CPPTYPE_MESSAGE:
+        return LazyMessageDict(value)
+    if cppType == FieldDescriptor.CPPTYPE_ENUM:
+        enumType = field.enum_type
+        enumValue = enumType.values_by_number.get(value, None) if enumType is not None else None
+        return enumValue.name if enumValue is not None else value
+    if cppType == FieldDescriptor.CPPTYPE_STRING:
+        return base64.b64encode(value).decode("utf-8") if field.type == FieldDescriptor.TYPE_BYTES else str(value)
+    conversion = _SCALAR_CONVERSIONS.get(cppType)
+    if conversion is not None:
+        return conversion(value)
+    if cppType in _FLOAT_TYPES:
+        return _convertFloat(cppType, value)
+    return value
+
+
+def _convertFloat(cppType: int, value: float):
+    """Convert a float or double field value like MessageToDict does"""
+    if math.isinf(value):
+        return "-Infinity" if value < 0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    if cppType == FieldDescriptor.CPPTYPE_FLOAT:
+        return ToShortestFloat(value)
+    return value
+
+
+def _convertField(field: FieldDescriptor, value):
+    """Convert a field (which might be repeated or a map) like MessageToDict does"""
+    valueField = _mapValueField(field)
+    if valueField is not None:
+        result = {}
+        for key in value:
+            if isinstance(key, bool):
+                jsonKey = "true" if key else "false"
+            else:
+                jsonKey = str(key)
+            result[jsonKey] = _convertValue(valueField, value[key])
+        return result
+    if _isRepeated(field):
+        return [_convertValue(field, v) for v in value]
+    return _convertValue(field, value)
+
+
+# Guards publishing converted values, conversions themselves run without it
+_lock = threading.Lock()
+
+
+class LazyMessageDict(dict):
+    """A dict holding a protobuf message in MessageToDict form, filled in on access
+
+    Keys for all set fields exist from the start, their values are converted
+    the first time they are read.  Anything that looks at the whole dictionary
+    (iteration, printing, json.dumps, comparisons, copies) converts everything
+    that is left.  Nested messages are LazyMessageDicts too.
+    """
+
+    __slots__ = ("_pending",)
+
+    def __init__(self, message):
+        self._pending = {field.json_name: (field, value) for field, value in message.ListFields()}
+        # The keys go in right away (with a placeholder value) so that the key order and
+        # len() are right, and C code that checks the size (i.e. json) sees we're not empty
+        super().__init__(dict.fromkeys(self._pending))
+
+    def setLazy(self, key, factory: Callable[[], Any]) -> None:
+        """Add a key whose value is factory(), called the first time the key is read"""
+        with _lock:
+            self._pending[key] = (None, factory)
+            dict.__setitem__(self, key, None)
+
+    @staticmethod
+    def _convert(field, value):
+        return value() if field is None else _convertField(field, value)
+
+    def _publish(self, key, entry, value) -> None:
+        """Replace the placeholder of key by its converted value, unless someone beat us to it
+
+        The value goes in before the key leaves _pending, readers check _pending first."""
+        if self._pending.get(key) is entry:
+            dict.__setitem__(self, key, value)
+            del self._pending[key]
+
+    def _materialize(self, key) -> None:
+        entry = self._pending.get(key)
+        if entry is None:
+            return
+        value = self._convert(*entry)
+        with _lock:
+            self._publish(key, entry, value)
+
+    def _materializeAll(self) -> None:
+        """Convert every remaining field"""
+        if self._pending:
+            pending = dict(self._pending)
+            converted = {key: self._convert(*entry) for key, entry in pending.items()}
+            with _lock:
+                for key, value in converted.items():
+                    self._publish(key, pending[key], value)
+
+    def __getitem__(self, key):
+        if key in self._pending:
+            self._materialize(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self._pending:
+            self._materialize(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value) -> None:
+        with _lock:
+            self._pending.pop(key, None)
+            dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key) -> None:
+        with _lock:
+            self._pending.pop(key, None)
+            dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self._pending:
+            self._materialize(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key in self._pending:
+            self._materialize(key)
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs) -> None:  # pylint: disable=W0221
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        with _lock:
+            self._pending.clear()
+            dict.clear(self)
+
+    def popitem(self):
+        self._materializeAll()
+        return dict.popitem(self)
+
+    def __iter__(self):
+        self._materializeAll()
+        return dict.__iter__(self)
+
+    def __reversed__(self):
+        self._materializeAll()
+        return dict.__reversed__(self)
+
+    def keys(self):
+        self._materializeAll()
+        return dict.keys(self)
+
+    def values(self):
+        self._materializeAll()
+        return dict.values(self)
+
+    def items(self):
+        self._materializeAll()
+        return dict.items(self)
+
+    def copy(self) -> dict:
+        self._materializeAll()
+        return dict(dict.items(self))
+
+    def __eq__(self, other) -> bool:
+        self._materializeAll()
+        if isinstance(other, LazyMessageDict):
+            other._materializeAll()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __or__(self, other):
+        result = self.copy()
+        result.update(other)
+        return result
+
+    def __ror__(self, other):
+        result = dict(other)
+        result.update(self.items())
+        return result
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __repr__(self) -> str:
+        self._materializeAll()
+        return dict.__repr__(self)
+
+    __str__ = __repr__
+
+    def __reduce__(self):
+        # Copies and pickles are plain dicts, there is no message to be lazy about any more
+        return (dict, (self.copy(),))
+
+    def __reduce_ex__(self, protocol):
+        return self.__reduce__()
+
+
+def decodedAsDict(decoded: Any) -> Any:
+    """How a decoded payload appears in a packet dictionary
+
+    Protobufs are converted to a dictionary that also has the protobuf itself
+    in "raw", anything else a protocol decoder returned is used as is."""
+    if isinstance(decoded, google.protobuf.message.Message):
+        asDict = LazyMessageDict(decoded)
+        asDict["raw"] = decoded
+        return asDict
+    return decoded
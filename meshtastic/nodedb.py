@@ -0,0 +1,470 @@
+"""The node database kept by interfaces
+
+Every node we know about is kept in a NodeRecord: a fixed set of typed
+fields (its number, node ID, names, position, device metrics, what we heard
+from it last), so a node costs the same however much it talks.  Code reads
+nodes through interface.nodesByNum (and interface.nodes, keyed by node ID),
+which hold a read-only NodeView of each record.  Views look like the
+MessageToDict of a NodeInfo, as node DB entries always did:
+
+    node = iface.nodesByNum[nodeNum]
+    print(node["user"]["longName"], node.get("position", {}).get("latitude"))
+    print(node["lastReceived"]["decoded"])  # the last packet from the node
+
+The dicts a view hands out are built when asked for, node.toDict() is a
+plain (json serializable) copy of the lot.
+
+Those dicts of views are NodeDicts, which can safely be iterated by other
+threads while the reader thread adds nodes to them.
+
+Give an interface a NodeStore and what it learns about nodes survives
+restarts:
+
+    iface = SerialInterface(nodeStore=NodeStore("~/.meshtastic/nodes.db"))
+"""
+import base64
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import google.protobuf.json_format
+import google.protobuf.message
+
+from meshtastic import config_pb2, mesh_pb2, telemetry_pb2
+
+
+def _compactDict(value):
+    """A plain dict copy of a (maybe lazy) dict, without the raw protobufs the receive path adds"""
+    if not isinstance(value, dict):
+        return value
+    return {k: _compactDict(v) for k, v in value.items() if k != "raw"}
+
+
+def _asMessage(value, messageType):
+    """A protobuf of messageType holding value, a protobuf or its MessageToDict style dict
+
+    Dicts of the receive path have the protobuf they were made from in "raw".
+    We always make a copy, a sub-message would keep the message it is part of alive."""
+    message = messageType()
+    if isinstance(value, google.protobuf.message.Message):
+        message.CopyFrom(value)
+    elif isinstance(value.get("raw"), messageType):
+        message.CopyFrom(value["raw"])
+    else:
+        google.protobuf.json_format.ParseDict(_compactDict(dict(value)), message, ignore_unknown_fields=True)
+    return message
+
+
+def _enumName(enumType, number: int):
+    """The name of an enum value like MessageToDict gives it, the number if we don't know it"""
+    value = enumType.DESCRIPTOR.values_by_number.get(number)
+    return number if value is None else value.name
+
+
+def _sizeOf(value) -> int:
+    """sys.getsizeof of a field value, protobufs counted with their serialized size"""
+    size = sys.getsizeof(value)
+    if isinstance(value, google.protobuf.message.Message):
+        size += value.ByteSize()
+    return size
+
+
+class NodeRecord:
+    """What we know about one node
+
+    Fields are None until we know them.  They are set from the protobufs the
+    device sends us or, for nodes read back from a NodeStore, from the
+    MessageToDict style dicts of toDict().  Anything else is dropped, and the
+    only packet kept is the last one we got from the node.
+    """
+
+    __slots__ = (
+        "num", "id", "longName", "shortName", "macaddr", "hwModel", "isLicensed", "role",
+        "position", "deviceMetrics", "snr", "lastHeard", "channel", "viaMqtt", "hopsAway", "isFavorite",
+        "hopLimit", "lastPacket",
+    )
+
+    _SCALARS = ("snr", "lastHeard", "channel", "viaMqtt", "hopsAway", "isFavorite", "hopLimit")
+    """The fields that are stored as they are, by their NodeInfo dict key"""
+
+    def __init__(self, num: int) -> None:
+        self.num: int = num
+        # from the node's User, id is interned and not None once we have one
+        self.id: Optional[str] = None
+        self.longName: Optional[str] = None
+        self.shortName: Optional[str] = None
+        self.macaddr: Optional[bytes] = None
+        self.hwModel: int = 0
+        self.isLicensed: bool = False
+        self.role: int = 0
+        self.position: Optional[mesh_pb2.Position] = None
+        self.deviceMetrics: Optional[telemetry_pb2.DeviceMetrics] = None
+        self.snr: Optional[float] = None
+        self.lastHeard: Optional[int] = None
+        self.channel: Optional[int] = None
+        self.viaMqtt: Optional[bool] = None
+        self.hopsAway: Optional[int] = None
+        self.isFavorite: Optional[bool] = None
+        self.hopLimit: Optional[int] = None
+        self.lastPacket: Optional[mesh_pb2.MeshPacket] = None  # the last packet we got from the node
+
+    @classmethod
+    def fromDict(cls, node: Dict[str, Any]) -> "NodeRecord":
+        """Make a record from a NodeInfo dictionary, like toDict() returns"""
+        record = cls(node["num"])
+        if "user" in node:
+            record.setUser(node["user"])
+        if "position" in node:
+            record.setPosition(node["position"])
+        if "deviceMetrics" in node:
+            record.setDeviceMetrics(node["deviceMetrics"])
+        for key in cls._SCALARS:
+            if node.get(key) is not None:
+                setattr(record, key, node[key])
+        return record
+
+    def toDict(self) -> Dict[str, Any]:
+        """A plain (json serializable) NodeInfo dict of this record, without lastReceived"""
+        return NodeView(self).toDict()
+
+    def setUser(self, user) -> None:
+        """Set the User of the node, a protobuf or its MessageToDict style dict"""
+        user = _asMessage(user, mesh_pb2.User)
+        self.longName = user.long_name or None
+        self.shortName = user.short_name or None
+        self.macaddr = user.macaddr or None
+        self.hwModel = user.hw_model
+        self.isLicensed = user.is_licensed
+        self.role = user.role
+        self.id = sys.intern(user.id)
+
+    def setPosition(self, position) -> None:
+        """Set the Position of the node, a protobuf or its MessageToDict style dict
+
+        Dicts may give the position in degrees (latitude/longitude, as
+        MeshInterface._fixupPosition() adds them) instead of latitudeI/longitudeI."""
+        if not isinstance(position, google.protobuf.message.Message) and "raw" not in position:
+            position = dict(position)
+            for key in ("latitude", "longitude"):
+                if position.get(key) is not None and f"{key}I" not in position:
+                    position[f"{key}I"] = round(position[key] * 1e7)
+        self.position = _asMessage(position, mesh_pb2.Position)
+
+    def setDeviceMetrics(self, deviceMetrics) -> None:
+        """Set the DeviceMetrics of the node, a protobuf or its MessageToDict style dict"""
+        self.deviceMetrics = _asMessage(deviceMetrics, telemetry_pb2.DeviceMetrics)
+
+    def setNodeInfo(self, nodeInfo: mesh_pb2.NodeInfo) -> None:
+        """Update the record from a NodeInfo the device sent
+
+        Fields the NodeInfo doesn't have are kept, i.e. what a NodeStore knew."""
+        if nodeInfo.HasField("user"):
+            self.setUser(nodeInfo.user)
+        if nodeInfo.HasField("position"):
+            self.setPosition(nodeInfo.position)
+        if nodeInfo.HasField("device_metrics"):
+            self.setDeviceMetrics(nodeInfo.device_metrics)
+        for key, value in (
+            ("snr", nodeInfo.snr),
+            ("lastHeard", nodeInfo.last_heard),
+            ("channel", nodeInfo.channel),
+            ("viaMqtt", nodeInfo.via_mqtt),
+            ("hopsAway", nodeInfo.hops_away),
+            ("isFavorite", nodeInfo.is_favorite),
+        ):
+            if value:
+                setattr(self, key, value)
+
+    def heard(
+        self,
+        meshPacket: Optional[mesh_pb2.MeshPacket],
+        lastHeard: Optional[int],
+        snr: Optional[float],
+        hopLimit: Optional[int],
+    ) -> None:
+        """Note that we got a packet from the node, with its rxTime, rxSnr and hopLimit (None if not set)"""
+        if meshPacket is not None:
+            self.lastPacket = meshPacket
+        self.lastHeard = lastHeard
+        self.snr = snr
+        self.hopLimit = hopLimit
+
+    def memoryUsage(self) -> int:
+        """About how many bytes this record takes, including the values it holds"""
+        size = sys.getsizeof(self)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                size += _sizeOf(value)
+        return size
+
+    def __repr__(self) -> str:
+        return f"NodeRecord({self.toDict()!r})"
+
+
+class NodeView(Mapping):
+    """A read-only view of a NodeRecord as a NodeInfo dict, with the keys MessageToDict gives
+
+    Only the fields the record has are in the view.  Besides the NodeInfo
+    fields it has hopLimit and lastReceived (the packet dictionary of the
+    last packet from the node, if it was given a way to build that).  The
+    values are built on every lookup, changing them doesn't change the node.
+    """
+
+    __slots__ = ("record", "_lastReceived")
+
+    _KEYS = (
+        "num", "user", "position", "snr", "lastHeard", "deviceMetrics", "channel", "viaMqtt", "hopsAway",
+        "isFavorite", "hopLimit", "lastReceived",
+    )
+
+    def __init__(self, record: NodeRecord, lastReceived: Optional[Callable[[int], Optional[Dict[str, Any]]]]=None) -> None:
+        """Constructor
+
+        Arguments:
+            record -- the node
+
+        Keyword Arguments:
+            lastReceived -- funct(nodeNum) building the packet dictionary of the node's
+                            lastPacket, see MeshInterface.lastReceived() (default: {None})
+        """
+        self.record = record
+        self._lastReceived = lastReceived
+
+    def _has(self, key: str) -> bool:
+        record = self.record
+        if key == "user":
+            return record.id is not None
+        if key == "lastReceived":
+            return record.lastPacket is not None and self._lastReceived is not None
+        return getattr(record, key, None) is not None
+
+    def _userDict(self) -> Dict[str, Any]:
+        record = self.record
+        user: Dict[str, Any] = {}
+        for key, value in (
+            ("id", record.id),
+            ("longName", record.longName),
+            ("shortName", record.shortName),
+            ("macaddr", record.macaddr and base64.b64encode(record.macaddr).decode()),
+            ("hwModel", record.hwModel and _enumName(mesh_pb2.HardwareModel, record.hwModel)),
+            ("isLicensed", record.isLicensed),
+            ("role", record.role and _enumName(config_pb2.Config.DeviceConfig.Role, record.role)),
+        ):
+            if value:
+                user[key] = value
+        return user
+
+    def __getitem__(self, key: str):
+        if not isinstance(key, str) or key not in self._KEYS or not self._has(key):
+            raise KeyError(key)
+        if key == "user":
+            return self._userDict()
+        if key == "lastReceived":
+            return self._lastReceived(self.record.num)  # type: ignore[misc]
+        value = getattr(self.record, key)
+        if key == "position":
+            position = google.protobuf.json_format.MessageToDict(value)
+            for name in ("latitude", "longitude"):
+                if f"{name}I" in position:
+                    position[name] = position[f"{name}I"] * 1e-7
+            return position
+        if key == "deviceMetrics":
+            return google.protobuf.json_format.MessageToDict(value)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and key in self._KEYS and self._has(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self._KEYS if self._has(key))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def toDict(self) -> Dict[str, Any]:
+        """A plain (json serializable) dict copy, without lastReceived"""
+        return {key: self[key] for key in self if key != "lastReceived"}
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.toDict()!r})"
+
+
+class NodeDict(dict):
+    """A dict of nodes that can be iterated while the reader thread adds to it
+
+    Changes take a writer lock and bump version.  Iterating (and keys(),
+    values(), items()) goes over a snapshot: a copy made the first time it is
+    asked for after a change and shared until the next one, so readers never
+    see "dictionary changed size during iteration" and don't hold up writers
+    for more than one copy.  Snapshots are of which nodes there are, the
+    NodeViews in them show the live records.
+    """
+
+    __slots__ = ("version", "_lock", "_snapshot", "_snapshotVersion")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._snapshot: Dict[Any, Any] = {}
+        self._snapshotVersion = -1
+
+    def snapshot(self) -> Dict[Any, Any]:
+        """A consistent copy of the dict as it is now, don't change it"""
+        snapshot = self._snapshot
+        if self._snapshotVersion != self.version:
+            with self._lock:
+                snapshot = dict(dict.items(self))
+                self._snapshot = snapshot
+                self._snapshotVersion = self.version
+        return snapshot
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            dict.__setitem__(self, key, value)
+            self.version += 1
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            dict.__delitem__(self, key)
+            self.version += 1
+
+    def setdefault(self, key, default=None):
+        """Atomic, so two threads creating the same node end up with the same one"""
+        with self._lock:
+            if key in self:
+                return dict.__getitem__(self, key)
+            dict.__setitem__(self, key, default)
+            self.version += 1
+            return default
+
+    def pop(self, key, *default):
+        with self._lock:
+            self.version += 1
+            return dict.pop(self, key, *default)
+
+    def popitem(self):
+        with self._lock:
+            self.version += 1
+            return dict.popitem(self)
+
+    def update(self, *args, **kwargs) -> None:  # pylint: disable=W0221
+        with self._lock:
+            dict.update(self, *args, **kwargs)
+            self.version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            dict.clear(self)
+            self.version += 1
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def copy(self) -> Dict[Any, Any]:
+        return dict(self.snapshot())
+
+    def __reduce__(self):
+        return (self.__class__, (self.copy(),))
+
+
+class NodeStore:
+    """Keeps node DBs in an SQLite file, so interfaces can start with what they knew last time
+
+    Node DBs are stored per local node (by myInfo.my_node_num), several
+    interfaces (also to different devices) can share a store.  Interfaces
+    mark the records they change, a background thread writes them every
+    flushInterval seconds in one transaction.
+    """
+
+    def __init__(self, path: str, flushInterval: float=5.0):
+        self.path = os.path.expanduser(path)
+        self.flushInterval = flushInterval
+        self.writes = 0
+        """How many records we've written"""
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "owner INTEGER NOT NULL, num INTEGER NOT NULL, updated REAL NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (owner, num))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()  # for the database
+        self._dirtyLock = threading.Lock()  # only held briefly, the reader thread takes it
+        self._dirty: Dict[Tuple[int, int], NodeRecord] = {}
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self, owner: int) -> Dict[int, NodeRecord]:
+        """The nodes we have stored for the local node owner, by node number"""
+        with self._lock:
+            rows = self._db.execute("SELECT num, data FROM nodes WHERE owner = ?", (owner,)).fetchall()
+        nodes = {}
+        for num, data in rows:
+            try:
+                nodes[num] = NodeRecord.fromDict(json.loads(data))
+            except ValueError as ex:
+                logging.warning(f"Ignoring stored node {num:08x} we can't read: {ex}")
+        return nodes
+
+    def markDirty(self, owner: int, record: NodeRecord) -> None:
+        """Remember to write a changed record with the next flush"""
+        with self._dirtyLock:
+            self._dirty[(owner, record.num)] = record
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="meshtastic node store", daemon=True)
+            self._thread.start()
+
+    def flush(self) -> None:
+        """Write the changed records now"""
+        with self._dirtyLock:
+            dirty, self._dirty = self._dirty, {}
+        with self._lock:
+            if not dirty or self._closed:
+                return
+            now = time.time()
+            rows = [(owner, num, now, json.dumps(record.toDict())) for (owner, num), record in dirty.items()]
+            with self._db:  # one transaction for the lot
+                self._db.executemany("INSERT OR REPLACE INTO nodes (owner, num, updated, data) VALUES (?, ?, ?, ?)", rows)
+            self.writes += len(rows)
+
+    def forget(self, owner: int) -> None:
+        """Remove everything stored about the node DB of owner"""
+        with self._dirtyLock:
+            self._dirty = {key: record for key, record in self._dirty.items() if key[0] != owner}
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM nodes WHERE owner = ?", (owner,))
+
+    def close(self) -> None:
+        """Write what is left and close the file"""
+        self.flush()
+        self._closed = True
+        self._wakeup.set()
+        with self._lock:
+            self._db.close()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flushInterval)
+            try:
+                self.flush()
+            except sqlite3.Error as ex:
+                logging.error(f"Could not write the node store {self.path}: {ex}")
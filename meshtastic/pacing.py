@@ -0,0 +1,105 @@
+"""Write pacing policies for stream links
+
+A pacer decides when the next write to the radio may go out.  StreamInterface
+calls waitToWrite() before each write, wrote() after it, and passes along
+feedback from the device (QueueStatus replies) via onQueueStatus().  The
+device only answers ToRadio messages carrying a MeshPacket with a
+QueueStatus, wrote() is told if the write had one.
+
+Interfaces serviced by a StreamReactor can't block, they ask writeDelay()
+how long to wait and try again then (or when a QueueStatus arrives).
+"""
+import threading
+import time
+
+
+class WritePacer:
+    """Base pacing policy, never waits (used for links that don't need pacing, i.e. TCP)"""
+
+    def waitToWrite(self) -> None:
+        """Block until the next write may be sent"""
+
+    def writeDelay(self) -> float:
+        """Seconds until the next write may be sent (0 if now), without blocking"""
+        return 0.0
+
+    def wrote(self, nbytes: int, expectsReply: bool=True) -> None:  # pylint: disable=W0613
+        """Called after nbytes were written to the device, expectsReply if the device answers them with a QueueStatus"""
+
+    def onQueueStatus(self, queueStatus) -> None:  # pylint: disable=W0613
+        """Called when the device reports its TX queue status"""
+
+
+class FixedDelayPacer(WritePacer):
+    """Keep at least delay seconds between writes
+
+    Unlike a sleep after every write, this only blocks a writer that comes
+    along before the delay has passed."""
+
+    def __init__(self, delay: float=0.1):
+        self.delay = delay
+        self._lastWrite = 0.0
+        self._lock = threading.Lock()
+
+    def waitToWrite(self) -> None:
+        with self._lock:
+            remaining = self._lastWrite + self.delay - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def writeDelay(self) -> float:
+        with self._lock:
+            return max(0.0, self._lastWrite + self.delay - time.monotonic())
+
+    def wrote(self, nbytes: int, expectsReply: bool=True) -> None:
+        with self._lock:
+            self._lastWrite = time.monotonic()
+
+
+class QueueStatusPacer(WritePacer):
+    """Pace writes by device feedback
+
+    After a write the device answers (one with a MeshPacket) we wait until
+    it sends its QueueStatus (so we know it has consumed what we sent) but
+    never longer than maxDelay, which covers old firmware.  Writes the device
+    doesn't answer (heartbeats, want_config...) don't wait for anything.  We
+    also keep at least minDelay between writes."""
+
+    def __init__(self, maxDelay: float=0.1, minDelay: float=0.0):
+        self.maxDelay = maxDelay
+        self.minDelay = minDelay
+        self._lastWrite = 0.0
+        self._awaitingFeedback = False
+        self._cond = threading.Condition()
+
+    def waitToWrite(self) -> None:
+        with self._cond:
+            if self._awaitingFeedback:
+                timeout = self._lastWrite + self.maxDelay - time.monotonic()
+                if timeout > 0:
+                    self._cond.wait_for(lambda: not self._awaitingFeedback, timeout)
+                self._awaitingFeedback = False
+            remaining = self._lastWrite + self.minDelay - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def writeDelay(self) -> float:
+        with self._cond:
+            now = time.monotonic()
+            delay = 0.0
+            if self._awaitingFeedback:
+                delay = self._lastWrite + self.maxDelay - now
+                if delay <= 0:
+                    self._awaitingFeedback = False  # no feedback coming, like waitToWrite() timing out
+            return max(0.0, delay, self._lastWrite + self.minDelay - now)
+
+    def wrote(self, nbytes: int, expectsReply: bool=True) -> None:
+        with self._cond:
+            self._lastWrite = time.monotonic()
+            if expectsReply:
+                self._awaitingFeedback = True
+
+    def onQueueStatus(self, queueStatus) -> None:
+        with self._cond:
+            self._awaitingFeedback = False
+            self._cond.notify_all()
@@ -0,0 +1,210 @@
+"""Pull based access to received packets
+
+Instead of subscribing a callback with pypubsub, ask an interface for an
+iterator over the packets it receives:
+
+    with iface.packets(topics=["meshtastic.receive.text"]) as packets:
+        for packet in packets:
+            print(packet["decoded"]["text"])
+
+or, from a coroutine:
+
+    async for packet in iface.asyncPackets(filter=lambda p: p["from"] == nodeNum):
+        ...
+
+Interfaces hand packets to their iterators on the thread that read them, an
+iterator only keeps the packets on its topics that pass its filter.  Each
+iterator has its own bounded buffer, when a slow consumer falls maxsize
+packets behind the oldest ones are dropped (and counted).
+"""
+import asyncio
+import collections
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class PacketIterator:
+    """A thread safe iterator over the packets an interface receives
+
+    Iteration blocks until the next packet arrives and ends once the
+    iterator is closed (by close() or because the interface disconnected)
+    and the packets already buffered have been consumed.
+    """
+
+    def __init__(
+        self,
+        topics: Optional[Iterable[str]]=None,
+        filter: Optional[Callable[[Any], bool]]=None,  # pylint: disable=W0622
+        maxsize: int=1000,
+        onClose: Optional[Callable[["PacketIterator"], None]]=None,
+    ):
+        """Constructor, normally called by MeshInterface.packets()
+
+        Keyword Arguments:
+            topics -- Only keep packets published on these topics (or their subtopics).
+                      (default: {["meshtastic.receive"]})
+            filter -- Only keep packets for which filter(packet) is True. It runs on the
+                      interface's reader thread, so it should be quick. (default: {None})
+            maxsize -- How many packets to buffer before dropping the oldest, 0 for no
+                       limit. (default: {1000})
+            onClose -- Called with the iterator when it is closed. (default: {None})
+        """
+        self.topics = list(topics) if topics is not None else ["meshtastic.receive"]
+        self._prefixes = tuple(topic + "." for topic in self.topics)
+        self.filter = filter
+        self.maxsize = maxsize
+        self.onClose = onClose
+        self.received = 0
+        """How many packets were buffered"""
+        self.dropped = 0
+        """How many of those were dropped because the consumer fell behind"""
+        self.closed = False
+        self._buffer: collections.deque = collections.deque()
+        self._cond = threading.Condition()
+
+    def wants(self, topic: str) -> bool:
+        """Would we keep packets published on topic (if they pass the filter)"""
+        return not self.closed and (topic in self.topics or topic.startswith(self._prefixes))
+
+    def offer(self, topic: str, packet) -> bool:
+        """Buffer a packet if it is on our topics and passes our filter, returns True if it was"""
+        if not self.wants(topic):
+            return False
+        if self.filter is not None:
+            try:
+                if not self.filter(packet):
+                    return False
+            except Exception as ex:
+                logging.error(f"Packet iterator filter failed, ignoring packet: {ex}")
+                return False
+        with self._cond:
+            if 0 < self.maxsize <= len(self._buffer):
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(packet)
+            self.received += 1
+            self._cond.notify()
+        self._wakeup()
+        return True
+
+    def get(self, timeout: Optional[float]=None):
+        """Wait for the next packet, returns None on timeout or once we are closed and empty"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._buffer or self.closed, timeout)
+            return self._buffer.popleft() if self._buffer else None
+
+    def close(self) -> None:
+        """Stop buffering packets, iteration ends once the buffered ones are consumed"""
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify_all()
+        self._wakeup()
+        if self.onClose is not None:
+            self.onClose(self)
+
+    def stats(self) -> Dict[str, int]:
+        """How many packets are buffered, were buffered in total, and were dropped"""
+        return {"depth": len(self._buffer), "received": self.received, "dropped": self.dropped}
+
+    def _wakeup(self) -> None:
+        """Called after a packet arrived or we were closed, for subclasses"""
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        packet = self.get()
+        if packet is None:
+            raise StopIteration
+        return packet
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncPacketIterator(PacketIterator):
+    """A PacketIterator for coroutines, packets can be offered from any thread"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, *args, **kwargs):
+        """Constructor, normally called by MeshInterface.asyncPackets() on the event loop"""
+        super().__init__(*args, **kwargs)
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def _wakeup(self) -> None:
+        if not self._ready.is_set():
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                pass  # the loop is closed, nobody is waiting any more
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            self._ready.clear()
+            with self._cond:
+                if self._buffer:
+                    return self._buffer.popleft()
+                if self.closed:
+                    raise StopAsyncIteration
+            await self._ready.wait()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PacketIterators:
+    """The packet iterators of an interface
+
+    Handing out packets doesn't lock: the list is replaced, not changed, when
+    iterators come and go.
+    """
+
+    def __init__(self) -> None:
+        self._iterators: List[PacketIterator] = []
+        self._lock = threading.Lock()
+
+    def add(self, iterator: PacketIterator) -> Any:
+        """Start handing packets to iterator, until it is removed (pass remove as its onClose)"""
+        with self._lock:
+            self._iterators = self._iterators + [iterator]
+        return iterator
+
+    def remove(self, iterator: PacketIterator) -> None:
+        """Stop handing packets to iterator"""
+        with self._lock:
+            self._iterators = [i for i in self._iterators if i is not iterator]
+
+    def wants(self, topic: str) -> bool:
+        """Does one of our iterators take packets on topic"""
+        return any(iterator.wants(topic) for iterator in self._iterators)
+
+    def offer(self, topic: str, packet) -> None:
+        """Hand a received packet to all our iterators, each keeps it if it wants it"""
+        for iterator in self._iterators:
+            iterator.offer(topic, packet)
+
+    def close(self) -> None:
+        """End all our iterators"""
+        for iterator in self._iterators:
+            iterator.close()
+
+    def __iter__(self):
+        return iter(self._iterators)
+
+    def __len__(self) -> int:
+        return len(self._iterators)
@@ -0,0 +1,170 @@
+"""A single threaded reactor that services many stream interfaces
+
+By default every StreamInterface runs its own reader thread and a heartbeat
+timer thread.  Pass the same StreamReactor to several interfaces and one
+selectors loop reads from all of their serial ports/sockets, does the framing
+and runs their heartbeats instead:
+
+    reactor = StreamReactor()
+    radios = [SerialInterface(port, reactor=reactor) for port in ports]
+
+Nothing on the reactor thread may block, or every radio waits: writes are
+paced with reactor timers instead of sleeps, and response handlers run on
+the interfaces' publisher thread.
+
+Selecting on serial ports needs a POSIX system, sockets work everywhere.
+"""
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Tuple
+
+
+class ReactorTimer:
+    """A callback scheduled on a StreamReactor, can be cancelled like a threading.Timer"""
+
+    def __init__(self, reactor: "StreamReactor", deadline: float, callback: Callable):
+        self.reactor = reactor
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the timer if it hasn't run yet"""
+        self.cancelled = True
+
+
+class StreamReactor:
+    """Owns one selectors loop that reads from all registered interfaces"""
+
+    def __init__(self, name: str="meshtastic reactor"):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.RLock()
+        self._timers: List[Tuple[float, int, ReactorTimer]] = []
+        self._timerSeq = itertools.count()
+        self._interfaces: Dict[int, object] = {}
+        self._wantExit = False
+        # select() can only be woken up by a file descriptor, so keep a socketpair for that
+        self._wakeRead, self._wakeWrite = socket.socketpair()
+        self._wakeRead.setblocking(False)
+        self._selector.register(self._wakeRead, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, args=(), name=name, daemon=True)
+        self._thread.start()
+
+    def register(self, iface) -> None:
+        """Start reading from an interface, called by StreamInterface.connect()"""
+        with self._lock:
+            self._selector.register(iface._fileno(), selectors.EVENT_READ, iface)
+            self._interfaces[id(iface)] = iface
+        self._wakeup()
+
+    def unregister(self, iface) -> bool:
+        """Stop reading from an interface, returns False if it was not registered"""
+        with self._lock:
+            if self._interfaces.pop(id(iface), None) is None:
+                return False
+            try:
+                self._selector.unregister(iface._fileno())
+            except (KeyError, ValueError, OSError):
+                # the fd might already be closed, so find it by our registration instead
+                for key in list(self._selector.get_map().values()):
+                    if key.data is iface:
+                        self._selector.unregister(key.fileobj)
+        self._wakeup()
+        return True
+
+    def isRegistered(self, iface) -> bool:
+        """Is this interface currently serviced by us"""
+        with self._lock:
+            return id(iface) in self._interfaces
+
+    def inThread(self) -> bool:
+        """Are we running on the reactor thread"""
+        return threading.current_thread() is self._thread
+
+    def callSoon(self, callback: Callable) -> ReactorTimer:
+        """Run callback on the reactor thread as soon as it gets to it"""
+        return self.callLater(0.0, callback)
+
+    def callLater(self, delay: float, callback: Callable) -> ReactorTimer:
+        """Run callback on the reactor thread after delay seconds"""
+        timer = ReactorTimer(self, time.monotonic() + delay, callback)
+        with self._lock:
+            heapq.heappush(self._timers, (timer.deadline, next(self._timerSeq), timer))
+        self._wakeup()
+        return timer
+
+    def close(self) -> None:
+        """Stop the reactor thread, interfaces should be closed first"""
+        self._wantExit = True
+        self._wakeup()
+        if self._thread != threading.current_thread():
+            self._thread.join()
+        self._selector.close()
+        self._wakeRead.close()
+        self._wakeWrite.close()
+
+    def _wakeup(self) -> None:
+        if threading.current_thread() is not self._thread:
+            try:
+                self._wakeWrite.send(b"\0")
+            except OSError:
+                pass  # the reactor is closed, or already has a wakeup pending
+
+    def _nextTimeout(self):
+        with self._lock:
+            while self._timers and self._timers[0][2].cancelled:
+                heapq.heappop(self._timers)
+            if not self._timers:
+                return None
+            return max(0.0, self._timers[0][0] - time.monotonic())
+
+    def _runTimers(self) -> None:
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                due.append(heapq.heappop(self._timers)[2])
+        for timer in due:
+            if not timer.cancelled:
+                try:
+                    timer.callback()
+                except (Exception, SystemExit) as ex:  # one radio's callback mustn't stop the others
+                    logging.error(f"Unexpected error in reactor timer {ex}")
+                    traceback.print_exc()
+
+    def _service(self, iface) -> None:
+        """Read what an interface has for us and handle the complete frames"""
+        try:
+            b = iface._readAvailable()
+            if not b:
+                # select() said readable but there is nothing, the other end went away
+                raise OSError("stream closed")
+            iface._handleFrames(b)
+        except Exception as ex:
+            if self.unregister(iface):
+                if not iface._wantExit:
+                    logging.warning(f"Meshtastic stream disconnected, disconnecting... {ex}")
+                iface._disconnected()
+
+    def _run(self) -> None:
+        logging.debug("in StreamReactor._run()")
+        while not self._wantExit:
+            events = self._selector.select(self._nextTimeout())
+            for key, _mask in events:
+                if key.data is None:
+                    try:
+                        self._wakeRead.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                if not self.isRegistered(key.data):
+                    continue  # closed while we were selecting
+                self._service(key.data)  # without our lock, other threads may register/write meanwhile
+            self._runTimers()
+        logging.debug("reactor is exiting")
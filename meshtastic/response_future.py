@@ -0,0 +1,87 @@
+"""Futures for the responses to our requests
+
+MeshInterface.sendRequest() and the request helpers built on it send a packet
+and return a ResponseFuture, which the interface resolves when the answer to
+that packet (by its request ID) arrives:
+
+    futures = [iface.requestTelemetry(nodeNum, timeout=60) for nodeNum in fleet]
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            print(future.result()["decoded"]["telemetry"])
+        except ResponseError as ex:
+            print(f"{ex.packet['from']} said {ex.errorReason}")
+
+Any number of requests can be outstanding at the same time.  A
+ResponseFuture is also awaitable, from coroutines on any event loop:
+
+    reply = await iface.requestPosition(nodeNum, timeout=60)
+"""
+import asyncio
+import concurrent.futures
+from typing import Any
+
+from meshtastic import mesh_pb2
+
+_InvalidStateError = getattr(concurrent.futures, "InvalidStateError", RuntimeError)  # python 3.8+
+
+
+class ResponseError(Exception):
+    """The mesh NAKed a request, errorReason is the name of the Routing.Error"""
+
+    def __init__(self, errorReason: str, packet: Any=None):
+        super().__init__(f"Request failed: {errorReason}")
+        self.errorReason = errorReason
+        self.packet = packet
+        """The routing packet that carried the NAK"""
+
+
+class ResponseFuture(concurrent.futures.Future):
+    """The outcome of a request we sent, resolved by the interface that sent it
+
+    The result is the packet that answered the request, as it would be
+    published (a packet dictionary, or a RawPacket in rawPackets mode).
+    Requests sent with wantResponse are answered by the response, requests
+    sent only with wantAck by the ACK of the destination (or, for broadcasts,
+    the implicit ACK of our own node).  A NAK fails the future with a
+    ResponseError, a timeout with concurrent.futures.TimeoutError.
+    Cancelling the future forgets the request.
+    """
+
+    def __init__(self, packet: mesh_pb2.MeshPacket, wantAck: bool=False, wantResponse: bool=False):
+        super().__init__()
+        self.packet = packet
+        """The MeshPacket we sent"""
+        self.wantAck = wantAck
+        self.wantResponse = wantResponse
+
+    @property
+    def requestId(self) -> int:
+        """The ID of the packet we sent, which the answer refers to"""
+        return self.packet.id
+
+    def resolve(self, packet) -> bool:
+        """Set the answer, returns False if the future was done already (cancelled)"""
+        try:
+            if self.done():
+                return False
+            self.set_result(packet)
+        except _InvalidStateError:
+            return False
+        return True
+
+    def fail(self, exception: BaseException) -> bool:
+        """Fail the request, returns False if the future was done already"""
+        try:
+            if self.done():
+                return False
+            self.set_exception(exception)
+        except _InvalidStateError:
+            return False
+        return True
+
+    def expire(self) -> None:
+        """Fail the request because its answer didn't arrive in time"""
+        self.fail(concurrent.futures.TimeoutError(f"No answer to request {self.requestId:08x}"))
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
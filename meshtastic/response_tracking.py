@@ -0,0 +1,195 @@
+"""Keeping track of the requests waiting for an answer
+
+MeshInterface.sendData() can register a response handler for a packet and
+sendRequest() returns a ResponseFuture, both wait for a packet referring to
+the request ID.  A ResponseTracker keeps them by request ID and gives up on
+them after a timeout.  It doesn't know the interface it works for, whatever
+it needs from it is passed to its constructor.
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+from meshtastic import BROADCAST_NUM, ResponseHandler
+from meshtastic.response_future import ResponseError, ResponseFuture
+from meshtastic.util import ExpiryQueue
+
+
+class ResponseTracker:
+    """The response handlers and request futures of an interface, and their expiry
+
+    All outstanding requests share one timer, for the earliest deadline.
+    """
+
+    def __init__(
+        self,
+        startTimer: Callable[..., Any],
+        callHandler: Callable[[Callable, Any], None],
+        localNodeNum: Callable[[], int],
+    ) -> None:
+        """Constructor
+
+        Arguments:
+            startTimer -- funct(interval, callback, daemon) starting a timer, returns
+                          something with a cancel() method, see MeshInterface._startTimer()
+            callHandler -- funct(handler, packet) calling a response handler with the
+                           packet answering its request, see MeshInterface._callResponseHandler()
+            localNodeNum -- funct() returning the node number of our device
+        """
+        self._startTimer = startTimer
+        self._callHandler = callHandler
+        self._localNodeNum = localNodeNum
+        self.handlers: Dict[int, ResponseHandler] = {}  # A map from request ID to the handler
+        self.futures: Dict[int, ResponseFuture] = {}  # A map from request ID to the future of sendRequest()
+        self.timeout: Optional[float] = None  # seconds until we give up on unanswered requests, None for never
+        self.expired: int = 0  # how many requests got no answer in time
+        self._expiry: ExpiryQueue = ExpiryQueue()  # request ID -> deadline (time.monotonic())
+        self._timer: Optional[Any] = None  # from startTimer(), for the earliest deadline
+        self._timerDeadline: float = 0.0
+        self._lock = threading.Lock()
+
+    def addHandler(self, requestId: int, callback: Callable, onExpire: Optional[Callable]=None) -> None:
+        """Call callback with the packet answering requestId, or onExpire(requestId) if none came in time"""
+        now = time.monotonic()
+        expires = None
+        if self.timeout is not None:
+            expires = now + self.timeout
+        self.handlers[requestId] = ResponseHandler(callback, now, expires, onExpire)
+        if self.timeout is not None:
+            self._expireAfter(requestId, self.timeout)
+
+    def popHandler(self, requestId: int) -> Optional[ResponseHandler]:
+        """Remove the handler of a request that was answered"""
+        responseHandler = self.handlers.pop(requestId, None)
+        if responseHandler is not None and responseHandler.expires is not None:
+            with self._lock:
+                self._expiry.discard(requestId)
+        return responseHandler
+
+    def addFuture(self, future: ResponseFuture, timeout: Optional[float]=None) -> None:
+        """Resolve future with the answer to its request, expire it after timeout seconds (default: {timeout})"""
+        self.futures[future.requestId] = future
+        future.add_done_callback(self._forgetFuture)
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None:
+            self._expireAfter(future.requestId, timeout)
+
+    def _forgetFuture(self, future: concurrent.futures.Future) -> None:
+        """Done callback of our futures, also called when they are cancelled or expire"""
+        if isinstance(future, ResponseFuture) and self.futures.get(future.requestId) is future:
+            self.futures.pop(future.requestId, None)
+            with self._lock:
+                self._expiry.discard(future.requestId)
+
+    def resolveFuture(self, requestId: int, fromNum: int, errorReason: Optional[str], packet) -> None:
+        """Resolve the future of a request with a packet that refers to it
+
+        errorReason is the Routing.Error name if packet is a routing message
+        (an ACK or NAK), None for a data response."""
+        future = self.futures.get(requestId)
+        if future is None:
+            return
+        if errorReason is not None and errorReason != "NONE":
+            future.fail(ResponseError(errorReason, packet))
+            return
+        if errorReason is not None:  # an ACK
+            if future.wantResponse:
+                return  # the response is still to come
+            localNum = self._localNodeNum()
+            if fromNum == localNum and future.packet.to not in (BROADCAST_NUM, localNum):
+                return  # only an implicit ACK, the destination's own ACK (or a NAK) follows
+        future.resolve(packet)
+
+    def waitsFor(self, requestId: int) -> bool:
+        """Is a handler or future waiting for the answer to requestId"""
+        return requestId in self.handlers or requestId in self.futures
+
+    def packetDone(self, packetId: int, txFuture: concurrent.futures.Future) -> None:
+        """Called once the TX queue is done with a packet, a request whose packet didn't go out won't get an answer"""
+        if txFuture.cancelled():
+            return
+        error = txFuture.exception()
+        if error is None:
+            return
+        logging.warning(f"Packet ID {packetId:08x} was not sent: {error}")
+        self.popHandler(packetId)
+        future = self.futures.get(packetId)
+        if future is not None:
+            future.fail(error)
+
+    def stats(self) -> Dict[str, int]:
+        """How many requests wait for an answer, and how many gave up waiting"""
+        return {
+            "outstanding": len(self.handlers) + len(self.futures),
+            "expired": self.expired,
+        }
+
+    def close(self, exception: BaseException) -> None:
+        """Fail all outstanding requests with exception and stop the timer, when the interface goes away"""
+        for future in list(self.futures.values()):
+            future.fail(exception)
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _expireAfter(self, requestId: int, timeout: float) -> None:
+        """Give up on the answer to requestId after timeout seconds, see _expire()"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._expiry.add(requestId, deadline)
+            self._armTimer()
+
+    def _armTimer(self) -> None:
+        """Make sure a timer runs at the earliest deadline, called with _lock held"""
+        deadline = self._expiry.nextDeadline()
+        if deadline is None:
+            return  # a timer still running will find nothing to do
+        if self._timer is not None:
+            if self._timerDeadline <= deadline:
+                return
+            self._timer.cancel()
+        self._timerDeadline = deadline
+        self._timer = self._startTimer(max(0.0, deadline - time.monotonic()), self._expire, daemon=True)
+
+    def _expire(self) -> None:
+        """Fail the requests whose deadline passed
+
+        Futures fail with a TimeoutError.  Response handlers are dropped, their
+        onExpire callback (if they have one) is called with the requestId.
+        The handlers themselves are never called, they can't tell our giving
+        up from a NAK the device sent."""
+        with self._lock:
+            self._timer = None
+            expired = self._expiry.popExpired(time.monotonic())
+            self._armTimer()
+        for requestId in expired:
+            future = self.futures.get(requestId)
+            if future is not None:
+                self.expired += 1
+                future.expire()
+            responseHandler = self.handlers.pop(requestId, None)
+            if responseHandler is not None:
+                self.expired += 1
+                if responseHandler.onExpire is None:
+                    logging.warning(f"No response for requestId {requestId} in time, dropping its response handler")
+                else:
+                    logging.debug(f"No response for requestId {requestId}, giving up")
+                    onExpire = responseHandler.onExpire
+                    self._callHandler(lambda r, onExpire=onExpire: self._callExpiryHandler(onExpire, r), requestId)
+
+    @staticmethod
+    def _callExpiryHandler(onExpire: Callable, requestId: int) -> None:
+        """Call onExpire(requestId), errors only get logged
+
+        This runs on our timer, so there is nobody to raise to.  That includes
+        SystemExit, i.e. from our_exit() in a handler written for the CLI."""
+        try:
+            onExpire(requestId)
+        except BaseException as ex:  # pylint: disable=W0718
+            logging.error(f"Unexpected error in expiry handler of requestId {requestId}: {ex!r}")
+            traceback.print_exc()
@@ -9,7 +9,13 @@ from typing import Optional
 import serial # type: ignore[import-untyped]
 
 import meshtastic.util
+from meshtastic.config_cache import ConfigCache
+from meshtastic.dedup import DuplicateFilter
+from meshtastic.nodedb import NodeStore
+from meshtastic.pacing import WritePacer
+from meshtastic.reactor import StreamReactor
 from meshtastic.stream_interface import StreamInterface
+from meshtastic.util import DeferredExecution
 
 if platform.system() != "Windows":
     import termios
@@ -18,13 +24,25 @@ if platform.system() != "Windows":
 class SerialInterface(StreamInterface):
     """Interface class for meshtastic devices over a serial link"""
 
-    def __init__(self, devPath: Optional[str]=None, debugOut=None, noProto=False, connectNow=True):
+    def __init__(self, devPath: Optional[str]=None, debugOut=None, noProto=False, connectNow=True,  # pylint: disable=R0913
+                 pacer: Optional[WritePacer]=None, reactor: Optional[StreamReactor]=None, rawPackets: bool=False,
+                 duplicateFilter: Optional[DuplicateFilter]=None, publisher: Optional[DeferredExecution]=None,
+                 nodeStore: Optional[NodeStore]=None, configCache: Optional[ConfigCache]=None,
+                 progressive: bool=False):
         """Constructor, opens a connection to a specified serial port, or if unspecified try to
         find one Meshtastic device by probing
 
         Keyword Arguments:
             devPath {string} -- A filepath to a device, i.e. /dev/ttyUSB0 (default: {None})
             debugOut {stream} -- If a stream is provided, any debug serial output from the device will be emitted to that stream. (default: {None})
+            pacer {WritePacer} -- Decides how long to wait between writes, see StreamInterface. (default: {None})
+            reactor {StreamReactor} -- Service this port from a shared reactor thread, POSIX only. (default: {None})
+            rawPackets {bool} -- Publish packets as RawPacket protobufs, see MeshInterface. (default: {False})
+            duplicateFilter {DuplicateFilter} -- Don't publish packets it has seen recently. (default: {None})
+            publisher {DeferredExecution} -- The thread(s) our pubsub messages are sent from, see MeshInterface. (default: {None})
+            nodeStore {NodeStore} -- Load/save what we learn about nodes there, see MeshInterface. (default: {None})
+            configCache {ConfigCache} -- Start with the device config cached there, see MeshInterface. (default: {None})
+            progressive {bool} -- Be connected before the node DB is complete, see MeshInterface. (default: {False})
         """
         self.noProto = noProto
 
@@ -62,14 +80,16 @@ class SerialInterface(StreamInterface):
         time.sleep(0.1)
 
         StreamInterface.__init__(
-            self, debugOut=debugOut, noProto=noProto, connectNow=connectNow
+            self, debugOut=debugOut, noProto=noProto, connectNow=connectNow, pacer=pacer, reactor=reactor,
+            rawPackets=rawPackets, duplicateFilter=duplicateFilter, publisher=publisher, nodeStore=nodeStore,
+            configCache=configCache, progressive=progressive,
         )
 
-    def close(self):
-        """Close a connection to the device"""
+    def close(self, flushTimeout: float=10.0):
+        """Close a connection to the device, see MeshInterface.close()"""
         self.stream.flush()
         time.sleep(0.1)
         self.stream.flush()
         time.sleep(0.1)
         logging.debug("Closing Serial stream")
-        StreamInterface.close(self)
+        StreamInterface.close(self, flushTimeout)
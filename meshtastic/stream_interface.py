@@ -1,30 +1,79 @@
 """Stream Interface base class
 """
+import collections
 import logging
 import threading
 import time
 import traceback
+from typing import Optional
 
 import serial # type: ignore[import-untyped]
 
+from meshtastic.framing import (  # pylint: disable=W0611
+    HEADER_LEN,
+    MAX_TO_FROM_RADIO_SIZE,
+    READ_CHUNK_SIZE,
+    START1,
+    START2,
+    FrameParser,
+    frameBytes,
+)
+from meshtastic.config_cache import ConfigCache
+from meshtastic.dedup import DuplicateFilter
+from meshtastic.nodedb import NodeStore
 from meshtastic.mesh_interface import MeshInterface
-from meshtastic.util import is_windows11, stripnl
+from meshtastic.pacing import QueueStatusPacer, WritePacer
+from meshtastic.reactor import StreamReactor
+from meshtastic.util import DeferredExecution, is_windows11, stripnl
 
-START1 = 0x94
-START2 = 0xC3
-HEADER_LEN = 4
-MAX_TO_FROM_RADIO_SIZE = 512
+
+class _TxFrame:
+    """A frame waiting to be written, and how writing it went"""
+
+    __slots__ = ("data", "expectsReply", "done", "error")
+
+    def __init__(self, data: bytes, expectsReply: bool):
+        self.data = data
+        self.expectsReply = expectsReply
+        self.done = False
+        self.error: Optional[Exception] = None
 
 
 class StreamInterface(MeshInterface):
     """Interface class for meshtastic devices over a stream link (serial, TCP, etc)"""
 
-    def __init__(self, debugOut=None, noProto=False, connectNow=True):
+    maxCoalescedWrite = HEADER_LEN + MAX_TO_FROM_RADIO_SIZE
+    """Frames queued up while we wait for the pacer are sent in writes of at most this size"""
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        debugOut=None,
+        noProto=False,
+        connectNow=True,
+        pacer: Optional[WritePacer]=None,
+        reactor: Optional[StreamReactor]=None,
+        rawPackets: bool=False,
+        duplicateFilter: Optional[DuplicateFilter]=None,
+        publisher: Optional[DeferredExecution]=None,
+        nodeStore: Optional[NodeStore]=None,
+        configCache: Optional[ConfigCache]=None,
+        progressive: bool=False,
+    ):
         """Constructor, opens a connection to self.stream
 
         Keyword Arguments:
             debugOut {stream} -- If a stream is provided, any debug serial output from the
                                  device will be emitted to that stream. (default: {None})
+            pacer {WritePacer} -- Decides how long to wait between writes. (default: a
+                                  QueueStatusPacer that waits at most 100ms, 1s on windows 11)
+            reactor {StreamReactor} -- If provided, that reactor reads from our stream and runs
+                                       our heartbeat, instead of threads of our own. (default: {None})
+            rawPackets {bool} -- Publish packets as RawPacket protobufs, see MeshInterface. (default: {False})
+            duplicateFilter {DuplicateFilter} -- Don't publish packets it has seen recently. (default: {None})
+            publisher {DeferredExecution} -- The thread(s) our pubsub messages are sent from, see MeshInterface. (default: {None})
+            nodeStore {NodeStore} -- Load/save what we learn about nodes there, see MeshInterface. (default: {None})
+            configCache {ConfigCache} -- Start with the device config cached there, see MeshInterface. (default: {None})
+            progressive {bool} -- Be connected before the node DB is complete, see MeshInterface. (default: {False})
 
         Raises:
             Exception: [description]
@@ -35,15 +84,30 @@ class StreamInterface(MeshInterface):
             raise Exception( # pylint: disable=W0719
                 "StreamInterface is now abstract (to update existing code create SerialInterface instead)"
             )
-        self._rxBuf = bytes()  # empty
+        self._framer = FrameParser(onDebugBytes=self._handleDebugBytes)
         self._wantExit = False
 
         self.is_windows11 = is_windows11()
 
-        # FIXME, figure out why daemon=True causes reader thread to exit too early
-        self._rxThread = threading.Thread(target=self.__reader, args=(), daemon=True)
-
-        MeshInterface.__init__(self, debugOut=debugOut, noProto=noProto)
+        if pacer is None:
+            # win11 might need a bit more time, otherwise give the TBeam a chance to work
+            pacer = QueueStatusPacer(maxDelay=1.0 if self.is_windows11 else 0.1)
+        self.pacer: WritePacer = pacer
+        self._txFrames: collections.deque = collections.deque()
+        self._txCond = threading.Condition()
+        self._txWriting = False
+        self._txTimer = None  # in reactor mode, when _flushFrames() tries again
+
+        self._reactor = reactor
+        self._rxThread: Optional[threading.Thread] = None
+        if reactor is None:
+            # FIXME, figure out why daemon=True causes reader thread to exit too early
+            self._rxThread = threading.Thread(target=self.__reader, args=(), daemon=True)
+
+        MeshInterface.__init__(
+            self, debugOut=debugOut, noProto=noProto, rawPackets=rawPackets, duplicateFilter=duplicateFilter,
+            publisher=publisher, nodeStore=nodeStore, configCache=configCache, progressive=progressive,
+        )
 
         # Start the reader thread after superclass constructor completes init
         if connectNow:
@@ -66,7 +130,10 @@ class StreamInterface(MeshInterface):
         self._writeBytes(p)
         time.sleep(0.1)  # wait 100ms to give device time to start running
 
-        self._rxThread.start()
+        if self._reactor is not None:
+            self._reactor.register(self)
+        else:
+            self._rxThread.start()
 
         self._startConfig()
 
@@ -77,6 +144,11 @@ class StreamInterface(MeshInterface):
         """We override the superclass implementation to close our port"""
         MeshInterface._disconnected(self)
 
+        with self._txCond:
+            unwritten = list(self._txFrames)
+            self._txFrames.clear()
+        self._framesDone(unwritten, MeshInterface.MeshInterfaceError("The link to the device was lost"))
+
         logging.debug("Closing our port")
         # pylint: disable=E0203
         if not self.stream is None:
@@ -90,12 +162,97 @@ class StreamInterface(MeshInterface):
         if self.stream:  # ignore writes when stream is closed
             self.stream.write(b)
             self.stream.flush()
-            # win11 might need a bit more time, too
-            if self.is_windows11:
-                time.sleep(1.0)
-            else:
-                # we sleep here to give the TBeam a chance to work
-                time.sleep(0.1)
+
+    def _writeFrame(self, frame, expectsReply=True):
+        """Write a frame, paced by self.pacer
+
+        The first thread to find the link idle does the writing, frames queued
+        by other threads while it waits on the pacer go out with its next write.
+        Every caller returns once its own frame was written, and gets the
+        exception if writing it failed.  expectsReply if the device answers the
+        frame with a QueueStatus, see WritePacer.wrote().
+
+        In reactor mode the reactor thread does all writing without blocking,
+        see _flushFrames().  Frames it queues itself (i.e. heartbeats) are
+        written later if the pacer says so, and errors are only logged."""
+        txFrame = _TxFrame(frame, expectsReply)
+        writer = False
+        with self._txCond:
+            self._txFrames.append(txFrame)
+            if self._reactor is None and not self._txWriting:
+                self._txWriting = writer = True
+        if self._reactor is not None:
+            if self._reactor.inThread():
+                self._flushFrames()
+                return
+            self._reactor.callSoon(self._flushFrames)
+        elif writer:
+            try:
+                while self._txFrames:
+                    try:
+                        self.pacer.waitToWrite()
+                    except Exception as ex:
+                        # everyone waiting for us gets the exception, like with a failed write
+                        logging.warning(f"Could not wait to write to the device: {ex}")
+                        with self._txCond:
+                            frames = list(self._txFrames)
+                            self._txFrames.clear()
+                        self._framesDone(frames, ex)
+                        break
+                    self._writeBatch()
+            finally:
+                with self._txCond:
+                    self._txWriting = False
+                    self._txCond.notify_all()
+        with self._txCond:
+            self._txCond.wait_for(lambda: txFrame.done)
+        if txFrame.error is not None:
+            raise txFrame.error
+
+    def _writeBatch(self):
+        """Write the first queued frame, with as many of the following ones as fit in one write"""
+        with self._txCond:
+            if not self._txFrames:
+                return
+            batch = [self._txFrames.popleft()]
+            size = len(batch[0].data)
+            while self._txFrames and size + len(self._txFrames[0].data) <= self.maxCoalescedWrite:
+                batch.append(self._txFrames.popleft())
+                size += len(batch[-1].data)
+        error = None
+        try:
+            self._writeBytes(b"".join(f.data for f in batch))
+            self.pacer.wrote(size, any(f.expectsReply for f in batch))
+        except Exception as ex:
+            logging.warning(f"Could not write to the device: {ex}")
+            error = ex
+        self._framesDone(batch, error)
+
+    def _framesDone(self, frames, error=None):
+        with self._txCond:
+            for f in frames:
+                f.error = error
+                f.done = True
+            self._txCond.notify_all()
+
+    def _flushFrames(self):
+        """Write the queued frames as far as the pacer lets us, on the reactor thread
+
+        Never blocks: if the pacer wants us to wait we try again then, or
+        when a QueueStatus arrives."""
+        while self._txFrames:
+            delay = self.pacer.writeDelay()
+            if delay > 0:
+                if self._txTimer is not None:
+                    self._txTimer.cancel()
+                self._txTimer = self._reactor.callLater(delay, self._flushFrames)
+                return
+            self._writeBatch()
+
+    def _waitForWrites(self, timeout=1.0):
+        """Wait for any queued frames to be written"""
+        with self._txCond:
+            return self._txCond.wait_for(lambda: not self._txWriting and not self._txFrames, timeout)
 
     def _readBytes(self, length):
         """Read an array of bytes from our stream"""
@@ -104,82 +261,103 @@ class StreamInterface(MeshInterface):
         else:
             return None
 
+    def _readAvailable(self):
+        """Read a chunk of bytes from our stream
+
+        Blocks until at least one byte arrives (or the stream times out), then
+        also takes whatever else the stream already has buffered."""
+        b = self._readBytes(1)
+        if b and self.stream:
+            waiting = getattr(self.stream, "in_waiting", 0)
+            if isinstance(waiting, int) and waiting > 0:
+                b += self._readBytes(min(waiting, READ_CHUNK_SIZE))
+        return b
+
     def _sendToRadioImpl(self, toRadio):
         """Send a ToRadio protobuf to the device"""
         logging.debug(f"Sending: {stripnl(toRadio)}")
         b = toRadio.SerializeToString()
-        bufLen = len(b)
-        # We convert into a string, because the TCP code doesn't work with byte arrays
-        header = bytes([START1, START2, (bufLen >> 8) & 0xFF, bufLen & 0xFF])
-        logging.debug(f"sending header:{header} b:{b}")
-        self._writeBytes(header + b)
-
-    def close(self):
-        """Close a connection to the device"""
+        logging.debug(f"sending b:{b}")
+        self._writeFrame(frameBytes(b), toRadio.HasField("packet"))
+
+    def _handleQueueStatusFromRadio(self, queueStatus) -> None:
+        MeshInterface._handleQueueStatusFromRadio(self, queueStatus)
+        self.pacer.onQueueStatus(queueStatus)
+        if self._reactor is not None:
+            if self._reactor.inThread():
+                self._flushFrames()
+            else:
+                self._reactor.callSoon(self._flushFrames)
+
+    def _callResponseHandler(self, callback, packet) -> None:
+        """In reactor mode response handlers run on our publisher, so they can't hold up the other radios"""
+        if self._reactor is not None and self._reactor.inThread():
+            # as important as anything we publish, if the publisher drops messages
+            self.publisher.queueWork(lambda: callback(packet), id(self), max(self.publishPriorities.values()))
+        else:
+            MeshInterface._callResponseHandler(self, callback, packet)
+
+    def close(self, flushTimeout: float=10.0):
+        """Close a connection to the device, see MeshInterface.close()"""
         logging.debug("Closing stream")
-        MeshInterface.close(self)
+        MeshInterface.close(self, flushTimeout)
+        self._waitForWrites()
         # pyserial cancel_read doesn't seem to work, therefore we ask the
         # reader thread to close things for us
         self._wantExit = True
-        if self._rxThread != threading.current_thread():
+        if self._reactor is not None:
+            if self._reactor.unregister(self):
+                self._disconnected()
+        elif self._rxThread is not None and self._rxThread != threading.current_thread():
             self._rxThread.join()  # wait for it to exit
 
+    def _onDeliveringThread(self) -> bool:
+        if self._reactor is not None:
+            return self._reactor.inThread()
+        return threading.current_thread() is self._rxThread
+
+    def _fileno(self):
+        """The file descriptor a reactor should select on"""
+        return self.stream.fileno()
+
+    def _txScheduler(self):
+        """In reactor mode the reactor thread sends our packets, _sendToRadioImpl() doesn't block there"""
+        if self._reactor is not None:
+            return self._reactor.callSoon
+        return None
+
+    def _startTimer(self, interval, callback, daemon=False):
+        """In reactor mode our timers run on the reactor thread"""
+        if self._reactor is not None:
+            return self._reactor.callLater(interval, callback)
+        return MeshInterface._startTimer(self, interval, callback, daemon)
+
+    def _handleDebugBytes(self, b):
+        """Pass along any device debug output that arrived outside of a frame"""
+        if self.debugOut is not None:
+            try:
+                self.debugOut.write(b.decode("utf-8", errors="replace"))
+            except:
+                self.debugOut.write("?")
+
+    def _handleFrames(self, b):
+        """Feed newly read bytes to our framer and handle any complete frames"""
+        for frame in self._framer.feed(b):
+            try:
+                self._handleFromRadio(frame)
+            except Exception as ex:
+                logging.error(f"Error while handling message from radio {ex}")
+                traceback.print_exc()
+
     def __reader(self):
         """The reader thread that reads bytes from our stream"""
         logging.debug("in __reader()")
-        empty = bytes()
 
         try:
             while not self._wantExit:
-                # logging.debug("reading character")
-                b = self._readBytes(1)
-                # logging.debug("In reader loop")
-                # logging.debug(f"read returned {b}")
-                if len(b) > 0:
-                    c = b[0]
-                    # logging.debug(f'c:{c}')
-                    ptr = len(self._rxBuf)
-
-                    # Assume we want to append this byte, fixme use bytearray instead
-                    self._rxBuf = self._rxBuf + b
-
-                    if ptr == 0:  # looking for START1
-                        if c != START1:
-                            self._rxBuf = empty  # failed to find start
-                            if self.debugOut is not None:
-                                try:
-                                    self.debugOut.write(b.decode("utf-8"))
-                                except:
-                                    self.debugOut.write("?")
-
-                    elif ptr == 1:  # looking for START2
-                        if c != START2:
-                            self._rxBuf = empty  # failed to find start2
-                    elif ptr >= HEADER_LEN - 1:  # we've at least got a header
-                        # logging.debug('at least we received a header')
-                        # big endian length follows header
-                        packetlen = (self._rxBuf[2] << 8) + self._rxBuf[3]
-
-                        if (
-                            ptr == HEADER_LEN - 1
-                        ):  # we _just_ finished reading the header, validate length
-                            if packetlen > MAX_TO_FROM_RADIO_SIZE:
-                                self._rxBuf = (
-                                    empty  # length was out out bounds, restart
-                                )
-
-                        if len(self._rxBuf) != 0 and ptr + 1 >= packetlen + HEADER_LEN:
-                            try:
-                                self._handleFromRadio(self._rxBuf[HEADER_LEN:])
-                            except Exception as ex:
-                                logging.error(
-                                    f"Error while handling message from radio {ex}"
-                                )
-                                traceback.print_exc()
-                            self._rxBuf = empty
-                else:
-                    # logging.debug(f"timeout")
-                    pass
+                b = self._readAvailable()
+                if b is not None and len(b) > 0:
+                    self._handleFrames(b)
         except serial.SerialException as ex:
             if (
                 not self._wantExit
@@ -4,24 +4,47 @@ import logging
 import socket
 from typing import Optional
 
-from meshtastic.stream_interface import StreamInterface
+from meshtastic.config_cache import ConfigCache
+from meshtastic.dedup import DuplicateFilter
+from meshtastic.nodedb import NodeStore
+from meshtastic.pacing import QueueStatusPacer, WritePacer
+from meshtastic.reactor import StreamReactor
+from meshtastic.stream_interface import READ_CHUNK_SIZE, StreamInterface
+from meshtastic.util import DeferredExecution
 
 
 class TCPInterface(StreamInterface):
     """Interface class for meshtastic devices over a TCP link"""
 
-    def __init__(
+    def __init__(  # pylint: disable=R0913
         self,
         hostname: str,
         debugOut=None,
         noProto=False,
         connectNow=True,
         portNumber=4403,
+        pacer: Optional[WritePacer]=None,
+        reactor: Optional[StreamReactor]=None,
+        rawPackets: bool=False,
+        duplicateFilter: Optional[DuplicateFilter]=None,
+        publisher: Optional[DeferredExecution]=None,
+        nodeStore: Optional[NodeStore]=None,
+        configCache: Optional[ConfigCache]=None,
+        progressive: bool=False,
     ):
         """Constructor, opens a connection to a specified IP address/hostname
 
         Keyword Arguments:
             hostname {string} -- Hostname/IP address of the device to connect to
+            pacer {WritePacer} -- Decides how long to wait between writes (default: a QueueStatusPacer
+                                  that waits at most 100ms for the device to answer a packet)
+            reactor {StreamReactor} -- Service this connection from a shared reactor thread (default: {None})
+            rawPackets {bool} -- Publish packets as RawPacket protobufs, see MeshInterface. (default: {False})
+            duplicateFilter {DuplicateFilter} -- Don't publish packets it has seen recently. (default: {None})
+            publisher {DeferredExecution} -- The thread(s) our pubsub messages are sent from, see MeshInterface. (default: {None})
+            nodeStore {NodeStore} -- Load/save what we learn about nodes there, see MeshInterface. (default: {None})
+            configCache {ConfigCache} -- Start with the device config cached there, see MeshInterface. (default: {None})
+            progressive {bool} -- Be connected before the node DB is complete, see MeshInterface. (default: {False})
         """
 
         self.stream = None
@@ -38,7 +61,18 @@ class TCPInterface(StreamInterface):
             self.socket = None
 
         StreamInterface.__init__(
-            self, debugOut=debugOut, noProto=noProto, connectNow=connectNow
+            self,
+            debugOut=debugOut,
+            noProto=noProto,
+            connectNow=connectNow,
+            pacer=pacer if pacer is not None else QueueStatusPacer(),
+            reactor=reactor,
+            rawPackets=rawPackets,
+            duplicateFilter=duplicateFilter,
+            publisher=publisher,
+            nodeStore=nodeStore,
+            configCache=configCache,
+            progressive=progressive,
         )
 
     def _socket_shutdown(self):
@@ -53,10 +87,10 @@ class TCPInterface(StreamInterface):
         sock = socket.create_connection(server_address)
         self.socket = sock
 
-    def close(self):
-        """Close a connection to the device"""
+    def close(self, flushTimeout: float=10.0):
+        """Close a connection to the device, see MeshInterface.close()"""
         logging.debug("Closing TCP stream")
-        StreamInterface.close(self)
+        StreamInterface.close(self, flushTimeout)
         # Sometimes the socket read might be blocked in the reader thread.
         # Therefore we force the shutdown by closing the socket here
         self._wantExit = True
@@ -74,3 +108,11 @@ class TCPInterface(StreamInterface):
     def _readBytes(self, length):
         """Read an array of bytes from our stream"""
         return self.socket.recv(length)
+
+    def _fileno(self):
+        """The file descriptor a reactor should select on"""
+        return self.socket.fileno()
+
+    def _readAvailable(self):
+        """Read whatever the socket has for us (blocks until at least one byte arrives)"""
+        return self._readBytes(READ_CHUNK_SIZE)
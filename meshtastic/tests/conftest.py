@@ -5,9 +5,11 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from meshtastic import mt_config
+from meshtastic import mesh_pb2, mt_config
 
+from ..asyncio_interface import AsyncStreamInterface
 from ..mesh_interface import MeshInterface
+from ..nodedb import NodeDict
 
 
 @pytest.fixture
@@ -58,3 +60,48 @@ def iface_with_nodes():
     iface.myInfo = myInfo
     iface.myInfo.my_node_num = 2475227164
     return iface
+
+
+@pytest.fixture
+def make_quiet_iface():
+    """Fixture for making MeshInterfaces like quiet_iface, passing on the constructor arguments."""
+    ifaces = []
+
+    def make(**kwargs):
+        iface = MeshInterface(noProto=True, **kwargs)
+        iface.nodes = NodeDict()
+        iface.nodesByNum = NodeDict()
+        iface._publish = MagicMock()
+        iface._hasListeners = MagicMock(return_value=False)
+        ifaces.append(iface)
+        return iface
+
+    yield make
+    for iface in ifaces:
+        iface.close()
+
+
+@pytest.fixture
+def quiet_iface(make_quiet_iface):  # pylint: disable=W0621
+    """Fixture for a MeshInterface without a device, empty node DBs and nobody subscribed to pubsub."""
+    return make_quiet_iface()
+
+
+@pytest.fixture
+def iface_with_mock_radio(reset_mt_config):  # pylint: disable=W0613,W0621
+    """Fixture for a MeshInterface talking to local node 1, what it sends goes to the _sendToRadioImpl MagicMock."""
+    iface = MeshInterface()
+    iface._sendToRadioImpl = MagicMock()
+    iface.txQueue._send = iface._sendToRadioImpl
+    iface.myInfo = mesh_pb2.MyNodeInfo(my_node_num=1)
+    iface.localNode.nodeNum = 1
+    yield iface
+    iface._sendToRadioImpl.side_effect = None
+    iface.close()
+
+@pytest.fixture
+def async_iface():
+    """Fixture for an AsyncStreamInterface that isn't connected to anything."""
+    iface = AsyncStreamInterface(noProto=True)
+    yield iface
+    iface.close()
@@ -0,0 +1,62 @@
+"""Meshtastic unit tests for airtime.py"""
+
+import pytest
+
+from .. import config_pb2, mesh_pb2, portnums_pb2
+from ..airtime import HEADER_SIZE, LoRaParams, airtime, airtimes, frameAirtime, packetAirtime, packetSize
+
+LoRaConfig = config_pb2.Config.LoRaConfig
+
+
+@pytest.mark.unit
+def test_frameAirtime_matches_semtech_calculator():
+    """Known values from Semtech's LoRa calculator (preamble 8, explicit header, CRC on)"""
+    assert frameAirtime(10, LoRaParams(125.0, 7, 5, preambleLength=8)) == pytest.approx(0.041216)
+    assert frameAirtime(51, LoRaParams(125.0, 12, 5, preambleLength=8)) == pytest.approx(2.465792)  # low data rate optimize
+    assert frameAirtime(0, LoRaParams(125.0, 7, 5, preambleLength=8)) == pytest.approx(0.025856)  # the CRC alone needs a block
+
+
+@pytest.mark.unit
+def test_LoRaParams_fromConfig():
+    """Presets map to the firmware's modem settings, custom settings are taken as they are"""
+    lora = LoRaConfig(use_preset=True, modem_preset=LoRaConfig.ModemPreset.LONG_FAST)
+    assert LoRaParams.fromConfig(lora) == LoRaParams(250.0, 11, 5)
+    lora.region = LoRaConfig.RegionCode.LORA_24
+    assert LoRaParams.fromConfig(lora).bandwidth == 812.5
+    lora = LoRaConfig(use_preset=False, bandwidth=62, spread_factor=9, coding_rate=7)
+    params = LoRaParams.fromConfig(lora)
+    assert params == LoRaParams(62.5, 9, 7)
+    assert params.symbolTime == pytest.approx(0.008192)
+    assert not params.lowDataRateOptimize
+    assert LoRaParams(125.0, 12, 8).lowDataRateOptimize
+
+
+@pytest.mark.unit
+def test_LoRaParams_fromConfig_invalid():
+    """Custom settings that were never set (or make no sense) raise a ValueError, not a ZeroDivisionError later"""
+    with pytest.raises(ValueError, match="bandwidth"):
+        airtime(10, LoRaConfig(use_preset=False, spread_factor=9, coding_rate=7))
+    with pytest.raises(ValueError, match="spreading factor"):
+        LoRaParams.fromConfig(LoRaConfig(use_preset=False, bandwidth=125, coding_rate=7))
+    with pytest.raises(ValueError, match="coding rate"):
+        LoRaParams.fromConfig(LoRaConfig(use_preset=False, bandwidth=125, spread_factor=9))
+
+
+@pytest.mark.unit
+def test_airtime_overhead_and_batches():
+    """airtime() adds the packet overhead, airtimes() agrees with it and slower presets take longer"""
+    longFast = LoRaConfig(use_preset=True, modem_preset=LoRaConfig.ModemPreset.LONG_FAST)
+    longSlow = LoRaConfig(use_preset=True, modem_preset=LoRaConfig.ModemPreset.LONG_SLOW)
+    assert packetSize(10) == HEADER_SIZE + 14
+    assert packetSize(200) == HEADER_SIZE + 205
+    assert airtime(10, longFast) == frameAirtime(packetSize(10), longFast)
+    sizes = [0, 10, 100, 233]
+    batch = airtimes(sizes, longFast)
+    assert batch == [airtime(size, longFast) for size in sizes]
+    assert batch == sorted(batch)
+    assert all(slow > fast for slow, fast in zip(airtimes(sizes, longSlow), batch))
+
+    packet = mesh_pb2.MeshPacket()
+    packet.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    packet.decoded.payload = b"x" * 10
+    assert packetAirtime(packet, longFast) == airtime(10, longFast)
@@ -0,0 +1,133 @@
+"""Meshtastic unit tests for asyncio_interface.py"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from .. import mesh_pb2, portnums_pb2
+from ..asyncio_interface import AsyncStreamInterface, AsyncTCPInterface
+from ..framing import FrameParser, frameBytes
+from ..mesh_interface import MeshInterface
+
+MY_NODE_NUM = 0x28B5465C
+OTHER_NODE_NUM = 0x28B54624
+
+
+async def _fakeRadio(reader, writer, received, done):
+    """Answer want_config like a device would, and answer each packet with a text message"""
+    parser = FrameParser()
+    while True:
+        b = await reader.read(4096)
+        if not b:
+            break
+        for frame in parser.feed(b):
+            toRadio = mesh_pb2.ToRadio()
+            toRadio.ParseFromString(frame)
+            received.append(toRadio)
+            if toRadio.want_config_id:
+                replies = [mesh_pb2.FromRadio(), mesh_pb2.FromRadio(), mesh_pb2.FromRadio()]
+                replies[0].my_info.my_node_num = MY_NODE_NUM
+                replies[1].node_info.num = OTHER_NODE_NUM
+                replies[1].node_info.user.id = f"!{OTHER_NODE_NUM:08x}"
+                replies[1].node_info.user.long_name = "Other"
+                replies[2].config_complete_id = toRadio.want_config_id
+            elif toRadio.HasField("packet"):
+                replies = [mesh_pb2.FromRadio()]
+                setattr(replies[0].packet, "from", OTHER_NODE_NUM)
+                replies[0].packet.to = MY_NODE_NUM
+                replies[0].packet.id = 42
+                replies[0].packet.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+                replies[0].packet.decoded.payload = b"hello async"
+            else:
+                continue
+            for r in replies:
+                writer.write(frameBytes(r.SerializeToString()))
+            await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+    done.set()
+
+
+async def _nextPacket(packets):
+    """The next packet from a packets() iterator"""
+    async for packet in packets:
+        return packet
+    return None
+
+
+@pytest.mark.unit
+def test_AsyncStreamInterface_is_abstract(async_iface):
+    """Test that the base class can't open a connection"""
+
+    async def run():
+        with pytest.raises(NotImplementedError):
+            await async_iface.connect()
+
+    asyncio.run(run())
+
+
+@pytest.mark.unit
+def test_AsyncStreamInterface_waitForConfig_not_connected(async_iface):
+    """Test that waitForConfigAsync() needs connect() first"""
+
+    async def run():
+        with pytest.raises(MeshInterface.MeshInterfaceError):
+            await async_iface.waitForConfigAsync()
+
+    asyncio.run(run())
+
+
+@pytest.mark.unit
+def test_AsyncStreamInterface_before_connected():
+    """On the event loop sync sends refuse to block for the connection, and timers wait for connect()"""
+    iface = AsyncStreamInterface()
+    fired = []
+
+    async def run():
+        iface.myInfo = mesh_pb2.MyNodeInfo(my_node_num=MY_NODE_NUM)
+        with pytest.raises(MeshInterface.MeshInterfaceError):
+            iface.sendText("hi", destinationId=OTHER_NODE_NUM)
+        iface._startTimer(0.0, lambda: fired.append("due"))
+        iface._startTimer(0.0, lambda: fired.append("cancelled")).cancel()
+        reader = asyncio.StreamReader()
+        reader.feed_eof()
+        iface._openConnection = AsyncMock(return_value=(reader, MagicMock(drain=AsyncMock())))
+        await iface.connect()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert fired == ["due"]
+    iface.close()
+
+
+@pytest.mark.unitslow
+def test_AsyncTCPInterface():
+    """Test config download, receiving and sending against a fake radio"""
+    received = []
+
+    async def run():
+        done = asyncio.Event()
+        server = await asyncio.start_server(
+            lambda r, w: _fakeRadio(r, w, received, done), "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with AsyncTCPInterface("127.0.0.1", portNumber=port) as iface:
+            assert iface.myInfo.my_node_num == MY_NODE_NUM
+            assert iface.nodesByNum[OTHER_NODE_NUM]["user"]["longName"] == "Other"
+
+            packets = iface.packets()
+            sent = await iface.sendTextAsync("hi there", destinationId=OTHER_NODE_NUM)
+            packet = await asyncio.wait_for(_nextPacket(packets), 5)
+            assert packet["decoded"]["text"] == "hello async"
+            assert packet["fromId"] == f"!{OTHER_NODE_NUM:08x}"
+
+            # once connected the inherited sync methods write right away
+            sentSync = iface.sendText("hi again", destinationId=OTHER_NODE_NUM)
+            assert (await asyncio.wait_for(_nextPacket(packets), 5))["decoded"]["text"] == "hello async"
+            assert [r.packet.id for r in received if r.HasField("packet")] == [sent.id, sentSync.id]
+        await asyncio.wait_for(done.wait(), 5)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
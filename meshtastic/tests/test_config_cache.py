@@ -0,0 +1,79 @@
+"""Meshtastic unit tests for config_cache.py"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..config_cache import CachedConfig, ConfigCache
+from ..mesh_interface import MeshInterface
+from .. import channel_pb2, config_pb2, localonly_pb2, mesh_pb2
+
+
+def _channels():
+    primary = channel_pb2.Channel(index=0, role=channel_pb2.Channel.Role.PRIMARY)
+    primary.settings.name = "mesh"
+    return [primary, channel_pb2.Channel(index=1, role=channel_pb2.Channel.Role.SECONDARY)]
+
+
+@pytest.mark.unit
+def test_ConfigCache(tmp_path):
+    """Configs are kept per node and firmware version"""
+    cache = ConfigCache(str(tmp_path / "config.db"))
+    localConfig = localonly_pb2.LocalConfig()
+    localConfig.lora.hop_limit = 5
+    moduleConfig = localonly_pb2.LocalModuleConfig()
+    moduleConfig.mqtt.enabled = True
+    metadata = mesh_pb2.DeviceMetadata(firmware_version="2.3.4")
+    cache.save(1, "2.3.4", CachedConfig(localConfig, moduleConfig, _channels(), metadata))
+    cache.close()
+
+    cache = ConfigCache(str(tmp_path / "config.db"))
+    assert cache.load(1, "2.3.4") == (localConfig, moduleConfig, _channels(), metadata)
+    assert cache.load(1, "2.3.5") is None
+    assert cache.load(2, "2.3.4") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.forget(1)
+    assert cache.load(1, "2.3.4") is None
+    cache.close()
+
+
+def _download(iface, hopLimit, channels):
+    """Feed the interface a config download, stopping short of config_complete"""
+    iface._startConfig()
+    for fromRadio in (
+        mesh_pb2.FromRadio(my_info=mesh_pb2.MyNodeInfo(my_node_num=1)),
+        mesh_pb2.FromRadio(metadata=mesh_pb2.DeviceMetadata(firmware_version="2.3.4")),
+        *(mesh_pb2.FromRadio(channel=channel) for channel in channels),
+        mesh_pb2.FromRadio(config=config_pb2.Config(lora=config_pb2.Config.LoRaConfig(hop_limit=hopLimit))),
+        mesh_pb2.FromRadio(config=config_pb2.Config(device=config_pb2.Config.DeviceConfig(button_gpio=3))),
+    ):
+        iface._handleFromRadio(fromRadio.SerializeToString())
+
+
+@pytest.mark.unit
+def test_reconnect_from_cache(tmp_path):
+    """With a cached config we're connected before the download completes, and only hear about changes"""
+    cache = ConfigCache(str(tmp_path / "config.db"))
+    iface = MeshInterface(noProto=True, configCache=cache)
+    iface._startHeartbeat = MagicMock()
+    _download(iface, 3, _channels())
+    assert not iface.isConnected.is_set()
+    iface._handleFromRadio(mesh_pb2.FromRadio(config_complete_id=iface.configId).SerializeToString())
+    assert iface.isConnected.is_set()
+
+    iface = MeshInterface(noProto=True, configCache=cache)
+    iface._startHeartbeat = MagicMock()
+    iface._publish = MagicMock()
+    _download(iface, 5, _channels())
+    assert iface.isConnected.is_set()  # from the cache
+    updated = [c.kwargs["section"] for c in iface._publish.call_args_list if c.args[0] == "meshtastic.config.updated"]
+    assert updated == ["lora"]
+    assert iface.localNode.localConfig.lora.hop_limit == 5
+    assert iface.localNode.localConfig.device.button_gpio == 3
+    assert iface.localNode.channels[0].settings.name == "mesh"
+    iface._handleFromRadio(mesh_pb2.FromRadio(config_complete_id=iface.configId).SerializeToString())
+    topics = [c.args[0] for c in iface._publish.call_args_list]
+    assert "meshtastic.channels.updated" not in topics
+    assert topics.count("meshtastic.connection.established") == 1
+    assert cache.load(1, "2.3.4").localConfig.lora.hop_limit == 5
+    cache.close()
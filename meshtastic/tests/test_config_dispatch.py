@@ -0,0 +1,27 @@
+"""Meshtastic unit tests for config_dispatch.py"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..config_dispatch import CONFIG_SECTIONS, storeConfigSection
+from .. import localonly_pb2, mesh_pb2
+
+
+@pytest.mark.unit
+def test_storeConfigSection():
+    """Sections are stored in the Node attribute the table names, unchanged ones only if asked"""
+    assert CONFIG_SECTIONS["config"]["lora"] == "localConfig"
+    assert CONFIG_SECTIONS["moduleConfig"]["paxcounter"] == "moduleConfig"
+    node = MagicMock(localConfig=localonly_pb2.LocalConfig(), moduleConfig=localonly_pb2.LocalModuleConfig())
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.config.lora.hop_limit = 5
+    assert storeConfigSection(node, fromRadio) == ("lora", node.localConfig.lora)
+    assert node.localConfig.lora.hop_limit == 5
+    assert storeConfigSection(node, fromRadio, onlyChanged=True) is None
+    assert storeConfigSection(node, fromRadio) == ("lora", node.localConfig.lora)
+
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.moduleConfig.paxcounter.enabled = True
+    assert storeConfigSection(node, fromRadio, onlyChanged=True) == ("paxcounter", node.moduleConfig.paxcounter)
+    assert node.moduleConfig.paxcounter.enabled
@@ -0,0 +1,50 @@
+"""Meshtastic unit tests for dedup.py"""
+
+from unittest.mock import patch
+
+import pytest
+
+from ..dedup import DuplicateFilter
+
+
+@pytest.mark.unit
+def test_DuplicateFilter():
+    """Packets are duplicates by (from, id)"""
+    dedup = DuplicateFilter()
+    assert not dedup.isDuplicate(1, 100)
+    assert dedup.isDuplicate(1, 100)
+    assert not dedup.isDuplicate(2, 100)
+    assert not dedup.isDuplicate(1, 101)
+    assert not dedup.isDuplicate(1, 0)
+    assert not dedup.isDuplicate(1, 0)
+    assert dedup.received == 6
+    assert dedup.duplicates == 1
+    dedup.clear()
+    assert dedup.received == 0
+    assert len(dedup) == 0
+
+
+@pytest.mark.unit
+def test_DuplicateFilter_bounded():
+    """We forget the oldest packets"""
+    dedup = DuplicateFilter(maxEntries=3)
+    for packetId in range(1, 6):
+        assert not dedup.isDuplicate(1, packetId)
+    assert len(dedup) == 3
+    assert not dedup.isDuplicate(1, 1)
+    assert dedup.isDuplicate(1, 5)
+
+
+@pytest.mark.unit
+def test_DuplicateFilter_window():
+    """Packets seen longer than window seconds ago are not duplicates"""
+    dedup = DuplicateFilter(window=10)
+    with patch("time.monotonic", return_value=1000.0):
+        assert not dedup.isDuplicate(1, 100)
+        assert not dedup.isDuplicate(1, 101)
+    with patch("time.monotonic", return_value=1005.0):
+        assert dedup.isDuplicate(1, 100)
+        assert not dedup.isDuplicate(1, 102)
+    with patch("time.monotonic", return_value=1011.0):
+        assert not dedup.isDuplicate(1, 100)
+        assert len(dedup) == 2  # 101 expired
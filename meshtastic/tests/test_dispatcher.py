@@ -0,0 +1,58 @@
+"""Meshtastic unit tests for dispatcher.py"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..dispatcher import PacketDispatcher
+from .. import mesh_pb2, portnums_pb2
+
+
+def _packet(fromNum, to=0xFFFFFFFF, portnum=portnums_pb2.PortNum.TEXT_MESSAGE_APP, channel=0, wantAck=False):
+    meshPacket = mesh_pb2.MeshPacket(to=to, channel=channel, want_ack=wantAck)
+    setattr(meshPacket, "from", fromNum)
+    meshPacket.decoded.portnum = portnum
+    return meshPacket
+
+
+@pytest.mark.unit
+def test_PacketDispatcher_match():
+    """Packets go to the subscriptions whose criteria all match"""
+    dispatcher = PacketDispatcher()
+    everything = dispatcher.subscribe(print)
+    fromOne = dispatcher.subscribe(print, fromNum=1)
+    fromOneText = dispatcher.subscribe(print, fromNum=1, portnum=portnums_pb2.PortNum.TEXT_MESSAGE_APP)
+    toTwo = dispatcher.subscribe(print, toNum=2)
+    acked = dispatcher.subscribe(print, channel=1, wantAck=True)
+    assert len(dispatcher) == 5
+    assert dispatcher.match(_packet(1)) == [everything, fromOne, fromOneText]
+    assert dispatcher.match(_packet(1, portnum=portnums_pb2.PortNum.POSITION_APP)) == [everything, fromOne]
+    assert dispatcher.match(_packet(3, to=2)) == [everything, toTwo]
+    assert dispatcher.match(_packet(3, channel=1)) == [everything]
+    assert dispatcher.match(_packet(3, channel=1, wantAck=True)) == [everything, acked]
+    fromOne.cancel()
+    everything.cancel()
+    assert not fromOne.cancel() and not dispatcher.unsubscribe(fromOne)
+    assert dispatcher.match(_packet(1)) == [fromOneText]
+    assert len(dispatcher) == 3
+
+
+@pytest.mark.unit
+def test_PacketDispatcher_many_nodes():
+    """Per node subscriptions are found by lookup, not by trying each of them"""
+    dispatcher = PacketDispatcher()
+    subscriptions = [dispatcher.subscribe(print, fromNum=n) for n in range(1000)]
+    assert dispatcher.match(_packet(500)) == [subscriptions[500]]
+    assert not dispatcher.match(_packet(5000))
+    assert len(dispatcher._index[0]) == 1000
+
+
+@pytest.mark.unit
+def test_PacketDispatcher_deliver():
+    """A failing callback doesn't keep the packet from the others"""
+    dispatcher = PacketDispatcher()
+    good = MagicMock()
+    dispatcher.subscribe(MagicMock(side_effect=RuntimeError("boom")))
+    dispatcher.subscribe(good)
+    PacketDispatcher.deliver(dispatcher.match(_packet(1)), "packet", "iface")
+    good.assert_called_once_with("packet", "iface")
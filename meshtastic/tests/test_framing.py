@@ -0,0 +1,78 @@
+"""Meshtastic unit tests for framing.py"""
+
+import pytest
+
+from ..framing import (
+    MAX_TO_FROM_RADIO_SIZE,
+    START1,
+    START2,
+    FrameParser,
+    frameBytes,
+)
+
+
+@pytest.mark.unit
+def test_frameBytes():
+    """Test frameBytes()"""
+    assert frameBytes(b"hello") == bytes([START1, START2, 0, 5]) + b"hello"
+
+
+@pytest.mark.unit
+def test_FrameParser_whole_frames():
+    """Test that we get every frame out of a single chunk"""
+    parser = FrameParser()
+    data = frameBytes(b"one") + frameBytes(b"two") + frameBytes(b"")
+    assert [bytes(f) for f in parser.feed(data)] == [b"one", b"two", b""]
+    assert len(parser) == 0
+
+
+@pytest.mark.unit
+def test_FrameParser_byte_at_a_time():
+    """Test that frames split across reads are reassembled"""
+    parser = FrameParser()
+    data = frameBytes(b"hello") + frameBytes(b"world")
+    frames = []
+    for i in range(len(data)):
+        frames.extend(bytes(f) for f in parser.feed(data[i : i + 1]))
+    assert frames == [b"hello", b"world"]
+
+
+@pytest.mark.unit
+def test_FrameParser_debug_output():
+    """Test that bytes outside of frames are passed to onDebugBytes"""
+    debug = []
+    parser = FrameParser(onDebugBytes=debug.append)
+    data = b"boot\n" + frameBytes(b"one") + b"log" + frameBytes(b"two")
+    assert [bytes(f) for f in parser.feed(data)] == [b"one", b"two"]
+    assert b"".join(debug) == b"boot\nlog"
+
+
+@pytest.mark.unit
+def test_FrameParser_resync():
+    """Test that a bad START2 or an oversized length does not lose the next frame"""
+    parser = FrameParser()
+    tooBig = MAX_TO_FROM_RADIO_SIZE + 1
+    data = bytes([START1, 0x00, START1, START2, tooBig >> 8, tooBig & 0xFF]) + frameBytes(b"ok")
+    assert [bytes(f) for f in parser.feed(data)] == [b"ok"]
+
+
+@pytest.mark.unit
+def test_FrameParser_partial_frame_kept():
+    """Test that an incomplete frame stays buffered"""
+    parser = FrameParser()
+    data = frameBytes(b"hello")
+    assert not list(parser.feed(data[:6]))
+    assert len(parser) == 6
+    assert [bytes(f) for f in parser.feed(data[6:])] == [b"hello"]
+    parser.feed(data[:3])
+    parser.reset()
+    assert len(parser) == 0
+
+
+@pytest.mark.unit
+def test_FrameParser_frame_is_released():
+    """Test that the frame view is released once the consumer moves on"""
+    parser = FrameParser()
+    frames = list(parser.feed(frameBytes(b"one")))
+    with pytest.raises(ValueError):
+        bytes(frames[0])
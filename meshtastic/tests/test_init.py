@@ -6,7 +6,17 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from meshtastic import _onNodeInfoReceive, _onPositionReceive, _onTextReceive, mt_config
+from meshtastic import (
+    KnownProtocol,
+    ProtocolRegistry,
+    _onNodeInfoReceive,
+    _onPositionReceive,
+    _onTextReceive,
+    atak_pb2,
+    mesh_pb2,
+    mt_config,
+    portnums_pb2,
+)
 
 from ..serial_interface import SerialInterface
 
@@ -54,3 +64,20 @@ def test_init_onNodeInfoReceive(caplog, iface_with_nodes):
     with caplog.at_level(logging.DEBUG):
         _onNodeInfoReceive(iface, packet)
     assert re.search(r"in _onNodeInfoReceive", caplog.text, re.MULTILINE)
+
+
+@pytest.mark.unit
+def test_ProtocolRegistry():
+    """Test registering and unregistering protocols"""
+    registry = ProtocolRegistry({portnums_pb2.PortNum.POSITION_APP: KnownProtocol("position", mesh_pb2.Position)})
+    assert registry[portnums_pb2.PortNum.POSITION_APP].topic == "meshtastic.receive.position"
+    atak = registry.register(portnums_pb2.PortNum.ATAK_PLUGIN, "atak", atak_pb2.TAKPacket, decodeOnlyIfSubscribed=True)
+    assert atak.topic == "meshtastic.receive.atak"
+    assert atak.decodeOnlyIfSubscribed
+    assert registry.get(portnums_pb2.PortNum.ATAK_PLUGIN) is atak
+    private = registry.register(portnums_pb2.PortNum.PRIVATE_APP, "mysensor", decoder=lambda b: b[::-1])
+    assert private.decode(b"abc") == b"cba"
+    assert registry.unregister(portnums_pb2.PortNum.ATAK_PLUGIN) is atak
+    assert registry.unregister(portnums_pb2.PortNum.ATAK_PLUGIN) is None
+    assert registry.dataTopic(portnums_pb2.PortNum.ATAK_PLUGIN) == "meshtastic.receive.data.ATAK_PLUGIN"
+    assert registry.dataTopic(300) == "meshtastic.receive.data.300"
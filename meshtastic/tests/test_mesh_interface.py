@@ -1,18 +1,36 @@
 """Meshtastic unit tests for mesh_interface.py"""
 
+import asyncio
+import concurrent.futures
 import logging
 import re
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from .. import mesh_pb2, config_pb2, BROADCAST_ADDR, LOCAL_ADDR
+from .. import (
+    channel_pb2,
+    mesh_pb2,
+    config_pb2,
+    portnums_pb2,
+    telemetry_pb2,
+    BROADCAST_ADDR,
+    BROADCAST_NUM,
+    LOCAL_ADDR,
+    RawPacket,
+    ResponseHandler,
+    protocols,
+)
+from ..config_dispatch import CONFIG_SECTIONS
+from ..dedup import DuplicateFilter
 from ..mesh_interface import MeshInterface
 from ..node import Node
+from ..response_future import ResponseError
 
 # TODO
 # from ..config import Config
-from ..util import Timeout
+from ..util import DeferredExecution, Timeout, our_exit
 
 
 @pytest.mark.unit
@@ -684,3 +702,544 @@ def test_waitConnected_isConnected_timeout(capsys):
         out, err = capsys.readouterr()
         assert re.search(r"warn about something", err, re.MULTILINE)
         assert out == ""
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_handlePacketFromRadio_rawPackets_position(quiet_iface):
+    """In rawPackets mode we publish a RawPacket and update the node DB from the protobuf"""
+    iface = quiet_iface
+    iface.rawPackets = True
+    iface.nodesByNum[0x28B5465C] = {"num": 0x28B5465C, "user": {"id": "!28b5465c"}}
+    iface._hasListeners.return_value = True
+    position = mesh_pb2.Position(latitude_i=520000000, longitude_i=40000000, altitude=10)
+    meshPacket = mesh_pb2.MeshPacket(to=BROADCAST_NUM, rx_time=1700000000, rx_snr=5.5, hop_limit=3)
+    setattr(meshPacket, "from", 0x28B5465C)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.POSITION_APP
+    meshPacket.decoded.payload = position.SerializeToString()
+    iface._handlePacketFromRadio(meshPacket)
+
+    iface._publish.assert_called_once()
+    topic = iface._publish.call_args.args[0]
+    packet = iface._publish.call_args.kwargs["packet"]
+    assert topic == "meshtastic.receive.position"
+    assert isinstance(packet, RawPacket)
+    assert packet.packet is meshPacket
+    assert packet.fromId == "!28b5465c"
+    assert packet.toId == "^all"
+    assert packet.portnum == portnums_pb2.PortNum.POSITION_APP
+    assert packet.decoded == position
+    node = iface.nodesByNum[0x28B5465C]
+    assert node["position"]["latitude"] == 52.0
+    assert node["position"]["altitude"] == 10
+
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    meshPacket.decoded.payload = b"hello"
+    iface._handlePacketFromRadio(meshPacket)
+    assert iface._publish.call_args.args[0] == "meshtastic.receive.text"
+    assert iface._publish.call_args.kwargs["packet"].decoded is None
+    assert node["lastHeard"] == 1700000000
+    assert node["snr"] == 5.5
+    assert node["hopLimit"] == 3
+    assert node["lastReceived"]["fromId"] == "!28b5465c"
+    assert node["lastReceived"]["decoded"]["payload"] == b"hello"
+    assert iface.lastReceived(1) is None
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_handlePacketFromRadio_rawPackets_response(quiet_iface):
+    """Response handlers are still called with a packet dictionary, acks are ignored"""
+    iface = quiet_iface
+    iface.rawPackets = True
+    iface._hasListeners.return_value = True
+    callback = MagicMock()
+    iface.responseHandlers[1234] = ResponseHandler(callback)
+
+    ack = mesh_pb2.MeshPacket(to=1)
+    setattr(ack, "from", 2)
+    ack.decoded.portnum = portnums_pb2.PortNum.ROUTING_APP
+    ack.decoded.request_id = 1234
+    ack.decoded.payload = mesh_pb2.Routing(error_reason=mesh_pb2.Routing.Error.NONE).SerializeToString()
+    iface._handlePacketFromRadio(ack)
+    callback.assert_not_called()
+
+    response = mesh_pb2.MeshPacket(to=1)
+    setattr(response, "from", 2)
+    response.decoded.portnum = portnums_pb2.PortNum.TELEMETRY_APP
+    response.decoded.request_id = 1234
+    response.decoded.payload = telemetry_pb2.Telemetry(time=5).SerializeToString()
+    iface._handlePacketFromRadio(response)
+    callback.assert_called_once()
+    asDict = callback.call_args.args[0]
+    assert asDict["from"] == 2
+    assert asDict["fromId"] is None
+    assert asDict["decoded"]["portnum"] == "TELEMETRY_APP"
+    assert asDict["decoded"]["telemetry"]["time"] == 5
+    assert asDict["raw"] is response
+    assert 1234 not in iface.responseHandlers
+    assert iface._publish.call_args.args[0] == "meshtastic.receive.telemetry"
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_handleFromRadio_with_config_sections():
+    """Config and moduleConfig sections end up in localNode and are published"""
+    iface = MeshInterface(noProto=True)
+    iface._publish = MagicMock()
+    iface._hasListeners = MagicMock(return_value=True)
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.config.lora.hop_limit = 5
+    iface._handleFromRadio(fromRadio.SerializeToString())
+    assert iface.localNode.localConfig.lora.hop_limit == 5
+    iface._publish.assert_called_once_with(
+        "meshtastic.config.updated", section="lora", config=iface.localNode.localConfig.lora, module=False
+    )
+
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.moduleConfig.paxcounter.enabled = True
+    iface._handleFromRadio(fromRadio.SerializeToString())
+    assert iface.localNode.moduleConfig.paxcounter.enabled
+    assert iface._publish.call_args.kwargs["section"] == "paxcounter"
+    assert iface._publish.call_args.kwargs["module"]
+    iface.close()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_handlePacketFromRadio_registered_protocol(quiet_iface):
+    """Protocols registered at runtime are decoded (lazily if asked) and published on their topic"""
+    iface = quiet_iface
+    iface._hasListeners.return_value = True
+    decoder = MagicMock(return_value={"temperature": 21})
+    meshPacket = mesh_pb2.MeshPacket(to=1)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.PRIVATE_APP
+    meshPacket.decoded.payload = b"\x15"
+    try:
+        protocols.register(portnums_pb2.PortNum.PRIVATE_APP, "mysensor", decoder=decoder, lazyDecode=True)
+        iface._handlePacketFromRadio(meshPacket)
+        assert iface._publish.call_args.args[0] == "meshtastic.receive.mysensor"
+        packet = iface._publish.call_args.kwargs["packet"]
+        decoder.assert_not_called()
+        assert packet["decoded"]["mysensor"] == {"temperature": 21}
+        decoder.assert_called_once_with(b"\x15")
+
+        # nobody is subscribed, so we don't decode or publish, only call onReceive
+        iface._hasListeners.return_value = False
+        iface._publish.reset_mock()
+        onReceive = MagicMock()
+        protocols.register(
+            portnums_pb2.PortNum.PRIVATE_APP, "mysensor", decoder=decoder, decodeOnlyIfSubscribed=True, onReceive=onReceive
+        )
+        iface._handlePacketFromRadio(meshPacket)
+        iface._publish.assert_not_called()
+        assert "mysensor" not in onReceive.call_args.args[1]["decoded"]
+        assert decoder.call_count == 1
+    finally:
+        protocols.unregister(portnums_pb2.PortNum.PRIVATE_APP)
+    iface._hasListeners.return_value = True
+    iface._handlePacketFromRadio(meshPacket)
+    assert iface._publish.call_args.args[0] == "meshtastic.receive.data.PRIVATE_APP"
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_handlePacketFromRadio_nobody_listening(quiet_iface):
+    """Without listeners we skip decoding and publishing, but still update the node DB"""
+    iface = quiet_iface
+    meshPacket = mesh_pb2.MeshPacket(to=1, rx_time=1700000000)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.TELEMETRY_APP
+    meshPacket.decoded.payload = b"not a protobuf"
+    iface._handlePacketFromRadio(meshPacket)
+    iface._publish.assert_not_called()
+    iface._hasListeners.assert_called_once_with("meshtastic.receive.telemetry")
+
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    meshPacket.decoded.payload = b"hello"
+    iface._handlePacketFromRadio(meshPacket)
+    iface._publish.assert_not_called()
+    assert iface.nodesByNum[2]["lastHeard"] == 1700000000
+
+    # unless we are waiting for a response to it
+    callback = MagicMock()
+    iface.responseHandlers[1234] = ResponseHandler(callback)
+    meshPacket.decoded.request_id = 1234
+    iface._handlePacketFromRadio(meshPacket)
+    callback.assert_called_once()
+    iface._publish.assert_not_called()  # it is still nobody's pubsub message
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_handlePacketFromRadio_duplicates(make_quiet_iface):
+    """Interfaces sharing a DuplicateFilter publish a packet once, but all of them learn from it"""
+    dedup = DuplicateFilter(publishDuplicates=True)
+    ifaces = [make_quiet_iface(duplicateFilter=dedup), make_quiet_iface(duplicateFilter=dedup)]
+    for iface in ifaces:
+        iface._hasListeners.return_value = True
+    callback = MagicMock()
+    ifaces[1].responseHandlers[99] = ResponseHandler(callback)
+    meshPacket = mesh_pb2.MeshPacket(to=1, id=1234)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.POSITION_APP
+    meshPacket.decoded.payload = mesh_pb2.Position(latitude_i=10000000).SerializeToString()
+    meshPacket.decoded.request_id = 99
+    ifaces[0]._handlePacketFromRadio(meshPacket)
+    ifaces[1]._handlePacketFromRadio(meshPacket)
+    assert ifaces[0]._publish.call_args.args[0] == "meshtastic.receive.position"
+    assert ifaces[1]._publish.call_args.args[0] == "meshtastic.receive.duplicate"
+    assert ifaces[1]._publish.call_args.kwargs["packet"]["id"] == 1234
+    assert "meshtastic.receive.position" not in [c.args[0] for c in ifaces[1]._publish.call_args_list]
+    assert dedup.duplicates == 1
+    for iface in ifaces:
+        assert iface.nodesByNum[2]["position"]["latitude"] == 1.0
+    callback.assert_called_once()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_publish_with_publisher():
+    """Messages go through our publisher, keyed by interface (and node if asked)"""
+    publisher = MagicMock()
+    iface = MeshInterface(noProto=True, publisher=publisher)
+    iface._publish("meshtastic.test", nodeNum=5, foo=1)
+    assert publisher.queueWork.call_args.args[1] == id(iface)
+    iface.publishPerNode = True
+    iface._publish("meshtastic.test", nodeNum=5, foo=1)
+    assert publisher.queueWork.call_args.args[1] == (id(iface), 5)
+    iface._publish("meshtastic.test", foo=1)
+    assert publisher.queueWork.call_args.args[1] == id(iface)
+
+
+@pytest.mark.unit
+def test_publish_priority_and_coalescing():
+    """Topics get their priority from publishPriorities, node updates coalesce per node"""
+    publisher = MagicMock()
+    publisher.overflow = DeferredExecution.DROP_LOW_PRIORITY
+    iface = MeshInterface(noProto=True, publisher=publisher)
+    iface._publish("meshtastic.connection.lost")
+    assert publisher.queueWork.call_args.args[2:] == (3, None)
+    iface._publish("meshtastic.receive.telemetry", nodeNum=5)
+    assert publisher.queueWork.call_args.args[2:] == (0, None)
+    iface._publish("meshtastic.node.updated", nodeNum=5)
+    assert publisher.queueWork.call_args.args[2:] == (1, ("meshtastic.node.updated", id(iface), 5))
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_node_bulk_loaded():
+    """Nodes of the initial download are published together at config_complete"""
+    iface = MeshInterface(noProto=True)
+    iface._publish = MagicMock()
+    iface._hasListeners = MagicMock(return_value=True)
+    iface.nodeUpdatesDuringConfig = False
+    iface._startConfig()
+    for num in (1, 2, 3):
+        fromRadio = mesh_pb2.FromRadio()
+        fromRadio.node_info.num = num
+        iface._handleFromRadio(fromRadio.SerializeToString())
+    iface._publish.assert_not_called()
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.config_complete_id = iface.configId
+    iface._handleFromRadio(fromRadio.SerializeToString())
+    topics = [call.args[0] for call in iface._publish.call_args_list]
+    assert topics == ["meshtastic.node.bulk_loaded", "meshtastic.connection.established"]
+    nodes = iface._publish.call_args_list[0].kwargs["nodes"]
+    assert [node["num"] for node in nodes] == [1, 2, 3]
+    # after the download nodes are published one by one again
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.node_info.num = 4
+    iface._handleFromRadio(fromRadio.SerializeToString())
+    assert iface._publish.call_args.args[0] == "meshtastic.node.updated"
+    iface.close()
+
+
+@pytest.mark.unit
+def test_node_update_debounce():
+    """With nodeUpdateDebounce only the latest update of a node in the window is published"""
+    timers = []
+    startTimer = MagicMock(side_effect=lambda interval, callback: timers.append(callback) or MagicMock())
+    with patch.object(MeshInterface, "_startTimer", startTimer):
+        iface = MeshInterface(noProto=True)
+    iface._publish = MagicMock()
+    iface.nodeUpdateDebounce = 1.0
+    iface._nodeUpdated({"num": 1, "snr": 1})
+    iface._nodeUpdated({"num": 1, "snr": 2})
+    iface._nodeUpdated({"num": 2})
+    assert len(timers) == 2
+    iface._publish.assert_not_called()
+    for callback in timers:
+        callback()
+    published = [call.kwargs["node"] for call in iface._publish.call_args_list]
+    assert published == [{"num": 1, "snr": 2}, {"num": 2}]
+    iface._nodeUpdated({"num": 1, "snr": 3})
+    iface.close()
+    assert not iface._nodeUpdates
+
+
+@pytest.mark.unit
+def test_packets_iterator(quiet_iface):
+    """packets() iterators get the packets on their topics, without pubsub, and end on disconnect"""
+    iface = quiet_iface
+    texts = iface.packets(topics=["meshtastic.receive.text"])
+    everything = iface.packets()
+    meshPacket = mesh_pb2.MeshPacket(to=1)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    meshPacket.decoded.payload = b"hello"
+    iface._handlePacketFromRadio(meshPacket)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.PRIVATE_APP
+    iface._handlePacketFromRadio(meshPacket)
+    iface._publish.assert_not_called()
+    texts.close()
+    assert [p["decoded"]["text"] for p in texts] == ["hello"]
+    assert list(iface._packetIterators) == [everything]
+    iface._disconnected()
+    assert [p["decoded"]["portnum"] for p in everything] == ["TEXT_MESSAGE_APP", "PRIVATE_APP"]
+    assert not iface._packetIterators
+
+
+@pytest.mark.unit
+def test_subscribe_by_node():
+    """subscribe() callbacks get the packets of their node, even with no pubsub listeners"""
+    iface = MeshInterface(noProto=True, publisher=MagicMock())
+    iface.nodes = {}
+    iface.nodesByNum = {}
+    iface._hasListeners = MagicMock(return_value=False)
+    callback = MagicMock()
+    iface.subscribe(callback, fromNum=2)
+    for fromNum in (2, 3):
+        meshPacket = mesh_pb2.MeshPacket(to=1)
+        setattr(meshPacket, "from", fromNum)
+        meshPacket.decoded.portnum = portnums_pb2.PortNum.PRIVATE_APP
+        iface._handlePacketFromRadio(meshPacket)
+    assert iface.publisher.queueWork.call_count == 1
+    iface.publisher.queueWork.call_args.args[0]()
+    packet, interface = callback.call_args.args
+    assert packet["from"] == 2
+    assert interface is iface
+
+
+@pytest.mark.unit
+def test_progressive_download():
+    """In progressive mode we're connected once the config is in, and nodes fill in as they come"""
+    iface = MeshInterface(noProto=True, progressive=True)
+    iface._startHeartbeat = MagicMock()
+    iface._publish = MagicMock()
+    iface.progressEvery = 2
+    iface._startConfig()
+
+    def nodeInfo(num):
+        fromRadio = mesh_pb2.FromRadio()
+        fromRadio.node_info.num = num
+        fromRadio.node_info.user.id = f"node{num}"
+        return fromRadio
+
+    for fromRadio in (
+        mesh_pb2.FromRadio(my_info=mesh_pb2.MyNodeInfo(my_node_num=1)),
+        nodeInfo(1),
+        mesh_pb2.FromRadio(channel=channel_pb2.Channel(index=0, role=channel_pb2.Channel.Role.PRIMARY)),
+        mesh_pb2.FromRadio(config=config_pb2.Config(lora=config_pb2.Config.LoRaConfig(hop_limit=3))),
+    ):
+        iface._handleFromRadio(fromRadio.SerializeToString())
+    assert not iface.isConnected.is_set()  # our own node info comes before the config
+    for num in (2, 3, 4):
+        iface._handleFromRadio(nodeInfo(num).SerializeToString())
+        assert iface.isConnected.is_set()
+    assert iface.localNode.channels[0].role == channel_pb2.Channel.Role.PRIMARY
+    assert iface.nodes["node3"]["num"] == 3
+    assert not iface.nodeDbComplete.is_set()
+    sent = iface._sendPacket(mesh_pb2.MeshPacket(), destinationId="node4")
+    assert sent.to == 4
+
+    # an unknown node might still be on its way
+    def finish():
+        iface._handleFromRadio(nodeInfo(5).SerializeToString())
+        iface._handleFromRadio(mesh_pb2.FromRadio(config_complete_id=iface.configId).SerializeToString())
+
+    iface._waitForNodeDb = MagicMock(side_effect=lambda: finish() or True)
+    assert iface._sendPacket(mesh_pb2.MeshPacket(), destinationId="node5").to == 5
+    assert iface.nodeDbComplete.is_set()
+    progress = [c.kwargs for c in iface._publish.call_args_list if c.args[0] == "meshtastic.node.progress"]
+    assert [p["received"] for p in progress] == [1, 2, 4, 5]
+    assert progress[-1]["expected"] == 5
+    iface.close()
+
+
+@pytest.mark.unit
+def test_progressive_download_node_info_first():
+    """In progressive mode we're connected once myInfo and every config section are in, whatever came first"""
+    iface = MeshInterface(noProto=True, progressive=True)
+    iface._startHeartbeat = MagicMock()
+    iface._publish = MagicMock()
+    iface._startConfig()
+    for num in (2, 3):
+        fromRadio = mesh_pb2.FromRadio()
+        fromRadio.node_info.num = num
+        iface._handleFromRadio(fromRadio.SerializeToString())
+    for kind, sections in CONFIG_SECTIONS.items():
+        for section in sections:
+            assert not iface.isConnected.is_set()
+            fromRadio = mesh_pb2.FromRadio()
+            getattr(getattr(fromRadio, kind), section).SetInParent()
+            iface._handleFromRadio(fromRadio.SerializeToString())
+    assert not iface.isConnected.is_set()  # no myInfo yet
+    iface._handleFromRadio(mesh_pb2.FromRadio(my_info=mesh_pb2.MyNodeInfo(my_node_num=1)).SerializeToString())
+    assert iface.isConnected.is_set()
+    assert sorted(iface.nodesByNum) == [2, 3]
+    assert not iface.nodeDbComplete.is_set()
+    iface._handleFromRadio(mesh_pb2.FromRadio(config_complete_id=iface.configId).SerializeToString())
+    assert iface.nodeDbComplete.is_set()
+    iface.close()
+
+
+def _answer(requestId, fromNum, portnum, message):
+    """A packet from fromNum answering our request requestId"""
+    meshPacket = mesh_pb2.MeshPacket(to=1)
+    setattr(meshPacket, "from", fromNum)
+    meshPacket.decoded.portnum = portnum
+    meshPacket.decoded.request_id = requestId
+    meshPacket.decoded.payload = message.SerializeToString()
+    return meshPacket
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+@pytest.mark.parametrize("rawPackets", [False, True])
+def test_sendRequest_concurrent_futures(rawPackets):
+    """Outstanding requests are resolved by their own answers, in whatever order those arrive"""
+    iface = MeshInterface(noProto=True, rawPackets=rawPackets)
+    iface.nodesByNum = {}
+    iface._publish = MagicMock()
+    futures = {num: iface.requestTelemetry(num) for num in range(2, 12)}
+    assert len(iface.responses.futures) == 10
+    assert futures[2].packet.to == 2
+    assert futures[2].packet.decoded.want_response
+
+    ack = mesh_pb2.Routing(error_reason=mesh_pb2.Routing.Error.NONE)
+    iface._handlePacketFromRadio(_answer(futures[2].requestId, 2, portnums_pb2.PortNum.ROUTING_APP, ack))
+    assert not futures[2].done()  # the response is still to come
+
+    for num in reversed(range(3, 12)):
+        telemetry = telemetry_pb2.Telemetry(time=num)
+        iface._handlePacketFromRadio(_answer(futures[num].requestId, num, portnums_pb2.PortNum.TELEMETRY_APP, telemetry))
+        response = futures[num].result(timeout=0)
+        if rawPackets:
+            assert response.decoded.time == num
+        else:
+            assert response["decoded"]["telemetry"]["time"] == num
+
+    nak = mesh_pb2.Routing(error_reason=mesh_pb2.Routing.Error.NO_RESPONSE)
+    iface._handlePacketFromRadio(_answer(futures[2].requestId, 2, portnums_pb2.PortNum.ROUTING_APP, nak))
+    with pytest.raises(ResponseError) as ex:
+        futures[2].result(timeout=0)
+    assert ex.value.errorReason == "NO_RESPONSE"
+    assert not iface.responses.futures
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_sendRequest_wantAck():
+    """Requests without wantResponse are answered by the destination's ACK, not an implicit one"""
+    iface = MeshInterface(noProto=True)
+    iface.localNode.nodeNum = 1
+    future = iface.sendRequest(b"hello", 2, portNum=portnums_pb2.PortNum.TEXT_MESSAGE_APP, wantAck=True, wantResponse=False)
+    assert future.packet.want_ack
+    ack = mesh_pb2.Routing(error_reason=mesh_pb2.Routing.Error.NONE)
+    iface._handlePacketFromRadio(_answer(future.requestId, 1, portnums_pb2.PortNum.ROUTING_APP, ack))
+    assert not future.done()
+    iface._handlePacketFromRadio(_answer(future.requestId, 2, portnums_pb2.PortNum.ROUTING_APP, ack))
+    assert future.result(timeout=0)["from"] == 2
+
+    broadcast = iface.sendRequest(b"hello", BROADCAST_NUM, wantAck=True, wantResponse=False)
+    iface._handlePacketFromRadio(_answer(broadcast.requestId, 1, portnums_pb2.PortNum.ROUTING_APP, ack))
+    assert broadcast.done()
+
+    with pytest.raises(MeshInterface.MeshInterfaceError):
+        iface.sendRequest(b"hello", 2, wantAck=False, wantResponse=False)
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_sendRequest_timeout_cancel_close():
+    """Requests are forgotten when they time out, are cancelled or the interface closes"""
+    iface = MeshInterface(noProto=True)
+    expiring = iface.requestPosition(2, timeout=0.01)
+    with pytest.raises(concurrent.futures.TimeoutError):
+        expiring.result(timeout=5)
+    assert expiring.exception() is not None  # it failed, rather than our wait timing out
+
+    cancelled = iface.requestTraceRoute(3)
+    assert cancelled.cancel()
+    pending = iface.requestPosition(4)
+    assert list(iface.responses.futures) == [pending.requestId]
+
+    iface.close()
+    with pytest.raises(MeshInterface.MeshInterfaceError):
+        pending.result(timeout=0)
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_sendRequest_await():
+    """ResponseFutures can be awaited, the answer may come from another thread"""
+    iface = MeshInterface(noProto=True)
+    future = iface.requestTelemetry(2)
+    telemetry = telemetry_pb2.Telemetry(time=7)
+    answer = _answer(future.requestId, 2, portnums_pb2.PortNum.TELEMETRY_APP, telemetry)
+
+    async def request():
+        threading.Timer(0.01, iface._handlePacketFromRadio, (answer,)).start()
+        return await future
+
+    response = asyncio.run(request())
+    assert response["decoded"]["telemetry"]["time"] == 7
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_response_handler_expiry(caplog):
+    """Unanswered response handlers are dropped and told so if they asked, answered ones are no longer tracked"""
+    iface = MeshInterface(noProto=True)
+    neverExpires = iface.sendData(b"ping", 6, wantResponse=True, onResponse=MagicMock()).id
+    assert iface.responseHandlers[neverExpires].expires is None  # unless asked for
+    iface.responseHandlers.clear()
+    iface.responses.timeout = 0.05
+    answered = MagicMock()
+    expiring = MagicMock()
+    timedOut = MagicMock()
+    done = threading.Event()
+
+    def onTimeout(requestId):
+        timedOut(requestId)
+        done.set()
+        our_exit("No response")  # a CLI handler, must not take the timer down
+
+    answeredId = iface.sendData(b"ping", 2, wantResponse=True, onResponse=answered).id
+    expiringId = iface.sendData(b"ping", 3, wantResponse=True, onResponse=expiring, onResponseTimeout=onTimeout).id
+    iface.sendData(b"ping", 5, wantResponse=True, onResponse=expiring)
+    future = iface.sendRequest(b"ping", 4)
+    assert iface.responseHandlers[expiringId].expires is not None
+    assert iface.responses.stats() == {"outstanding": 4, "expired": 0}
+
+    reply = mesh_pb2.MeshPacket(to=1)
+    setattr(reply, "from", 2)
+    reply.decoded.portnum = portnums_pb2.PortNum.PRIVATE_APP
+    reply.decoded.request_id = answeredId
+    iface._handlePacketFromRadio(reply)
+    answered.assert_called_once()
+    assert answeredId not in iface.responses._expiry
+
+    with caplog.at_level(logging.WARNING):
+        assert done.wait(5)
+        with pytest.raises(concurrent.futures.TimeoutError):
+            future.result(timeout=5)
+    timedOut.assert_called_once_with(expiringId)
+    expiring.assert_not_called()  # no made up NAK for the handlers
+    assert iface.responses.stats() == {"outstanding": 0, "expired": 3}
+    assert len(iface.responses._expiry) == 0
+    assert re.search(r"expiry handler of requestId \d+: SystemExit", caplog.text)
+    assert "dropping its response handler" in caplog.text  # the one nobody tells
+    iface.close()
@@ -0,0 +1,139 @@
+"""Meshtastic unit tests for message_dict.py"""
+
+import copy
+import json
+import pickle
+import threading
+
+import pytest
+from google.protobuf.json_format import MessageToDict
+
+from ..message_dict import LazyMessageDict
+from .. import config_pb2, mesh_pb2, portnums_pb2, telemetry_pb2
+
+
+def _samplePacket():
+    packet = mesh_pb2.MeshPacket()
+    setattr(packet, "from", 0x28B5465C)
+    packet.to = 0xFFFFFFFF
+    packet.id = 1234
+    packet.rx_time = 1640000000
+    packet.rx_snr = 6.25
+    packet.hop_limit = 3
+    packet.priority = mesh_pb2.MeshPacket.Priority.RELIABLE
+    packet.decoded.portnum = portnums_pb2.PortNum.POSITION_APP
+    packet.decoded.payload = b"\x0d\x01\x02\x03\x04"
+    packet.decoded.request_id = 99
+    return packet
+
+
+@pytest.mark.unit
+def test_LazyMessageDict_matches_MessageToDict():
+    """The fully converted dict is exactly what MessageToDict would have given us"""
+    packet = _samplePacket()
+    lazy = LazyMessageDict(packet)
+    assert lazy == MessageToDict(packet)
+    assert MessageToDict(packet) == lazy
+    assert list(lazy.keys()) == list(MessageToDict(packet).keys())
+    assert json.dumps(lazy) == json.dumps(MessageToDict(packet))
+
+
+@pytest.mark.unit
+def test_LazyMessageDict_value_types():
+    """int64, floats, repeated fields, bytes and enums are converted like MessageToDict"""
+    telemetry = telemetry_pb2.Telemetry()
+    telemetry.time = 12
+    telemetry.device_metrics.voltage = 4.1
+    telemetry.device_metrics.air_util_tx = float("inf")
+    info = mesh_pb2.NodeInfo()
+    info.num = 5
+    info.user.macaddr = b"\x01\x02\x03"
+    info.user.hw_model = mesh_pb2.HardwareModel.HELTEC_V2_1
+    info.position.time = 1
+    info.snr = float("nan")
+    routing = mesh_pb2.RouteDiscovery()
+    routing.route.extend([1, 2, 3])
+    cfg = config_pb2.Config()
+    cfg.device.role = config_pb2.Config.DeviceConfig.Role.ROUTER
+    for msg in (telemetry, info, routing, cfg):
+        assert json.dumps(LazyMessageDict(msg)) == json.dumps(MessageToDict(msg))
+
+
+@pytest.mark.unit
+def test_LazyMessageDict_converts_on_access():
+    """Only the fields we look at get converted"""
+    packet = _samplePacket()
+    lazy = LazyMessageDict(packet)
+    assert len(lazy) == len(MessageToDict(packet))
+    assert "decoded" in lazy
+    assert "channel" not in lazy
+    assert lazy._pending
+    assert lazy["decoded"]["portnum"] == "POSITION_APP"
+    assert lazy["from"] == 0x28B5465C
+    assert lazy.get("rxSnr") == 6.25
+    assert lazy.get("missing", "x") == "x"
+    assert "decoded" not in lazy._pending
+    assert "priority" in lazy._pending
+
+
+@pytest.mark.unit
+def test_LazyMessageDict_concurrent_reads():
+    """A reader never sees the placeholder of a key another thread is converting"""
+    lazy = LazyMessageDict(_samplePacket())
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slowFactory():
+        calls.append(threading.current_thread())
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        return "converted"
+
+    lazy.setLazy("slow", slowFactory)
+    results = []
+    reader = threading.Thread(target=lambda: results.append(lazy["slow"]))
+    reader.start()
+    assert started.wait(5)
+    assert lazy["slow"] == "converted"
+    assert lazy == {**MessageToDict(_samplePacket()), "slow": "converted"}
+    release.set()
+    reader.join()
+    assert results == ["converted"]
+    assert not lazy._pending
+
+
+@pytest.mark.unit
+def test_LazyMessageDict_mutation():
+    """The dict can be changed like the plain dicts subscribers used to get"""
+    packet = _samplePacket()
+    lazy = LazyMessageDict(packet)
+    lazy["raw"] = packet
+    lazy["decoded"]["payload"] = packet.decoded.payload
+    del lazy["hopLimit"]
+    lazy["to"] = 0
+    assert "hopLimit" not in lazy
+    assert lazy.pop("id") == 1234
+    assert lazy.setdefault("rxTime", 0) == 1640000000
+    expected = MessageToDict(packet)
+    expected["raw"] = packet
+    expected["decoded"]["payload"] = packet.decoded.payload
+    del expected["hopLimit"]
+    del expected["id"]
+    expected["to"] = 0
+    assert lazy == expected
+    assert list(lazy) == list(expected)
+    with pytest.raises(KeyError):
+        del lazy["hopLimit"]
+
+
+@pytest.mark.unit
+def test_LazyMessageDict_copies():
+    """Copies and pickles are plain dicts"""
+    packet = _samplePacket()
+    lazy = LazyMessageDict(packet)
+    for other in (lazy.copy(), copy.deepcopy(lazy), pickle.loads(pickle.dumps(lazy)), dict(lazy), {**lazy}):
+        assert type(other) is dict  # pylint: disable=C0123
+        assert other == MessageToDict(packet)
+    assert str(LazyMessageDict(packet)) == str(MessageToDict(packet))
@@ -0,0 +1,247 @@
+"""Meshtastic unit tests for nodedb.py"""
+
+import json
+import pickle
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from google.protobuf.json_format import MessageToDict
+
+from ..message_dict import LazyMessageDict
+from ..mesh_interface import MeshInterface
+from ..nodedb import NodeDict, NodeRecord, NodeStore, NodeView
+from .. import mesh_pb2, portnums_pb2
+
+
+def _nodeInfo():
+    info = mesh_pb2.NodeInfo(num=0x28AF67CC, snr=6.5, last_heard=1700000000, hops_away=2, via_mqtt=True)
+    info.user.id = "!28af67cc"
+    info.user.long_name = "Unknown 67cc"
+    info.user.short_name = "?CC"
+    info.position.latitude_i = 515000000
+    info.device_metrics.battery_level = 80
+    return info
+
+
+@pytest.mark.unit
+def test_NodeView_mapping():
+    """A view of a record looks like the NodeInfo dict the record was made from, and can't be changed"""
+    info = _nodeInfo()
+    record = NodeRecord(info.num)
+    record.setNodeInfo(info)
+    node = NodeView(record)
+    expected = MessageToDict(info)
+    expected["position"]["latitude"] = 51.5
+    assert node == expected
+    assert len(node) == len(expected)
+    assert node["user"]["longName"] == "Unknown 67cc"
+    assert node.get("viaMqtt") is True
+    assert "channel" not in node
+    assert node.get("channel", 0) == 0
+    with pytest.raises(KeyError):
+        node["channel"]  # pylint: disable=W0104
+    with pytest.raises(TypeError):
+        node["lastHeard"] = 1700000001  # pylint: disable=E1137
+    node["user"]["longName"] = "changed"
+    assert record.longName == "Unknown 67cc"
+    assert json.loads(json.dumps(node.toDict())) == expected
+    assert NodeRecord.fromDict(node.toDict()).toDict() == expected
+
+
+@pytest.mark.unit
+def test_NodeRecord_compact():
+    """Records keep typed fields only, don't hold on to the messages they came from, and share their node IDs"""
+    info = _nodeInfo()
+    user = LazyMessageDict(info.user)
+    user["raw"] = info.user
+    record = NodeRecord.fromDict({"num": info.num, "user": user, "position": {"latitude": 51.5}, "unknown": "x" * 1000})
+    assert record.id is sys.intern("!28af67cc")
+    assert record.longName == "Unknown 67cc"
+    assert record.position.latitude_i == 515000000
+    assert not hasattr(record, "unknown")
+    with pytest.raises(AttributeError):
+        record.unknown = 1  # pylint: disable=E0237
+    record.setNodeInfo(info)
+    assert record.position is not info.position
+
+
+@pytest.mark.unit
+def test_NodeRecord_memoryUsage():
+    """Memory use is measurable, and doesn't grow with what the node keeps sending"""
+    info = _nodeInfo()
+    record = NodeRecord(info.num)
+    record.setNodeInfo(info)
+    size = record.memoryUsage()
+    assert 0 < size < 2000
+    for n in range(100):
+        meshPacket = mesh_pb2.MeshPacket(to=1, rx_time=1700000000 + n, rx_snr=5.0, hop_limit=3)
+        meshPacket.decoded.payload = b"x" * 200
+        record.heard(meshPacket, meshPacket.rx_time, meshPacket.rx_snr, meshPacket.hop_limit)
+        record.setNodeInfo(info)
+    assert record.memoryUsage() <= size + sys.getsizeof(meshPacket) + meshPacket.ByteSize() + 100
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_NodeView_lastReceived(quiet_iface):
+    """node["lastReceived"] is built from the last packet of the node"""
+    iface = quiet_iface
+    iface._startConfig()
+    meshPacket = mesh_pb2.MeshPacket(to=0xFFFFFFFF, rx_time=1700000000)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    meshPacket.decoded.payload = b"hello"
+    iface._handlePacketFromRadio(meshPacket)
+    node = iface.nodesByNum[2]
+    assert node["lastReceived"]["decoded"]["payload"] == b"hello"
+    assert node["lastReceived"]["toId"] == "^all"
+    assert "lastReceived" not in node.toDict()
+    assert json.loads(json.dumps({nodeId: node.toDict() for nodeId, node in iface.nodesByNum.items()}))
+
+
+@pytest.mark.unit
+def test_NodeDict_snapshots():
+    """Iteration goes over a snapshot that is shared until the next change"""
+    nodes = NodeDict({1: "a"})
+    first = nodes.snapshot()
+    assert nodes.snapshot() is first
+    for key in nodes:
+        nodes[key + 1] = "b"  # no "dictionary changed size during iteration"
+    assert nodes.version == 1
+    assert nodes.snapshot() is not first
+    assert dict(nodes.items()) == {1: "a", 2: "b"}
+    assert nodes.setdefault(2, "c") == "b"
+    assert nodes.setdefault(3, "c") == "c"
+    assert nodes.pop(3) == "c"
+    assert list(nodes) == [1, 2]
+    assert pickle.loads(pickle.dumps(nodes)) == nodes
+
+
+@pytest.mark.unit
+def test_NodeDict_stress(quiet_iface):
+    """Readers iterating the node DB while the reader thread floods it with new nodes"""
+    iface = quiet_iface
+    iface._startConfig()
+    errors = []
+    done = threading.Event()
+
+    def flood():
+        try:
+            for n in range(1, 3001):
+                meshPacket = mesh_pb2.MeshPacket(to=1, rx_time=1700000000 + n)
+                setattr(meshPacket, "from", n)
+                meshPacket.decoded.portnum = portnums_pb2.PortNum.NODEINFO_APP
+                meshPacket.decoded.payload = mesh_pb2.User(id=f"!{n:08x}", long_name=f"Node {n}").SerializeToString()
+                iface._handlePacketFromRadio(meshPacket)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                assert all(node["num"] for node in iface.nodesByNum.values())
+                assert all(nodeId == node["user"]["id"] for nodeId, node in iface.nodes.items())
+                assert all(num in iface.nodesByNum for num in iface.nodesByNum)
+        except Exception as ex:  # pylint: disable=W0703
+            errors.append(ex)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    flood()
+    for reader in readers:
+        reader.join()
+    assert not errors
+    assert len(iface.nodesByNum) == len(iface.nodes) == 3000
+
+
+@pytest.mark.unit
+def test_NodeStore(tmp_path):
+    """Records are written in batches and loaded per local node"""
+    store = NodeStore(str(tmp_path / "nodes.db"), flushInterval=0.05)
+    record = NodeRecord.fromDict({"num": 5, "user": {"id": "!00000005", "longName": "five"}, "lastHeard": 1700000000})
+    store.markDirty(1, record)
+    store.markDirty(1, record)
+    store.markDirty(2, NodeRecord(6))
+    deadline = time.monotonic() + 5
+    while store.writes < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.writes == 2
+    record.setPosition({"latitude": 51.5})
+    store.markDirty(1, record)
+    store.close()
+
+    store = NodeStore(str(tmp_path / "nodes.db"))
+    assert {num: stored.toDict() for num, stored in store.load(1).items()} == {5: record.toDict()}
+    assert list(store.load(2)) == [6]
+    store.forget(2)
+    assert not store.load(2)
+    assert not store.load(3)
+    store.close()
+
+
+@pytest.mark.unit
+def test_NodeStore_warm_restart(tmp_path):
+    """An interface starts with what the last one learned about its mesh"""
+    store = NodeStore(str(tmp_path / "nodes.db"))
+
+    def connect():
+        iface = MeshInterface(noProto=True, nodeStore=store)
+        iface._hasListeners = MagicMock(return_value=False)
+        iface._startConfig()
+        fromRadio = mesh_pb2.FromRadio()
+        fromRadio.my_info.my_node_num = 1
+        iface._handleFromRadio(fromRadio.SerializeToString())
+        return iface
+
+    iface = connect()
+    meshPacket = mesh_pb2.MeshPacket(to=1, rx_time=1700000000)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.POSITION_APP
+    meshPacket.decoded.payload = mesh_pb2.Position(latitude_i=515000000).SerializeToString()
+    iface._handlePacketFromRadio(meshPacket)
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.node_info.num = 3
+    fromRadio.node_info.user.id = "!00000003"
+    iface._handleFromRadio(fromRadio.SerializeToString())
+    iface.close()
+
+    iface = connect()
+    assert iface.nodesByNum[2]["position"]["latitude"] == pytest.approx(51.5)
+    assert iface.nodes["!00000003"] is iface.nodesByNum[3]
+    # the device's NodeInfo updates the stored node, without forgetting what only we knew
+    fromRadio = mesh_pb2.FromRadio()
+    fromRadio.node_info.num = 2
+    fromRadio.node_info.snr = 4.0
+    iface._handleFromRadio(fromRadio.SerializeToString())
+    assert iface.nodesByNum[2]["snr"] == 4.0
+    assert "position" in iface.nodesByNum[2]
+    iface.close()
+    store.close()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_NodeStore_marks_after_updates(tmp_path, quiet_iface):
+    """Nodes are marked for saving once they changed, a flush in between can't lose the change"""
+    store = NodeStore(str(tmp_path / "nodes.db"))
+    markDirty = store.markDirty
+
+    def markAndFlush(owner, record):
+        markDirty(owner, record)
+        store.flush()  # as if the flush thread got there right away
+
+    store.markDirty = markAndFlush
+    iface = quiet_iface
+    iface.nodeStore = store
+    iface.myInfo = mesh_pb2.MyNodeInfo(my_node_num=1)
+    meshPacket = mesh_pb2.MeshPacket(to=1, rx_time=1700000000)
+    setattr(meshPacket, "from", 2)
+    meshPacket.decoded.portnum = portnums_pb2.PortNum.POSITION_APP
+    meshPacket.decoded.payload = mesh_pb2.Position(latitude_i=515000000).SerializeToString()
+    iface._handlePacketFromRadio(meshPacket)
+    assert store.load(1)[2].position.latitude_i == 515000000
+    store.close()
@@ -0,0 +1,84 @@
+"""Meshtastic unit tests for pacing.py"""
+
+import threading
+import time
+
+import pytest
+
+from ..pacing import FixedDelayPacer, QueueStatusPacer, WritePacer
+
+
+@pytest.mark.unit
+def test_WritePacer_never_waits():
+    """Test that the base pacer doesn't block"""
+    pacer = WritePacer()
+    start = time.monotonic()
+    for _ in range(10):
+        pacer.waitToWrite()
+        pacer.wrote(10)
+    assert time.monotonic() - start < 0.05
+
+
+@pytest.mark.unit
+def test_FixedDelayPacer():
+    """Test that only the second of two close writes waits"""
+    pacer = FixedDelayPacer(0.05)
+    start = time.monotonic()
+    pacer.waitToWrite()
+    assert time.monotonic() - start < 0.04
+    pacer.wrote(10)
+    pacer.waitToWrite()
+    assert time.monotonic() - start >= 0.05
+
+
+@pytest.mark.unit
+def test_QueueStatusPacer_feedback_releases_writer():
+    """Test that a QueueStatus from the device lets the next write go early"""
+    pacer = QueueStatusPacer(maxDelay=5.0)
+    pacer.wrote(10)
+    threading.Timer(0.05, pacer.onQueueStatus, args=(None,)).start()
+    start = time.monotonic()
+    pacer.waitToWrite()
+    assert time.monotonic() - start < 2.0
+
+
+@pytest.mark.unit
+def test_QueueStatusPacer_maxDelay():
+    """Test that without feedback we wait maxDelay"""
+    pacer = QueueStatusPacer(maxDelay=0.05)
+    pacer.wrote(10)
+    start = time.monotonic()
+    pacer.waitToWrite()
+    assert time.monotonic() - start >= 0.04
+    # No write since, so no waiting
+    start = time.monotonic()
+    pacer.waitToWrite()
+    assert time.monotonic() - start < 0.04
+
+
+@pytest.mark.unit
+def test_QueueStatusPacer_unanswered_writes():
+    """Test that writes the device doesn't answer don't wait for a QueueStatus"""
+    pacer = QueueStatusPacer(maxDelay=5.0)
+    pacer.wrote(10, expectsReply=False)
+    start = time.monotonic()
+    pacer.waitToWrite()
+    assert time.monotonic() - start < 1.0
+
+
+@pytest.mark.unit
+def test_pacers_writeDelay():
+    """Test that writeDelay() reports the waiting waitToWrite() would do"""
+    assert WritePacer().writeDelay() == 0.0
+    fixed = FixedDelayPacer(delay=5.0)
+    assert fixed.writeDelay() == 0.0
+    fixed.wrote(10)
+    assert 4.0 < fixed.writeDelay() <= 5.0
+    pacer = QueueStatusPacer(maxDelay=5.0)
+    pacer.wrote(10)
+    assert 4.0 < pacer.writeDelay() <= 5.0
+    pacer.onQueueStatus(None)
+    assert pacer.writeDelay() == 0.0
+    pacer = QueueStatusPacer(maxDelay=0.0)
+    pacer.wrote(10)
+    assert pacer.writeDelay() == 0.0
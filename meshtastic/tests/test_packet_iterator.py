@@ -0,0 +1,76 @@
+"""Meshtastic unit tests for packet_iterator.py"""
+
+import asyncio
+import threading
+
+import pytest
+
+from ..packet_iterator import AsyncPacketIterator, PacketIterator
+
+
+@pytest.mark.unit
+def test_PacketIterator_topics_and_filter():
+    """Only packets on our topics that pass the filter are kept"""
+    iterator = PacketIterator(["meshtastic.receive.text"], filter=lambda p: p["from"] == 1)
+    assert iterator.offer("meshtastic.receive.text", {"from": 1})
+    assert not iterator.offer("meshtastic.receive.text", {"from": 2})
+    assert not iterator.offer("meshtastic.receive.textual", {"from": 1})
+    assert not iterator.offer("meshtastic.receive", {"from": 1})
+    assert PacketIterator().wants("meshtastic.receive.data.1")
+    iterator.close()
+    assert not iterator.offer("meshtastic.receive.text", {"from": 1})
+    assert list(iterator) == [{"from": 1}]
+
+
+@pytest.mark.unit
+def test_PacketIterator_filter_error():
+    """A failing filter drops the packet, it doesn't break the reader"""
+    iterator = PacketIterator(filter=lambda p: p["missing"])
+    assert not iterator.offer("meshtastic.receive", {})
+    assert not iterator
+
+
+@pytest.mark.unit
+def test_PacketIterator_overflow():
+    """A slow consumer loses the oldest packets"""
+    iterator = PacketIterator(maxsize=2)
+    for i in range(5):
+        iterator.offer("meshtastic.receive", i)
+    assert iterator.stats() == {"depth": 2, "received": 5, "dropped": 3}
+    assert iterator.get(0) == 3
+    assert iterator.get(0) == 4
+    assert iterator.get(0.01) is None
+
+
+@pytest.mark.unit
+def test_PacketIterator_threads():
+    """Packets offered from another thread wake up the consumer, close ends the iteration"""
+    closed = []
+    iterator = PacketIterator(onClose=closed.append)
+
+    def producer():
+        for i in range(100):
+            iterator.offer("meshtastic.receive", i)
+        iterator.close()
+
+    threading.Thread(target=producer).start()
+    assert list(iterator) == list(range(100))
+    assert closed == [iterator]
+
+
+@pytest.mark.unit
+def test_AsyncPacketIterator():
+    """Packets offered from another thread reach the coroutine"""
+
+    async def run():
+        iterator = AsyncPacketIterator(asyncio.get_running_loop())
+
+        def producer():
+            for i in range(100):
+                iterator.offer("meshtastic.receive", i)
+            iterator.close()
+
+        threading.Thread(target=producer).start()
+        return [packet async for packet in iterator]
+
+    assert asyncio.run(run()) == list(range(100))
@@ -0,0 +1,105 @@
+"""Meshtastic unit tests for reactor.py"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from .. import mesh_pb2
+from ..framing import frameBytes
+from ..pacing import QueueStatusPacer
+from ..reactor import StreamReactor
+from ..tcp_interface import TCPInterface
+
+
+def _waitFor(predicate, timeout=5.0):
+    """Poll until predicate() is true"""
+    expire = time.monotonic() + timeout
+    while time.monotonic() < expire:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.mark.unit
+def test_StreamReactor_callLater():
+    """Test that timers run on the reactor thread and can be cancelled"""
+    reactor = StreamReactor()
+    ran = []
+    reactor.callLater(0.01, lambda: ran.append(threading.current_thread().name))
+    cancelled = reactor.callLater(0.01, lambda: ran.append("cancelled"))
+    cancelled.cancel()
+    assert _waitFor(lambda: ran)
+    time.sleep(0.05)
+    assert ran == ["meshtastic reactor"]
+    reactor.close()
+
+
+@pytest.mark.unitslow
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamReactor_many_interfaces():
+    """Test that one reactor thread services several interfaces"""
+    reactor = StreamReactor()
+    threadsBefore = threading.active_count()
+    ifaces = []
+    peers = []
+    received = {}
+    for i in range(5):
+        ours, theirs = socket.socketpair()
+        iface = TCPInterface(hostname="localhost", noProto=True, connectNow=False, reactor=reactor)
+        iface.socket = ours
+        received[i] = []
+        iface._handleFromRadio = lambda b, r=received[i]: r.append(bytes(b))
+        iface.connect()
+        ifaces.append(iface)
+        peers.append(theirs)
+    assert threading.active_count() == threadsBefore
+
+    for i, peer in enumerate(peers):
+        peer.sendall(frameBytes(b"radio%d" % i) + frameBytes(b"again"))
+    assert _waitFor(lambda: all(len(r) == 2 for r in received.values()))
+    assert received[3] == [b"radio3", b"again"]
+
+    # losing one radio doesn't stop the others
+    lost = []
+    ifaces[0]._disconnected = lambda: lost.append(True)
+    peers[0].close()
+    assert _waitFor(lambda: lost)
+    assert not reactor.isRegistered(ifaces[0])
+    peers[1].sendall(frameBytes(b"more"))
+    assert _waitFor(lambda: len(received[1]) == 3)
+
+    for iface in ifaces[1:]:
+        iface.close()
+        assert not reactor.isRegistered(iface)
+    reactor.close()
+
+
+@pytest.mark.unitslow
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamReactor_paced_writes_dont_block():
+    """Test that a write the pacer holds back doesn't block the reactor thread"""
+    reactor = StreamReactor()
+    ours, theirs = socket.socketpair()
+    iface = TCPInterface(hostname="localhost", noProto=True, connectNow=False, reactor=reactor,
+                         pacer=QueueStatusPacer(maxDelay=30.0))
+    iface.socket = ours
+    iface.connect()
+    assert reactor.callSoon(lambda: None) is not None and not reactor.inThread()
+
+    # written right away, then the pacer waits for a QueueStatus
+    iface._writeFrame(frameBytes(b"one"))
+    ran = []
+    reactor.callSoon(lambda: ran.append(iface._writeFrame(frameBytes(b"two"))))
+    reactor.callLater(0.01, lambda: ran.append("timer"))
+    assert _waitFor(lambda: len(ran) == 2)
+    theirs.settimeout(5.0)
+    assert theirs.recv(100).endswith(frameBytes(b"one"))  # after the wake up bytes connect() sends
+
+    iface._handleQueueStatusFromRadio(mesh_pb2.QueueStatus())
+    assert theirs.recv(100) == frameBytes(b"two")
+    iface.close()
+    theirs.close()
+    reactor.close()
@@ -0,0 +1,42 @@
+"""Meshtastic unit tests for response_tracking.py"""
+
+import concurrent.futures
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..response_future import ResponseFuture
+from ..response_tracking import ResponseTracker
+from .. import mesh_pb2
+
+
+@pytest.mark.unit
+def test_ResponseTracker():
+    """Requests expire on the timer they were given, answered ones are forgotten"""
+    timers = []
+    tracker = ResponseTracker(
+        lambda interval, callback, daemon: timers.append(callback) or MagicMock(),
+        lambda handler, packet: handler(packet),
+        lambda: 1,
+    )
+    tracker.timeout = 10.0
+    onExpire = MagicMock()
+    tracker.addHandler(7, MagicMock(), onExpire)
+    future = ResponseFuture(mesh_pb2.MeshPacket(id=8, to=2), wantAck=True, wantResponse=False)
+    tracker.addFuture(future, timeout=0.0)
+    answered = ResponseFuture(mesh_pb2.MeshPacket(id=9, to=2), wantAck=True, wantResponse=False)
+    tracker.addFuture(answered)
+    assert tracker.waitsFor(7) and tracker.waitsFor(8) and tracker.waitsFor(9)
+    assert len(timers) == 2  # a sooner deadline replaced the first timer
+
+    tracker.resolveFuture(9, 1, "NONE", "implicit ack")
+    assert not answered.done()  # only our own device heard it
+    tracker.resolveFuture(9, 2, "NONE", "ack")
+    assert answered.result() == "ack"
+    assert not tracker.waitsFor(9)
+
+    timers[-1]()
+    with pytest.raises(concurrent.futures.TimeoutError):
+        future.result(timeout=0)
+    onExpire.assert_not_called()  # not due yet
+    assert tracker.stats() == {"outstanding": 1, "expired": 1}
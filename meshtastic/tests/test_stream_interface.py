@@ -1,11 +1,15 @@
 """Meshtastic unit tests for stream_interface.py"""
 
 import logging
+import threading
+import time
 from unittest.mock import MagicMock
 
 import pytest
 
-from ..stream_interface import StreamInterface
+from .. import mesh_pb2
+from ..pacing import WritePacer
+from ..stream_interface import StreamInterface, frameBytes
 
 # import re
 
@@ -36,6 +40,164 @@ def test_StreamInterface_with_noProto(caplog):
         assert data == test_data
 
 
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamInterface_handleFrames():
+    """Test that chunks read from the stream are split into frames and debug output"""
+    debugOut = MagicMock()
+    iface = StreamInterface(debugOut=debugOut, noProto=True, connectNow=False)
+    received = []
+    iface._handleFromRadio = lambda b: received.append(bytes(b))
+    data = b"INFO boot\n" + frameBytes(b"one") + frameBytes(b"two")
+    iface._handleFrames(data[:12])
+    iface._handleFrames(data[12:])
+    assert received == [b"one", b"two"]
+    debugOut.write.assert_called_with("INFO boot\n")
+
+
+class GatedPacer(WritePacer):
+    """Let the first openWrites writes through, hold the ones after that until released"""
+
+    def __init__(self, openWrites=0, error=None):
+        self.openWrites = openWrites
+        self.error = error  # raised once released
+        self.writes = 0
+        self.waiting = threading.Event()
+        self.release = threading.Event()
+
+    def waitToWrite(self):
+        if self.writes >= self.openWrites:
+            self.waiting.set()
+            self.release.wait(5)
+            if self.error is not None:
+                raise self.error
+
+    def wrote(self, nbytes, expectsReply=True):
+        self.writes += 1
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamInterface_writeFrame_coalesces():
+    """Test that frames queued while the writer waits on the pacer go out in one write"""
+
+    pacer = GatedPacer(openWrites=1)
+    iface = StreamInterface(noProto=True, connectNow=False, pacer=pacer)
+    iface.stream = MagicMock()
+    iface._writeFrame(b"one")
+    writer = threading.Thread(target=iface._writeFrame, args=(b"two",))
+    writer.start()
+    assert pacer.waiting.wait(5)
+    others = [threading.Thread(target=iface._writeFrame, args=(frame,)) for frame in (b"three", b"four")]
+    for queued, other in enumerate(others, start=2):
+        other.start()  # in order, so they are coalesced in order
+        assert _waitForQueued(iface, queued)
+    pacer.release.set()
+    for thread in [writer] + others:
+        thread.join(5)
+    assert iface._waitForWrites()
+    written = [c.args[0] for c in iface.stream.write.call_args_list]
+    assert written == [b"one", b"twothreefour"]
+
+
+def _waitForQueued(iface, count):
+    """Wait until count frames are queued for writing"""
+    expire = time.monotonic() + 5
+    while len(iface._txFrames) < count and time.monotonic() < expire:
+        time.sleep(0.01)
+    return len(iface._txFrames) >= count
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamInterface_writeFrame_reports_errors():
+    """Test that a failed write raises in every thread whose frame was in it"""
+
+    pacer = GatedPacer()
+    iface = StreamInterface(noProto=True, connectNow=False, pacer=pacer)
+    iface.stream = MagicMock()
+    iface.stream.write.side_effect = OSError("gone")
+    errors = []
+
+    def write(frame):
+        try:
+            iface._writeFrame(frame)
+        except OSError as ex:
+            errors.append((frame, str(ex)))
+
+    writer = threading.Thread(target=write, args=(b"one",))
+    writer.start()
+    assert pacer.waiting.wait(5)
+    other = threading.Thread(target=write, args=(b"two",))
+    other.start()
+    assert _waitForQueued(iface, 2)
+    pacer.release.set()
+    writer.join(5)
+    other.join(5)
+    assert sorted(errors) == [(b"one", "gone"), (b"two", "gone")]
+    iface.stream.write.assert_called_once_with(b"onetwo")
+    assert iface._waitForWrites()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamInterface_writeFrame_reports_pacer_errors():
+    """Test that a pacer failing to wait raises in every thread whose frame was waiting for it"""
+    pacer = GatedPacer(error=OSError("no queue status"))
+    iface = StreamInterface(noProto=True, connectNow=False, pacer=pacer)
+    iface.stream = MagicMock()
+    errors = []
+
+    def write(frame):
+        try:
+            iface._writeFrame(frame)
+        except OSError as ex:
+            errors.append((frame, str(ex)))
+
+    writer = threading.Thread(target=write, args=(b"one",))
+    writer.start()
+    assert pacer.waiting.wait(5)
+    other = threading.Thread(target=write, args=(b"two",))
+    other.start()
+    assert _waitForQueued(iface, 2)
+    pacer.release.set()
+    writer.join(5)
+    other.join(5)
+    assert sorted(errors) == [(b"one", "no queue status"), (b"two", "no queue status")]
+    iface.stream.write.assert_not_called()
+    assert iface._waitForWrites()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamInterface_only_packets_expect_replies():
+    """Test that the pacer only waits for a QueueStatus after writes of MeshPackets"""
+    pacer = MagicMock()
+    iface = StreamInterface(noProto=True, connectNow=False, pacer=pacer)
+    iface.stream = MagicMock()
+    heartbeat = mesh_pb2.ToRadio()
+    heartbeat.heartbeat.CopyFrom(mesh_pb2.Heartbeat())
+    iface._sendToRadioImpl(heartbeat)
+    packet = mesh_pb2.ToRadio()
+    packet.packet.id = 1
+    iface._sendToRadioImpl(packet)
+    assert [c.args[1] for c in pacer.wrote.call_args_list] == [False, True]
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_StreamInterface_close_on_reader_thread():
+    """Closing from the reader thread (i.e. in a packet handler) doesn't wait for the TX queue to drain"""
+    iface = StreamInterface(noProto=True, connectNow=False)
+    iface.stream = MagicMock()
+    iface.txQueue.flush = MagicMock(return_value=True)
+    iface._rxThread = threading.Thread(target=iface.close, kwargs={"flushTimeout": 5.0})
+    iface._rxThread.start()
+    iface._rxThread.join(timeout=5)
+    assert not iface._rxThread.is_alive()
+    iface.txQueue.flush.assert_not_called()
+
+
 # TODO
 ### Note: This takes a bit, so moving from unit to slow
 ### Tip: If you want to see the print output, run with '-s' flag:
@@ -0,0 +1,217 @@
+"""Meshtastic unit tests for tx_queue.py"""
+
+import threading
+
+import pytest
+
+from .. import mesh_pb2, portnums_pb2
+from ..tx_queue import ADMIN_PRIORITY, TxError, TxQueue, packetPriority
+
+
+class _Device:
+    """Records what a TxQueue sends"""
+
+    def __init__(self):
+        self.sent = []
+        self.cond = threading.Condition()
+
+    def send(self, toRadio):
+        """Record the ID of a sent packet"""
+        with self.cond:
+            self.sent.append(toRadio.packet.id)
+            self.cond.notify_all()
+
+    def waitFor(self, count):
+        """Wait until count packets were sent, returns their IDs"""
+        with self.cond:
+            assert self.cond.wait_for(lambda: len(self.sent) >= count, 5)
+        return self.sent
+
+
+def _toRadio(packetId, priority=mesh_pb2.MeshPacket.Priority.UNSET, portnum=portnums_pb2.PortNum.UNKNOWN_APP):
+    toRadio = mesh_pb2.ToRadio()
+    toRadio.packet.id = packetId
+    toRadio.packet.priority = priority
+    toRadio.packet.decoded.portnum = portnum
+    return toRadio
+
+
+def _status(packetId, free, res=0):
+    return mesh_pb2.QueueStatus(res=res, free=free, maxlen=16, mesh_packet_id=packetId)
+
+
+@pytest.mark.unit
+def test_TxQueue_untracked():
+    """Until the device reports its queue status packets are sent as they come"""
+    device = _Device()
+    queue = TxQueue(device.send)
+    futures = [queue.enqueue(_toRadio(i)) for i in (1, 2, 3)]
+    assert [f.result(5) for f in futures] == [None, None, None]
+    assert device.sent == [1, 2, 3]
+    assert queue.flush(0) and len(queue) == 0
+    queue.close()
+
+
+@pytest.mark.unit
+def test_TxQueue_waits_for_free_slots():
+    """With the device's queue full we send the next packet as soon as a slot frees up"""
+    device = _Device()
+    queue = TxQueue(device.send)
+    queue.onQueueStatus(_status(0, free=1))
+    first, second = queue.enqueue(_toRadio(1)), queue.enqueue(_toRadio(2))
+    assert device.waitFor(1) == [1]
+    assert not queue.flush(0.05)  # no room for the second one
+    assert queue.stats() == {"pending": 1, "inflight": 1, "sent": 1, "resent": 0}
+
+    queue.onQueueStatus(_status(1, free=1))
+    assert first.result(0).mesh_packet_id == 1
+    assert device.waitFor(2) == [1, 2]
+    queue.onQueueStatus(_status(2, free=1))
+    assert second.result(5).mesh_packet_id == 2
+    assert len(queue) == 0
+    queue.close()
+
+
+@pytest.mark.unit
+def test_TxQueue_resends_refused_packets():
+    """A QueueStatus error sends the packet again, until maxAttempts"""
+    device = _Device()
+    queue = TxQueue(device.send, maxAttempts=2)
+    queue.onQueueStatus(_status(0, free=4))
+    future = queue.enqueue(_toRadio(7))
+    device.waitFor(1)
+    queue.onQueueStatus(_status(7, free=4, res=1))
+    device.waitFor(2)
+    assert queue.flush(5)
+    queue.onQueueStatus(_status(7, free=4, res=1))
+    with pytest.raises(TxError) as ex:
+        future.result(0)
+    assert ex.value.queueStatus.res == 1
+    assert queue.stats()["resent"] == 1
+
+
+@pytest.mark.unit
+def test_TxQueue_resendUnconfirmed_and_close():
+    """Packets the device didn't confirm go out again first, closing fails what is left"""
+    device = _Device()
+    queue = TxQueue(device.send)
+    queue.onQueueStatus(_status(0, free=2))
+    futures = [queue.enqueue(_toRadio(i)) for i in (1, 2, 3)]
+    assert device.waitFor(2) == [1, 2]
+    queue.onQueueStatus(_status(0, free=2))
+    queue.resendUnconfirmed()
+    assert device.waitFor(4) == [1, 2, 1, 2]
+    queue.close()
+    for future in futures:
+        with pytest.raises(TxError):
+            future.result(0)
+    with pytest.raises(TxError):
+        queue.enqueue(_toRadio(4)).result(0)
+
+
+@pytest.mark.unit
+def test_TxQueue_scheduled():
+    """With a scheduler packets are sent from there, without a thread of our own"""
+    device = _Device()
+    scheduled = []
+    queue = TxQueue(device.send, schedule=scheduled.append)
+    queue.onQueueStatus(_status(0, free=1))
+    first, second = queue.enqueue(_toRadio(1)), queue.enqueue(_toRadio(2))
+    assert len(scheduled) == 1 and not device.sent  # one pump for both
+    scheduled.pop()()
+    assert device.sent == [1]
+    assert queue._thread is None
+    queue.onQueueStatus(_status(1, free=1))
+    assert first.result(0).mesh_packet_id == 1
+    scheduled.pop()()
+    assert device.sent == [1, 2]
+    queue.onQueueStatus(_status(2, free=1))
+    assert second.result(0).mesh_packet_id == 2
+    assert not scheduled
+    queue.close()
+
+
+@pytest.mark.unit
+def test_MeshInterface_sendToRadio_doesnt_block(iface_with_mock_radio):
+    """Senders get a future back right away, even while the device's queue is full"""
+    iface = iface_with_mock_radio
+    iface._handleQueueStatusFromRadio(_status(0, free=0))
+    future = iface._sendToRadio(_toRadio(5))
+    assert not future.done()
+    iface._sendToRadioImpl.assert_not_called()
+    iface._handleQueueStatusFromRadio(_status(0, free=1))
+    assert iface.txQueue.flush(5)
+    iface._sendToRadioImpl.assert_called_once()
+    iface._handleQueueStatusFromRadio(_status(5, free=1))
+    assert future.result(0).mesh_packet_id == 5
+
+
+@pytest.mark.unit
+def test_TxQueue_priorities():
+    """Higher priorities go first, FIFO within a priority"""
+    Priority = mesh_pb2.MeshPacket.Priority
+    device = _Device()
+    queue = TxQueue(device.send)
+    queue.onQueueStatus(_status(0, free=0))  # hold everything until we queued it all
+    for packetId, priority in (
+        (1, Priority.BACKGROUND), (2, Priority.UNSET), (3, Priority.BACKGROUND), (4, Priority.MAX), (5, Priority.UNSET)
+    ):
+        queue.enqueue(_toRadio(packetId, priority))
+    queue.enqueue(_toRadio(6, portnum=portnums_pb2.PortNum.ADMIN_APP))
+    assert queue.depths() == {"MAX": 1, "ADMIN": 1, "DEFAULT": 2, "BACKGROUND": 2}
+    queue.onQueueStatus(_status(0, free=6))
+    assert device.waitFor(6) == [4, 6, 2, 5, 1, 3]
+    assert queue.depths() == {}
+    queue.close()
+
+    reliable = mesh_pb2.MeshPacket(want_ack=True)
+    assert packetPriority(reliable) == Priority.RELIABLE
+    reliable.priority = Priority.MIN
+    assert packetPriority(reliable) == Priority.MIN
+    admin = mesh_pb2.MeshPacket(want_ack=True)
+    admin.decoded.portnum = portnums_pb2.PortNum.ADMIN_APP
+    assert packetPriority(admin) == ADMIN_PRIORITY
+    admin.priority = Priority.BACKGROUND
+    assert packetPriority(admin) == Priority.BACKGROUND
+
+
+@pytest.mark.unit
+def test_TxQueue_starvation_guard():
+    """Packets that waited longer than maxWait go first, the longest waiting one first"""
+    Priority = mesh_pb2.MeshPacket.Priority
+    device = _Device()
+    queue = TxQueue(device.send, maxWait=0.0)
+    queue.onQueueStatus(_status(0, free=0))
+    for packetId, priority in ((1, Priority.MIN), (2, Priority.BACKGROUND), (3, Priority.MAX)):
+        queue.enqueue(_toRadio(packetId, priority))
+    queue.onQueueStatus(_status(0, free=3))
+    assert device.waitFor(3) == [1, 2, 3]
+    queue.close()
+
+
+@pytest.mark.unit
+def test_MeshInterface_sendData_priority(iface_with_mock_radio):
+    """sendData() puts the priority in the packet, admin messages go ahead of wantAck ones without one"""
+    iface = iface_with_mock_radio
+    p = iface.sendData(b"reading", 1, priority=mesh_pb2.MeshPacket.Priority.BACKGROUND)
+    assert p.priority == mesh_pb2.MeshPacket.Priority.BACKGROUND
+    iface.sendText("hi", 1, wantAck=True)
+    iface.localNode.reboot()
+    assert iface.txQueue.flush(5)
+    sent = [c.args[0].packet for c in iface._sendToRadioImpl.call_args_list]
+    assert sorted(packetPriority(packet) for packet in sent) == [
+        mesh_pb2.MeshPacket.Priority.BACKGROUND, mesh_pb2.MeshPacket.Priority.RELIABLE, ADMIN_PRIORITY
+    ]
+    admin = [packet for packet in sent if packet.decoded.portnum == portnums_pb2.PortNum.ADMIN_APP]
+    assert admin[0].priority == mesh_pb2.MeshPacket.Priority.UNSET
+
+
+@pytest.mark.unit
+def test_MeshInterface_request_fails_when_not_sent(iface_with_mock_radio):
+    """A request whose packet the TX queue gave up on fails without waiting for its timeout"""
+    iface = iface_with_mock_radio
+    iface._sendToRadioImpl.side_effect = OSError("gone")
+    future = iface.sendRequest(b"ping", 1, timeout=60)
+    with pytest.raises(OSError):
+        future.result(5)
+    assert iface.responses.stats()["outstanding"] == 0
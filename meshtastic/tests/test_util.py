@@ -3,13 +3,21 @@
 import json
 import logging
 import re
+import threading
+import time
+from typing import Dict, List
 from unittest.mock import patch
 
 import pytest
+from pubsub import pub # type: ignore[import-untyped]
 
 from meshtastic.supported_device import SupportedDevice
 from meshtastic.mesh_pb2 import MyNodeInfo
 from meshtastic.util import (
+    Acknowledgment,
+    DeferredExecution,
+    ExpiryQueue,
+    ListenerCache,
     Timeout,
     active_ports_on_supported_devices,
     camel_to_snake,
@@ -244,6 +252,45 @@ def test_Timeout_found():
     to.waitForSet("bar", attrs)
 
 
+@pytest.mark.unit
+def test_Timeout_waitForAckNak_wakes_up():
+    """An acknowledgment set by another thread ends the wait right away, without polling"""
+    acknowledgment = Acknowledgment()
+    to = Timeout(5)
+    threading.Timer(0.01, setattr, (acknowledgment, "receivedNak", True)).start()
+    start = time.monotonic()
+    assert to.waitForAckNak(acknowledgment)
+    assert time.monotonic() - start < to.sleepInterval
+    assert not acknowledgment.receivedNak  # reset for the next wait
+    assert not Timeout(0.01).waitForTelemetry(acknowledgment)
+
+
+@pytest.mark.unit
+def test_ExpiryQueue():
+    """Keys come out earliest deadline first, discarded ones don't"""
+    queue = ExpiryQueue()
+    for key, deadline in (("c", 3.0), ("a", 1.0), ("b", 2.0), ("d", 4.0)):
+        queue.add(key, deadline)
+    queue.discard("b")
+    queue.add("d", 1.5)  # moved earlier
+    assert queue.nextDeadline() == 1.0
+    assert not queue.popExpired(0.5)
+    assert queue.popExpired(3.0) == ["a", "d", "c"]
+    assert len(queue) == 0 and queue.nextDeadline() is None
+
+    for i in range(1000):
+        queue.add(i, float(i))
+        queue.discard(i)
+    assert len(queue._heap) < 200  # stale entries are compacted away
+
+    for i in range(1000):
+        queue.add(i, float(i))
+    for i in range(1000):
+        queue.discard(i)  # i.e. requests answered long before they expire
+    assert len(queue._heap) <= ExpiryQueue.COMPACT_SLACK + 1
+    assert not queue.popExpired(2000.0)
+
+
 @pytest.mark.unitslow
 def test_hexstr():
     """Test hexstr()"""
@@ -555,3 +602,146 @@ def test_message_to_json_shows_all():
     actual = json.loads(message_to_json(MyNodeInfo()))
     expected = { "myNodeNum": 0, "rebootCount": 0, "minAppVersion": 0 }
     assert actual == expected
+
+
+@pytest.mark.unit
+def test_ListenerCache():
+    """Test ListenerCache notices subscriptions, on the topic, its parents and ALL_TOPICS"""
+    cache = ListenerCache()
+
+    def listener(packet):  # pylint: disable=W0613
+        pass
+
+    def allListener(topic=pub.AUTO_TOPIC, **kwargs):  # pylint: disable=W0613
+        pass
+
+    assert not cache.hasListeners("meshtastic.test_listenercache.child")
+    assert cache._answers == {"meshtastic.test_listenercache.child": False}
+    assert pub.getNotificationFlags()["subscribe"]
+    pub.subscribe(listener, "meshtastic.test_listenercache")
+    try:
+        assert cache.hasListeners("meshtastic.test_listenercache.child")
+        assert cache.hasListeners("meshtastic.test_listenercache")
+        assert not cache.hasListeners("meshtastic.test_listenercache_other")
+        assert cache.hasListeners("meshtastic.test_listenercache.child")  # from the cache
+    finally:
+        pub.unsubscribe(listener, "meshtastic.test_listenercache")
+    assert not cache.hasListeners("meshtastic.test_listenercache.child")
+
+    pub.subscribe(allListener, pub.ALL_TOPICS)
+    try:
+        assert cache.hasListeners("meshtastic.test_listenercache_other")
+    finally:
+        pub.unsubscribe(allListener, pub.ALL_TOPICS)
+    assert not cache.hasListeners("meshtastic.test_listenercache_other")
+
+
+@pytest.mark.unit
+def test_DeferredExecution_workers():
+    """Work with the same key runs in order, a blocked key doesn't hold up the others"""
+    executor = DeferredExecution("test", workers=4)
+    assert len(executor.threads) == 4
+    blocked = threading.Event()
+    done = threading.Event()
+    results: Dict[str, List[int]] = {"a": [], "b": []}
+    # find a key that doesn't share a worker with "a"
+    keyB = next(k for k in range(100) if hash(k) % 4 != hash("a") % 4)
+    executor.queueWork(blocked.wait, key="a")
+    for i in range(100):
+        executor.queueWork(lambda i=i: results["a"].append(i), key="a")
+        executor.queueWork(lambda i=i: results["b"].append(i), key=keyB)
+    executor.queueWork(done.set, key=keyB)
+    assert done.wait(5)
+    assert results["b"] == list(range(100))
+    assert not results["a"]
+    blocked.set()
+    finished = threading.Event()
+    executor.queueWork(finished.set, key="a")
+    assert finished.wait(5)
+    assert results["a"] == list(range(100))
+
+
+def _stalledExecutor(maxsize, overflow):
+    """A DeferredExecution whose worker is busy until the returned event is set"""
+    executor = DeferredExecution("test", maxsize=maxsize, overflow=overflow)
+    started = threading.Event()
+    release = threading.Event()
+    executor.queueWork(lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    return executor, release
+
+
+def _drain(executor):
+    deadline = time.monotonic() + 5
+    while executor.stats()["depth"] and time.monotonic() < deadline:
+        time.sleep(0.01)  # so our marker doesn't overflow the queue itself
+    finished = threading.Event()
+    executor.queueWork(finished.set)
+    assert finished.wait(5)
+
+
+@pytest.mark.unit
+def test_DeferredExecution_drop_oldest():
+    """A full queue drops the oldest work"""
+    executor, release = _stalledExecutor(3, DeferredExecution.DROP_OLDEST)
+    results: List[int] = []
+    for i in range(5):
+        executor.queueWork(lambda i=i: results.append(i))
+    assert executor.stats() == {"depth": 3, "dropped": 2, "coalesced": 0}
+    release.set()
+    _drain(executor)
+    assert results == [2, 3, 4]
+
+
+@pytest.mark.unit
+def test_DeferredExecution_drop_low_priority():
+    """A full queue drops the oldest lowest priority work, or the new work if it is less important"""
+    executor, release = _stalledExecutor(3, DeferredExecution.DROP_LOW_PRIORITY)
+    results: List[str] = []
+    executor.queueWork(lambda: results.append("high"), priority=2)
+    executor.queueWork(lambda: results.append("low1"), priority=0)
+    executor.queueWork(lambda: results.append("low2"), priority=0)
+    executor.queueWork(lambda: results.append("mid"), priority=1)
+    executor.queueWork(lambda: results.append("lowest"), priority=-1)
+    assert executor.stats()["dropped"] == 2
+    release.set()
+    _drain(executor)
+    assert results == ["high", "low2", "mid"]
+
+
+@pytest.mark.unit
+def test_DeferredExecution_coalesce():
+    """Work with the same coalesceKey replaces the queued work, keeping its place"""
+    executor, release = _stalledExecutor(0, DeferredExecution.COALESCE)
+    results: List[str] = []
+    executor.queueWork(lambda: results.append("node1 v1"), coalesceKey=1)
+    executor.queueWork(lambda: results.append("other"))
+    executor.queueWork(lambda: results.append("node1 v2"), coalesceKey=1)
+    executor.queueWork(lambda: results.append("node2"), coalesceKey=2)
+    assert executor.stats() == {"depth": 3, "dropped": 0, "coalesced": 1}
+    release.set()
+    _drain(executor)
+    assert results == ["node1 v2", "other", "node2"]
+    executor.queueWork(lambda: results.append("node1 v3"), coalesceKey=1)
+    _drain(executor)
+    assert results[-1] == "node1 v3"
+
+
+@pytest.mark.unit
+def test_DeferredExecution_block():
+    """A full queue makes the caller wait for space"""
+    executor, release = _stalledExecutor(1, DeferredExecution.BLOCK)
+    executor.queueWork(lambda: None)
+    queued = threading.Event()
+    threading.Thread(target=lambda: (executor.queueWork(lambda: None), queued.set()), daemon=True).start()
+    assert not queued.wait(0.2)
+    release.set()
+    assert queued.wait(5)
+    assert executor.stats()["dropped"] == 0
+
+
+@pytest.mark.unit
+def test_DeferredExecution_bad_overflow():
+    """Unknown overflow policies are refused"""
+    with pytest.raises(ValueError):
+        DeferredExecution(overflow="bogus")
@@ -0,0 +1,305 @@
+"""The queue of packets on their way to the device
+
+The device has a small TX queue of its own and tells us how much room is left
+in it with QueueStatus messages.  MeshInterface hands the packets it sends to
+a TxQueue, which returns right away; a thread of its own (or, for interfaces
+serviced by a StreamReactor, the reactor thread) writes them to the device as
+soon as it reports a free slot.  A packet stays in flight until the
+device confirms it with a QueueStatus for its ID, a QueueStatus with an error
+puts it back at the front of the queue to be sent again.
+
+Packets are queued by their MeshPacket.Priority and the highest priority
+goes first.  Admin messages without a priority of their own are queued in a
+class of ours, ADMIN_PRIORITY, ahead of wantAck traffic, so they don't wait
+behind a burst of sensor readings; their MeshPacket.priority stays unset.  So that a busy high priority class can't starve the others, a
+packet that waited longer than maxWait goes first (the longest waiting one).
+
+    iface.sendText("hello")       # doesn't wait for the device
+    iface.sendData(reading, priority=mesh_pb2.MeshPacket.Priority.BACKGROUND)
+    iface.txQueue.stats()         # {"pending": 0, "inflight": 1, ...}
+    iface.txQueue.depths()        # {"BACKGROUND": 1, ...}
+"""
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+import traceback
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional, Tuple
+
+from meshtastic import mesh_pb2, portnums_pb2
+
+
+ADMIN_PRIORITY = 100
+"""Where our TX queue puts admin messages without a MeshPacket.Priority, ahead of RELIABLE (wantAck)
+traffic.  Only used for ordering our queue, never sent to the device"""
+
+
+class TxError(Exception):
+    """The device kept refusing a packet, queueStatus is its last answer"""
+
+    def __init__(self, message: str, queueStatus: Optional[mesh_pb2.QueueStatus]=None):
+        super().__init__(message)
+        self.queueStatus = queueStatus
+
+
+class _TxEntry(NamedTuple):
+    toRadio: mesh_pb2.ToRadio
+    future: concurrent.futures.Future
+    attempts: int
+    priority: int
+    queuedAt: float  # time.monotonic()
+
+
+def packetPriority(meshPacket: mesh_pb2.MeshPacket) -> int:
+    """The priority a packet is queued with, its MeshPacket.Priority or the device's default if it has none
+
+    Admin messages without one go in ADMIN_PRIORITY."""
+    if meshPacket.priority != mesh_pb2.MeshPacket.Priority.UNSET:
+        return meshPacket.priority
+    if meshPacket.decoded.portnum == portnums_pb2.PortNum.ADMIN_APP:
+        return ADMIN_PRIORITY
+    if meshPacket.want_ack:
+        return mesh_pb2.MeshPacket.Priority.RELIABLE
+    return mesh_pb2.MeshPacket.Priority.DEFAULT
+
+
+def priorityName(priority: int) -> str:
+    """The name of a MeshPacket.Priority, or ADMIN for our ADMIN_PRIORITY"""
+    if priority in mesh_pb2.MeshPacket.Priority.values():
+        return mesh_pb2.MeshPacket.Priority.Name(mesh_pb2.MeshPacket.Priority.ValueType(priority))
+    return "ADMIN" if priority == ADMIN_PRIORITY else str(priority)
+
+
+class TxQueue:
+    """Packets waiting for room in the device's TX queue, and the ones it didn't confirm yet
+
+    Enqueueing, confirming and failing a packet take constant time (picking
+    the next one looks at each priority class once).  Until the device
+    reports its queue status (old firmware never does) packets are sent as
+    they come and not tracked.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[mesh_pb2.ToRadio], None],
+        maxAttempts: int=5,
+        maxWait: float=30.0,
+        name: str="meshtastic tx",
+        schedule: Optional[Callable[[Callable[[], None]], Any]]=None,
+    ):
+        """Constructor
+
+        Arguments:
+            send -- Writes a ToRadio to the device, called on our sending thread.
+
+        Keyword Arguments:
+            maxAttempts -- How often to send a packet the device refuses before failing
+                           its future with a TxError. (default: {5})
+            maxWait -- Seconds after which a packet goes before higher priority ones.
+                       (default: {30.0})
+            schedule -- Runs a callable on some other thread soon, i.e. StreamReactor.callSoon.
+                        If given we send from there instead of starting a thread,
+                        send must not block then. (default: {None})
+        """
+        self._send = send
+        self.maxAttempts = maxAttempts
+        self.maxWait = maxWait
+        self.name = name
+        self.free: Optional[int] = None
+        """Free slots in the device's TX queue, None until it told us"""
+        self.sent = 0
+        """How many packets we wrote, including resends"""
+        self.resent = 0
+        self._pending: Dict[int, Deque[_TxEntry]] = {}  # by priority, the queues are kept when they empty
+        self._pendingCount = 0
+        self._inflight: Dict[int, _TxEntry] = {}  # by packet ID, in the order they were sent
+        self._sending = 0  # taken from _pending, not written yet
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._schedule = schedule
+        self._pumpScheduled = False
+
+    def enqueue(self, toRadio: mesh_pb2.ToRadio) -> concurrent.futures.Future:
+        """Queue a ToRadio holding a packet, returns a future resolved once the device accepted it
+
+        The result is the device's QueueStatus for the packet (None for devices
+        that don't send those)."""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                future.set_exception(TxError("The TX queue is closed"))
+                return future
+            priority = packetPriority(toRadio.packet)
+            self._queue(priority).append(_TxEntry(toRadio, future, 0, priority, time.monotonic()))
+            self._pendingCount += 1
+            self._wakeSender()
+        return future
+
+    def onQueueStatus(self, queueStatus: mesh_pb2.QueueStatus) -> None:
+        """Take in a QueueStatus from the device"""
+        packetId = queueStatus.mesh_packet_id
+        with self._cond:  # futures are resolved with the (reentrant) lock held, so only once
+            self.free = queueStatus.free
+            entry = self._inflight.pop(packetId, None)
+            if entry is None:
+                if packetId != 0:
+                    logging.debug(f"Reply for unexpected packet ID {packetId:08x}")
+            elif not queueStatus.res:
+                _resolve(entry.future, queueStatus)
+            elif entry.attempts >= self.maxAttempts:
+                _fail(entry.future, TxError(f"The device refused packet ID {packetId:08x} {entry.attempts} times", queueStatus))
+            else:
+                logging.debug(f"Device refused packet ID {packetId:08x} ({queueStatus.res}), resending")
+                self._queue(entry.priority).appendleft(entry)
+                self._pendingCount += 1
+                self.resent += 1
+            self._wakeSender()
+
+    def resendUnconfirmed(self) -> None:
+        """Send the packets the device didn't confirm again, before anything else"""
+        with self._cond:
+            if not self._inflight:
+                return
+            for entry in reversed(list(self._inflight.values())):
+                self._queue(entry.priority).appendleft(entry)
+            self._pendingCount += len(self._inflight)
+            self.resent += len(self._inflight)
+            self._inflight.clear()
+            self._wakeSender()
+
+    def flush(self, timeout: Optional[float]=None) -> bool:
+        """Wait until all queued packets were written to the device, returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pendingCount and not self._sending, timeout)
+
+    def close(self) -> None:
+        """Stop sending, packets not accepted by the device yet fail with a TxError"""
+        with self._cond:
+            self._closed = True
+            entries = [entry for queue in self._pending.values() for entry in queue] + list(self._inflight.values())
+            self._pending.clear()
+            self._pendingCount = 0
+            self._inflight.clear()
+            self._cond.notify_all()
+            for entry in entries:
+                _fail(entry.future, TxError("The TX queue was closed"))
+
+    def stats(self) -> Dict[str, int]:
+        """How many packets wait to be sent and wait for the device's confirmation, and how many we (re)sent"""
+        return {"pending": self._pendingCount, "inflight": len(self._inflight), "sent": self.sent, "resent": self.resent}
+
+    def depths(self) -> Dict[str, int]:
+        """How many packets wait to be sent, by the name of their priority, see priorityName()"""
+        with self._cond:
+            return {
+                priorityName(priority): len(queue)
+                for priority, queue in sorted(self._pending.items(), reverse=True)
+                if queue
+            }
+
+    def __len__(self) -> int:
+        return self._pendingCount + len(self._inflight)
+
+    def _queue(self, priority: int) -> Deque[_TxEntry]:
+        queue = self._pending.get(priority)
+        if queue is None:
+            queue = self._pending[priority] = collections.deque()
+        return queue
+
+    def _popNext(self) -> _TxEntry:
+        """Take the packet to send next, called with the lock held and packets pending
+
+        The first one of the highest priority, unless packets waited longer
+        than maxWait, then the one that waited longest."""
+        highestPriority = -1
+        highest: Optional[Deque[_TxEntry]] = None
+        oldestAt = time.monotonic() - self.maxWait  # only starved packets compete for oldest
+        oldest: Optional[Deque[_TxEntry]] = None
+        for priority, queue in self._pending.items():
+            if not queue:
+                continue
+            if priority > highestPriority:
+                highestPriority, highest = priority, queue
+            if queue[0].queuedAt < oldestAt:
+                oldestAt, oldest = queue[0].queuedAt, queue
+        nextQueue = oldest if oldest is not None else highest
+        assert nextQueue is not None
+        self._pendingCount -= 1
+        return nextQueue.popleft()
+
+    def _canSend(self) -> bool:
+        """Do packets wait and does the device have room, called with the lock held"""
+        return bool(self._pendingCount) and (self.free is None or self.free > 0)
+
+    def _wakeSender(self) -> None:
+        """Get our thread or scheduled pump to send what it can, called with the lock held"""
+        self._cond.notify_all()
+        if self._schedule is None:
+            if self._thread is None and self._pendingCount:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        elif not self._pumpScheduled and self._canSend():
+            self._pumpScheduled = True
+            self._schedule(self._pump)
+
+    def _take(self) -> Tuple[_TxEntry, bool]:
+        """Take the next packet to write, and whether the device will confirm it, called with the lock held"""
+        entry = self._popNext()
+        entry = entry._replace(attempts=entry.attempts + 1)
+        tracked = self.free is not None
+        if tracked:
+            self.free -= 1  # type: ignore[operator]
+            self._inflight[entry.toRadio.packet.id] = entry
+        self._sending += 1
+        return entry, tracked
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._canSend())
+                if self._closed:
+                    return
+                entry, tracked = self._take()
+            self._write(entry, tracked)
+
+    def _pump(self) -> None:
+        """Write what the device has room for, run by our scheduler"""
+        while True:
+            with self._cond:
+                if self._closed or not self._canSend():
+                    self._pumpScheduled = False
+                    return
+                entry, tracked = self._take()
+            self._write(entry, tracked)
+
+    def _write(self, entry: _TxEntry, tracked: bool) -> None:
+        try:
+            if entry.attempts > 1:
+                logging.debug(f"Resending packet ID {entry.toRadio.packet.id:08x}")
+            self._send(entry.toRadio)
+            self.sent += 1
+            if not tracked:
+                with self._cond:
+                    _resolve(entry.future, None)
+        except Exception as ex:
+            logging.error(f"Could not send packet ID {entry.toRadio.packet.id:08x}: {ex}")
+            traceback.print_exc()
+            with self._cond:
+                self._inflight.pop(entry.toRadio.packet.id, None)
+                _fail(entry.future, ex)
+        finally:
+            with self._cond:
+                self._sending -= 1
+                self._cond.notify_all()
+
+
+def _resolve(future: concurrent.futures.Future, result) -> None:
+    if not future.done():  # it may have been cancelled
+        future.set_result(result)
+
+
+def _fail(future: concurrent.futures.Future, exception: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exception)
@@ -1,6 +1,8 @@
 """Utility functions.
 """
 import base64
+import collections
+import heapq
 import logging
 import os
 import platform
@@ -10,10 +12,10 @@ import sys
 import threading
 import time
 import traceback
-from queue import Queue
-from typing import List, NoReturn, Union
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Tuple, Union
 
 from google.protobuf.json_format import MessageToJson
+from pubsub import pub # type: ignore[import-untyped]
 
 import packaging.version as pkg_version
 import requests
@@ -177,50 +179,37 @@ class Timeout:
         self, acknowledgment, attrs=("receivedAck", "receivedNak", "receivedImplAck")
     ) -> bool:
         """Block until an ACK or NAK has been received. Returns True if ACK or NAK has been received."""
-        self.reset()
-        while time.time() < self.expireTime:
-            if any(map(lambda a: getattr(acknowledgment, a, None), attrs)):
-                acknowledgment.reset()
-                return True
-            time.sleep(self.sleepInterval)
-        return False
+        return self._waitForAcknowledgment(acknowledgment, attrs, self.expireTimeout)
 
     def waitForTraceRoute(self, waitFactor, acknowledgment, attr="receivedTraceRoute") -> bool:
         """Block until traceroute response is received. Returns True if traceroute response has been received."""
         self.expireTimeout *= waitFactor
-        self.reset()
-        while time.time() < self.expireTime:
-            if getattr(acknowledgment, attr, None):
-                acknowledgment.reset()
-                return True
-            time.sleep(self.sleepInterval)
-        return False
+        return self._waitForAcknowledgment(acknowledgment, (attr,), self.expireTimeout)
 
     def waitForTelemetry(self, acknowledgment) -> bool:
         """Block until telemetry response is received. Returns True if telemetry response has been received."""
-        self.reset()
-        while time.time() < self.expireTime:
-            if getattr(acknowledgment, "receivedTelemetry", None):
-                acknowledgment.reset()
-                return True
-            time.sleep(self.sleepInterval)
-        return False
+        return self._waitForAcknowledgment(acknowledgment, ("receivedTelemetry",), self.expireTimeout)
 
     def waitForPosition(self, acknowledgment) -> bool:
         """Block until position response is received. Returns True if position response has been received."""
-        self.reset()
-        while time.time() < self.expireTime:
-            if getattr(acknowledgment, "receivedPosition", None):
-                acknowledgment.reset()
-                return True
-            time.sleep(self.sleepInterval)
+        return self._waitForAcknowledgment(acknowledgment, ("receivedPosition",), self.expireTimeout)
+
+    def _waitForAcknowledgment(self, acknowledgment, attrs, timeout: float) -> bool:
+        """Wait (without polling) for any of attrs to be set, then reset acknowledgment"""
+        self.expireTime = time.time() + timeout
+        if acknowledgment.waitFor(attrs, timeout):
+            acknowledgment.reset()
+            return True
         return False
 
 class Acknowledgment:
     "A class that records which type of acknowledgment was just received, if any."
 
+    _cond: threading.Condition
+
     def __init__(self):
         """initialize"""
+        object.__setattr__(self, "_cond", threading.Condition())
         self.receivedAck = False
         self.receivedNak = False
         self.receivedImplAck = False
@@ -228,6 +217,17 @@ class Acknowledgment:
         self.receivedTelemetry = False
         self.receivedPosition = False
 
+    def __setattr__(self, name, value):
+        # the response handlers set flags on the reader thread, wake up whoever waits for them
+        with self._cond:
+            object.__setattr__(self, name, value)
+            self._cond.notify_all()
+
+    def waitFor(self, attrs, timeout: Optional[float]=None) -> bool:
+        """Block until any of the attrs is set, returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: any(getattr(self, a, None) for a in attrs), timeout)
+
     def reset(self):
         """reset"""
         self.receivedAck = False
@@ -238,23 +238,240 @@ class Acknowledgment:
         self.receivedPosition = False
 
 
-class DeferredExecution:
-    """A thread that accepts closures to run, and runs them as they are received"""
+class ExpiryQueue:
+    """Deadlines of keys (like request IDs), for finding the ones that passed
+
+    A heap with lazy deletion: discarding a key only forgets its deadline,
+    its heap entry is skipped when it comes up (and entries are compacted if
+    too many of them are stale).  Not thread safe, callers lock.
+    """
+
+    COMPACT_SLACK = 64
+    """Stale heap entries we put up with before compacting, on top of one per live key"""
 
-    def __init__(self, name=None):
-        self.queue = Queue()
-        self.thread = threading.Thread(target=self._run, args=(), name=name)
-        self.thread.daemon = True
-        self.thread.start()
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._deadlines: Dict[Any, float] = {}
+        self._seq = 0  # keys needn't be comparable
+
+    def add(self, key, deadline: float) -> None:
+        """Expire key at deadline, replacing the deadline it had"""
+        self._deadlines[key] = deadline
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, key))
+        self._maybeCompact()
+
+    def discard(self, key) -> None:
+        """Forget key, if we have it"""
+        if self._deadlines.pop(key, None) is not None:
+            self._maybeCompact()
+
+    def nextDeadline(self) -> Optional[float]:
+        """The earliest deadline, None if there are none"""
+        self._dropStale()
+        return self._heap[0][0] if self._heap else None
+
+    def popExpired(self, now: float) -> List[Any]:
+        """Remove and return the keys whose deadline is not after now, earliest first"""
+        expired = []
+        self._dropStale()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            expired.append(key)
+            self._dropStale()
+        return expired
+
+    def _dropStale(self) -> None:
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _maybeCompact(self) -> None:
+        """Rebuild the heap without stale entries once they are the majority (and more than a few)"""
+        if len(self._heap) > 2 * len(self._deadlines) + self.COMPACT_SLACK:
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key) -> bool:
+        return key in self._deadlines
+
+
+class Debouncer:
+    """Passes on only the latest value of a key within a delay
+
+    The first update of a key starts a timer, when it runs out the latest
+    value the key got in the meantime is delivered.
+    """
+
+    def __init__(self, startTimer: Callable[[float, Callable], Any], deliver: Callable[[Any, Any], None]) -> None:
+        """Constructor
+
+        Arguments:
+            startTimer -- funct(interval, callback) starting a timer, returns something with a cancel() method
+            deliver -- funct(key, value) called with the latest value of a key
+        """
+        self._startTimer = startTimer
+        self._deliver = deliver
+        self._pending: Dict[Any, Any] = {}  # key -> latest value
+        self._timers: Dict[Any, Any] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key, value, delay: float) -> None:
+        """Deliver value for key in delay seconds, unless another update replaces it before"""
+        with self._lock:
+            first = key not in self._pending
+            self._pending[key] = value
+            if first:
+                self._timers[key] = self._startTimer(delay, lambda: self._flush(key))
+
+    def _flush(self, key) -> None:
+        with self._lock:
+            self._timers.pop(key, None)
+            if key not in self._pending:
+                return  # cancelled
+            value = self._pending.pop(key)
+        self._deliver(key, value)
+
+    def cancel(self) -> None:
+        """Forget the values not delivered yet"""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._pending.clear()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class _WorkQueue:
+    """The queue of one DeferredExecution worker, bounded by the owner's maxsize/overflow policy"""
+
+    def __init__(self, owner: "DeferredExecution"):
+        self.owner = owner
+        self.items: collections.deque = collections.deque()  # of [runnable, priority, coalesceKey]
+        self.pending: Dict[Any, list] = {}  # coalesceKey -> queued item
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def qsize(self) -> int:
+        """How many closures are waiting"""
+        return len(self.items)
+
+    def put(self, runnable: Callable, priority: int=0, coalesceKey: Any=None, mayBlock: bool=True) -> None:
+        """Queue a closure, applying the overflow policy if we're full"""
+        owner = self.owner
+        with self.cond:
+            if coalesceKey is not None and owner.overflow == DeferredExecution.COALESCE:
+                item = self.pending.get(coalesceKey)
+                if item is not None:
+                    item[0] = runnable  # newer news about the same thing, keep our place in line
+                    self.coalesced += 1
+                    return
+            if 0 < owner.maxsize <= len(self.items):
+                if owner.overflow == DeferredExecution.DROP_OLDEST:
+                    self._drop(self.items[0])
+                elif owner.overflow == DeferredExecution.DROP_LOW_PRIORITY:
+                    victim = min(self.items, key=lambda i: i[1])  # the oldest of the lowest priority
+                    if victim[1] > priority:
+                        self.dropped += 1
+                        return
+                    self._drop(victim)
+                elif mayBlock:
+                    self.cond.wait_for(lambda: not 0 < owner.maxsize <= len(self.items))
+            item = [runnable, priority, coalesceKey]
+            self.items.append(item)
+            if coalesceKey is not None:
+                self.pending[coalesceKey] = item
+            self.cond.notify_all()
+
+    def _drop(self, item: list) -> None:
+        if item is self.items[0]:
+            self.items.popleft()
+        else:
+            self.items.remove(item)
+        if item[2] is not None and self.pending.get(item[2]) is item:
+            del self.pending[item[2]]
+        self.dropped += 1
+
+    def get(self) -> Callable:
+        """Wait for the next closure to run"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.items)
+            item = self.items.popleft()
+            coalesceKey = item[2]
+            if coalesceKey is not None and self.pending.get(coalesceKey) is item:
+                del self.pending[coalesceKey]
+            self.cond.notify_all()  # someone might be blocked waiting for space
+            return item[0]
 
-    def queueWork(self, runnable):
-        """Queue up the work"""
-        self.queue.put(runnable)
 
-    def _run(self):
+class DeferredExecution:
+    """Threads that accept closures to run, and run them as they are received
+
+    With more than one worker, work queued with the same key runs in order on
+    one worker, while work with different keys can run in parallel.  Work
+    without a key all goes to the first worker.
+
+    By default the queues are unbounded.  With maxsize > 0 each worker queues
+    at most maxsize closures, and overflow decides what happens when more work
+    comes along:
+
+    - BLOCK: wait for space (closures queued from our own workers never wait)
+    - DROP_OLDEST: drop the oldest queued closure
+    - DROP_LOW_PRIORITY: drop the oldest closure of the lowest priority, or
+      the new one if its priority is lower than everything queued
+    - COALESCE: work queued with a coalesceKey replaces queued work with the
+      same coalesceKey, otherwise like BLOCK
+    """
+
+    BLOCK = "block"
+    DROP_OLDEST = "dropOldest"
+    DROP_LOW_PRIORITY = "priority"
+    COALESCE = "coalesce"
+
+    def __init__(self, name=None, workers: int=1, maxsize: int=0, overflow: str=BLOCK):
+        if overflow not in (self.BLOCK, self.DROP_OLDEST, self.DROP_LOW_PRIORITY, self.COALESCE):
+            raise ValueError(f"Unknown overflow policy {overflow}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queues: List[_WorkQueue] = [_WorkQueue(self) for _ in range(max(1, workers))]
+        self.queue = self.queues[0]
+        self.threads: List[threading.Thread] = []
+        for i, queue in enumerate(self.queues):
+            threadName = name if len(self.queues) == 1 or name is None else f"{name}-{i}"
+            thread = threading.Thread(target=self._run, args=(queue,), name=threadName)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        self.thread = self.threads[0]
+        self._workerIdents = {thread.ident for thread in self.threads}
+
+    def queueWork(self, runnable, key=None, priority: int=0, coalesceKey=None):
+        """Queue up the work, work with the same key is run in the order it was queued
+
+        priority and coalesceKey are only used by the DROP_LOW_PRIORITY and
+        COALESCE overflow policies"""
+        queue = self.queue if key is None else self.queues[hash(key) % len(self.queues)]
+        queue.put(runnable, priority, coalesceKey, threading.get_ident() not in self._workerIdents)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth (over all workers), and how many closures were dropped or coalesced"""
+        return {
+            "depth": sum(q.qsize() for q in self.queues),
+            "dropped": sum(q.dropped for q in self.queues),
+            "coalesced": sum(q.coalesced for q in self.queues),
+        }
+
+    def _run(self, queue):
         while True:
             try:
-                o = self.queue.get()
+                o = queue.get()
                 o()
             except:
                 logging.error(
@@ -263,6 +480,101 @@ class DeferredExecution:
                 print(traceback.format_exc())
 
 
+class ListenerCache:
+    """Answers which pypubsub topics have listeners, on the topic itself, a parent topic or ALL_TOPICS
+
+    Asking pypubsub walks the topic tree, which is more than we want to do for
+    every received packet.  So we remember the answer for each topic, and
+    forget all of them when a listener is subscribed, unsubscribed or garbage
+    collected.  pypubsub tells us about those through a notification handler,
+    registered the first time we're asked.  That turns on pypubsub's
+    subscribe, unsubscribe and deadListener notifications, other notification
+    handlers get those too.  Turning them off again (or clearing the
+    notification handlers) leaves us with answers that may be out of date."""
+
+    def __init__(self):
+        self._answers: Dict[str, bool] = {}
+        self._version = 0  # bumped whenever the answers are forgotten
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def hasListeners(self, topic: str) -> bool:
+        """Does sending a message on topic reach any listener"""
+        answer = self._answers.get(topic)
+        if answer is None:
+            if not self._registered:
+                self._register()
+            version = self._version
+            answer = self._ask(topic)
+            with self._lock:
+                if version == self._version:  # not if a subscription came in while we asked
+                    self._answers[topic] = answer
+        return answer
+
+    def forget(self) -> None:
+        """Forget all answers, the listeners changed"""
+        with self._lock:
+            self._version += 1
+            self._answers = {}
+
+    def _register(self) -> None:
+        with self._lock:
+            if self._registered:
+                return
+            pub.addNotificationHandler(_ListenerChanges(self))
+            flags: Dict[str, Any] = {"subscribe": True, "unsubscribe": True, "deadListener": True}
+            pub.setNotificationFlags(**flags)  # pypubsub's annotation of its keyword arguments is off
+            self._registered = True
+
+    @staticmethod
+    def _ask(topic: str) -> bool:
+        """Ask pypubsub about topic, its parent topics (i.e. a.b.c, a.b and a) and ALL_TOPICS"""
+        topicMgr: Any = pub.getDefaultTopicMgr()  # mypy can't make out pypubsub's Topic methods
+        if topicMgr.getRootAllTopics().hasListeners():
+            return True
+        parts = topic.split(".")
+        for i in range(len(parts), 0, -1):
+            topicObj = topicMgr.getTopic(".".join(parts[:i]), okIfNone=True)
+            if topicObj is not None and topicObj.hasListeners():
+                return True
+        return False
+
+
+class _ListenerChanges(pub.INotificationHandler):
+    """A pypubsub notification handler making a ListenerCache forget its answers when listeners change
+
+    pypubsub calls every method of its handlers whose notifications are
+    turned on, so we have them all."""
+
+    def __init__(self, cache: ListenerCache):
+        self._cache = cache
+
+    def notifySubscribe(self, pubListener, topicObj, newSub) -> None:  # pylint: disable=W0613
+        """A listener was subscribed"""
+        self._cache.forget()
+
+    def notifyUnsubscribe(self, pubListener, topicObj) -> None:  # pylint: disable=W0613
+        """A listener was unsubscribed"""
+        self._cache.forget()
+
+    def notifyDeadListener(self, pubListener, topicObj) -> None:  # pylint: disable=W0613
+        """A listener was garbage collected"""
+        self._cache.forget()
+
+    def notifySend(self, stage, topicObj, pubListener=None) -> None:
+        """Not our business"""
+
+    def notifyNewTopic(self, topicObj, description, required, argsDocs) -> None:
+        """Not our business, a new topic has no listeners yet"""
+
+    def notifyDelTopic(self, topicName) -> None:
+        """Not our business, the topic's listeners were unsubscribed (and we were told) first"""
+
+
+topicListeners = ListenerCache()
+"""Which pypubsub topics have listeners, shared by all interfaces"""
+
+
 def our_exit(message, return_value=1) -> NoReturn:
     """Print the message and return a value.
     return_value defaults to 1 (non-successful)